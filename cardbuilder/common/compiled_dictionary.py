@@ -0,0 +1,149 @@
+import mmap
+import os
+import shutil
+import struct
+import sys
+from array import array
+from pathlib import Path
+from tempfile import TemporaryFile
+from typing import Iterable, Tuple, Optional, Dict
+
+from cardbuilder.common.util import InDataDir
+from cardbuilder.exceptions import CardBuilderException
+
+
+class CompiledDictionary:
+    """A read-only mapping of words to content, compiled into a single file which is memory-mapped for reading. The file
+    holds an array of key offsets, an array of content offsets, the UTF-8 encoded keys in sorted order and then the
+    UTF-8 encoded content, so a lookup is a binary search over the keys without any parsing or copying of the rest of
+    the file. Because the file is mapped rather than read, processes using the same dictionary share its pages through
+    the OS page cache.
+
+    Dictionaries are written once with write() and never modified; to change one, write it again."""
+
+    extension = '.dict'
+    magic = b'CBDICT01'
+
+    _header = struct.Struct('<8sQQQ')  # magic, entry count, start of the keys, start of the content
+    _offset = struct.Struct('<Q')
+
+    @classmethod
+    def path(cls, name: str) -> Path:
+        """Returns the path of the compiled dictionary with the given name in the data directory."""
+        return InDataDir.directory / (name + cls.extension)
+
+    @classmethod
+    def write(cls, path: Path, items: Iterable[Tuple[str, str]]) -> int:
+        """Compiles a dictionary file. The file is written alongside its destination and then moved into place, so
+        readers never see a partially written dictionary.
+
+        Args:
+            path: where to write the dictionary.
+            items: (key, content) pairs, sorted by key in UTF-8 byte order (which is SQLite's default text ordering),
+            with no duplicate keys.
+
+        Returns: the number of entries written.
+        """
+        key_offsets, content_offsets = array('Q', [0]), array('Q', [0])
+        temp_path = path.with_name(path.name + '.tmp')
+        try:
+            with TemporaryFile() as keys_file, TemporaryFile() as contents_file:
+                prev_key = None
+                for key, content in items:
+                    key = key.encode('utf-8')
+                    if prev_key is not None and key <= prev_key:
+                        raise CardBuilderException('Compiled dictionary keys must be unique and sorted, but "{}" came '
+                                                   'after "{}"'.format(key.decode('utf-8'), prev_key.decode('utf-8')))
+                    prev_key = key
+                    key_offsets.append(key_offsets[-1] + keys_file.write(key))
+                    content_offsets.append(content_offsets[-1] + contents_file.write(content.encode('utf-8')))
+
+                count = len(key_offsets) - 1
+                keys_start = cls._header.size + cls._offset.size * 2 * (count + 1)
+                contents_start = keys_start + key_offsets[-1]
+                if sys.byteorder == 'big':
+                    key_offsets.byteswap()
+                    content_offsets.byteswap()
+
+                with open(temp_path, 'wb') as f:
+                    f.write(cls._header.pack(cls.magic, count, keys_start, contents_start))
+                    f.write(key_offsets.tobytes())
+                    f.write(content_offsets.tobytes())
+                    for blob_file in (keys_file, contents_file):
+                        blob_file.seek(0)
+                        shutil.copyfileobj(blob_file, f)
+
+            os.replace(temp_path, path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+        return count
+
+    def __init__(self, path: Path):
+        """Maps a compiled dictionary into memory.
+
+        Args:
+            path: the dictionary's file, as written by write().
+        """
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < self._header.size:
+            self._mmap.close()
+            raise CardBuilderException('{} is too short to be a compiled dictionary'.format(path))
+        magic, self._count, self._keys_start, self._contents_start = self._header.unpack_from(self._mmap)
+        if magic != self.magic:
+            self._mmap.close()
+            raise CardBuilderException('{} is not a compiled dictionary'.format(path))
+
+        self._key_offsets_start = self._header.size
+        self._content_offsets_start = self._key_offsets_start + self._offset.size * (self._count + 1)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, key: str) -> bool:
+        return self._find(key.encode('utf-8')) is not None
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the content for a key, or None if the dictionary doesn't contain it."""
+        index = self._find(key.encode('utf-8'))
+        if index is None:
+            return None
+
+        start, end = self._bounds(self._content_offsets_start, index)
+        return self._mmap[self._contents_start + start:self._contents_start + end].decode('utf-8')
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Returns the content for each of the keys which the dictionary contains."""
+        results = {}
+        for key in keys:
+            content = self.get(key)
+            if content is not None:
+                results[key] = content
+
+        return results
+
+    def close(self):
+        self._mmap.close()
+
+    def _bounds(self, offsets_start: int, index: int) -> Tuple[int, int]:
+        position = offsets_start + index * self._offset.size
+        return self._offset.unpack_from(self._mmap, position)[0], \
+            self._offset.unpack_from(self._mmap, position + self._offset.size)[0]
+
+    def _find(self, key: bytes) -> Optional[int]:
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            start, end = self._bounds(self._key_offsets_start, middle)
+            candidate = self._mmap[self._keys_start + start:self._keys_start + end]
+            if candidate < key:
+                low = middle + 1
+            elif candidate > key:
+                high = middle
+            else:
+                return middle
+
+        return None
@@ -1,14 +1,11 @@
-import sqlite3
 from typing import Dict
 
-from cardbuilder.common.util import InDataDir, DATABASE_NAME, log
+from cardbuilder.common.database import Database
+from cardbuilder.common.util import log
 
 
 class Config:
-    with InDataDir():
-        conn = sqlite3.connect(DATABASE_NAME)
-
-    conn.execute('''CREATE TABLE IF NOT EXISTS config (
+    Database.connect().execute('''CREATE TABLE IF NOT EXISTS config (
                 key TEXT PRIMARY KEY,
                 value TEXT
             );''')
@@ -18,7 +15,7 @@ class Config:
     @classmethod
     def get_conf(cls, invalidate_cache=False) -> Dict[str, str]:
         if cls._cache is None or invalidate_cache:
-            c = cls.conn.execute('''SELECT * FROM config''')
+            c = Database.connect().execute('''SELECT * FROM config''')
             cls._cache = dict(c.fetchall())
 
         return cls._cache.copy()
@@ -53,8 +50,8 @@ class Config:
     @classmethod
     def clear(cls):
         log(None, 'Purging config')
-        cls.conn.execute('''DELETE FROM config''')
-        cls.conn.commit()
+        Database.connect().execute('''DELETE FROM config''')
+        Database.connect().commit()
         cls._cache = {}
 
     @classmethod
@@ -62,7 +59,7 @@ class Config:
         if cls._cache is None:
             return
 
-        cls.conn.executemany('''INSERT OR REPLACE INTO config VALUES (?, ?)''', cls._cache.items())
-        cls.conn.commit()
+        Database.connect().executemany('''INSERT OR REPLACE INTO config VALUES (?, ?)''', cls._cache.items())
+        Database.connect().commit()
         log(None, 'Saving updated config state to database')
 
@@ -0,0 +1,216 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Tuple, Iterator, List
+from urllib.parse import quote
+
+from cardbuilder.common.util import InDataDir, DATABASE_NAME, log
+from cardbuilder.exceptions import CardBuilderException
+
+
+class Database:
+    """Hands out SQLite connections to Cardbuilder's databases. SQLite connections can't be shared between threads, so
+    each thread gets its own connection, which is reused for the lifetime of the thread. Connections wait on locks held
+    by other processes instead of failing immediately with "database is locked".
+
+    The main database only holds Cardbuilder's config; each data source keeps its data in its own database file, which
+    is attached to a thread's connection the first time that thread asks for it. Writable databases run in WAL mode
+    by default, so readers never block each other or the writer, and databases which have been sealed (because their
+    content will never change) are attached read-only and immutable, so they can be read without any locking."""
+
+    busy_timeout_ms = 30000
+    mmap_size = 1 << 28  # 256MB; this is an upper bound, and only affects how much of a file is mapped at a time
+    extension = '.db'
+    bulk_load_cache_kb = 1 << 16  # 64MB of page cache while bulk loading, which mostly helps build indexes
+
+    _local = threading.local()
+    _lock = threading.Lock()
+    _registered: Dict[str, Tuple[bool, str]] = {}  # database name -> (read only, journal mode)
+
+    @classmethod
+    def path(cls, name: Optional[str] = None) -> Path:
+        """
+
+        Args:
+            name: the name of an attached database, or None for the main database.
+
+        Returns: the path of the database's file.
+        """
+        return InDataDir.directory / (DATABASE_NAME if name is None else name + cls.extension)
+
+    @classmethod
+    def attach(cls, name: str, read_only: bool = False, journal_mode: str = 'WAL'):
+        """Registers a database to be attached under the given name. Threads attach it (or reattach it, if its mode
+        changed) the next time they request a connection for it.
+
+        Args:
+            name: the name of the database, which is both its schema name and the stem of its filename.
+            read_only: whether to attach the database read-only and immutable. Only do this for databases that have been
+            sealed, as immutable databases ignore any content that hasn't been checkpointed out of a write-ahead log.
+            journal_mode: the journal mode to use for a writable database.
+        """
+        with cls._lock:
+            cls._registered[name] = (read_only, journal_mode)
+
+    @classmethod
+    def seal(cls, name: str):
+        """Checkpoints a database's content into its main file and switches it out of WAL mode, then reattaches it as
+        read-only and immutable."""
+        conn = cls.connect(name)
+        conn.commit()
+        conn.execute('PRAGMA {}.wal_checkpoint(TRUNCATE)'.format(name))
+        conn.execute('PRAGMA {}.journal_mode=DELETE'.format(name))
+        cls.attach(name, read_only=True)
+
+    @classmethod
+    @contextmanager
+    def bulk_load(cls, name: str) -> Iterator[sqlite3.Connection]:
+        """Yields a connection for writing a large amount of data into a database in a single transaction, with
+        syncing turned off and the rollback journal kept in memory, which is much faster than writing normally. If the
+        process dies during the load, the database can be left corrupt, so only use this for data that can be loaded
+        again from scratch. The database's previous settings are restored afterwards."""
+        conn = cls.connect(name)
+        conn.commit()
+        journal_mode = conn.execute('PRAGMA {}.journal_mode'.format(name)).fetchone()[0]
+        synchronous = conn.execute('PRAGMA {}.synchronous'.format(name)).fetchone()[0]
+        cache_size = conn.execute('PRAGMA {}.cache_size'.format(name)).fetchone()[0]
+
+        conn.execute('PRAGMA {}.journal_mode=MEMORY'.format(name))
+        conn.execute('PRAGMA {}.synchronous=OFF'.format(name))
+        conn.execute('PRAGMA {}.cache_size={}'.format(name, -cls.bulk_load_cache_kb))
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute('PRAGMA {}.cache_size={}'.format(name, cache_size))
+            conn.execute('PRAGMA {}.synchronous={}'.format(name, synchronous))
+            cls._set_journal_mode(conn, name, journal_mode)
+
+    @classmethod
+    def forget(cls, name: str):
+        """Detaches a database from the calling thread's connection and stops attaching it, so that its file can be
+        deleted."""
+        with cls._lock:
+            cls._registered.pop(name, None)
+
+        attached = getattr(cls._local, 'attached', {})
+        if name in attached:
+            conn = cls.connect()
+            conn.commit()  # the caller's own transaction, which databases can't be detached in the middle of
+            cls._detach(conn, attached, name)
+
+    @classmethod
+    def delete(cls, name: str):
+        """Forgets a database and deletes its file, along with any journal or write-ahead log it has."""
+        cls.forget(name)
+        path = cls.path(name)
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            suffixed_path = path.with_name(path.name + suffix)
+            if suffixed_path.exists():
+                suffixed_path.unlink()
+
+    @classmethod
+    def connect(cls, name: Optional[str] = None) -> sqlite3.Connection:
+        """
+
+        Args:
+            name: the name of a registered database that must be attached to the returned connection.
+
+        Returns: the calling thread's connection, opening it if necessary.
+        """
+        conn = getattr(cls._local, 'conn', None)
+        if conn is None:
+            conn = cls._local.conn = cls._open()
+            cls._local.attached = OrderedDict()
+
+        if name is not None:
+            cls._ensure_attached(conn, cls._local.attached, name)
+
+        return conn
+
+    @classmethod
+    def tables(cls, name: Optional[str] = None) -> List[str]:
+        """
+
+        Args:
+            name: the name of a registered database, or None for the main database.
+
+        Returns: the names of the tables in the database.
+        """
+        return [table_name for table_name, in cls.connect(name).execute(
+            'SELECT name FROM {}.sqlite_master WHERE type=\'table\''.format('main' if name is None else name))]
+
+    @classmethod
+    def close(cls):
+        """Closes the calling thread's connection. It will be reopened as needed."""
+        conn = getattr(cls._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            cls._local.conn = None
+            cls._local.attached = None
+
+    @classmethod
+    def _open(cls) -> sqlite3.Connection:
+        # a URI connection is necessary for URI filenames to work in ATTACH statements
+        conn = sqlite3.connect('file:{}'.format(quote(str(cls.path()))), uri=True)
+        conn.execute('PRAGMA busy_timeout={}'.format(cls.busy_timeout_ms))
+        cls._set_journal_mode(conn, 'main', 'WAL')
+        conn.execute('PRAGMA mmap_size={}'.format(cls.mmap_size))
+
+        return conn
+
+    @classmethod
+    def _ensure_attached(cls, conn: sqlite3.Connection, attached: 'OrderedDict[str, Tuple[bool, str]]', name: str):
+        mode = cls._registered.get(name)
+        if mode is None:
+            raise CardBuilderException('Database {} must be registered with attach() before use'.format(name))
+
+        if attached.get(name) == mode:
+            attached.move_to_end(name)
+            return
+        elif name in attached:
+            cls._detach(conn, attached, name)
+
+        # SQLite has a small limit on attached databases, so make room by detaching the least recently used ones. One
+        # slot is kept free, as VACUUM temporarily attaches a database of its own. Detaching would commit whatever
+        # transaction the connection has open on someone else's behalf, so while there is one, this fails instead
+        attach_limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - 1
+        for candidate in list(attached.keys()):
+            if len(attached) < attach_limit:
+                break
+            try:
+                cls._detach(conn, attached, candidate)
+            except sqlite3.OperationalError:
+                pass  # still in use by an active statement; try the next one
+
+        read_only, journal_mode = mode
+        uri = 'file:{}{}'.format(quote(str(cls.path(name))), '?mode=ro&immutable=1' if read_only else '')
+        conn.execute('ATTACH DATABASE ? AS {}'.format(name), (uri,))
+        if not read_only:
+            cls._set_journal_mode(conn, name, journal_mode)
+        conn.execute('PRAGMA {}.mmap_size={}'.format(name, cls.mmap_size))
+        attached[name] = mode
+
+    @classmethod
+    def _detach(cls, conn: sqlite3.Connection, attached: 'OrderedDict[str, Tuple[bool, str]]', name: str):
+        if conn.in_transaction:
+            raise CardBuilderException('Database {} can\'t be detached while a transaction is open on the same '
+                                       'connection'.format(name))
+        conn.execute('DETACH DATABASE {}'.format(name))
+        del attached[name]
+
+    @classmethod
+    def _set_journal_mode(cls, conn: sqlite3.Connection, name: str, journal_mode: str):
+        current_mode = conn.execute('PRAGMA {}.journal_mode'.format(name)).fetchone()[0]
+        if current_mode.lower() == journal_mode.lower():
+            return
+
+        new_mode = conn.execute('PRAGMA {}.journal_mode={}'.format(name, journal_mode)).fetchone()[0]
+        if new_mode.lower() != journal_mode.lower():
+            log(cls, 'Could not set journal mode {} for database {}; it is using {}'.format(journal_mode, name,
+                                                                                          new_mode))
@@ -1,15 +1,22 @@
+import bz2
+import codecs
+import gzip
+import hashlib
 import logging
 import os
 import re
+import shutil
 import sys
-from io import BytesIO
-from itertools import takewhile, repeat, zip_longest
+import tarfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import takewhile, repeat, zip_longest, islice
 from pathlib import Path
 from typing import Iterable, Optional, Any, List, Callable
 import platform
 
 import requests
 import spacy
+import urllib3
 from pykakasi import kakasi as kakasi_state
 from retry.api import retry_call
 from spacy.cli.download import download as spacy_download
@@ -22,6 +29,11 @@ whitespace_trim = re.compile(r'\n\s+')
 
 DATABASE_NAME = 'cardbuilder.db'
 
+DOWNLOAD_BLOCK_SIZE = 1 << 20
+DOWNLOAD_TIMEOUT = (10, 60)  # seconds to wait for a connection, and then for each read
+DOWNLOAD_TRIES = 3
+MAX_CONCURRENT_DOWNLOADS = 4
+
 
 class Shared:
     logger = logging.getLogger('cardbuilder')
@@ -93,12 +105,13 @@ class InDataDir:
         self.prev_dir = None
 
 
-def retry_with_logging(func: Callable, tries: int, delay: int, fargs=None, fkwargs=None):
-    return retry_call(func, tries=tries, delay=delay, fargs=fargs, fkwargs=fkwargs, logger=Shared.logger)
+def retry_with_logging(func: Callable, tries: int, delay: int, fargs=None, fkwargs=None, exceptions=Exception):
+    return retry_call(func, tries=tries, delay=delay, fargs=fargs, fkwargs=fkwargs, exceptions=exceptions,
+                      logger=Shared.logger)
 
 
 def log(obj: Any, text: str, level: int = logging.INFO):
-    t = obj if type(obj) == type else type(obj)
+    t = obj if isinstance(obj, type) else type(obj)
     logmsg = '{}: {}'.format(t.__name__, text) if obj is not None else text
     Shared.logger.log(level, logmsg)
 
@@ -128,6 +141,15 @@ def fast_linecount(filename) -> int:
     return sum(buf.count(b'\n') for buf in bufgen)
 
 
+def file_hash(filename) -> str:
+    """Returns the hex SHA-256 digest of a file's content, reading it a chunk at a time."""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def is_hiragana(char):
     return ord(char) in range(ord(u'\u3040'), ord(u'\u309f'))
 
@@ -139,32 +161,132 @@ def loading_bar(iterable: Iterable, description: str, total: Optional[int] = Non
         return iterable
 
 
-def download_to_file_with_loading_bar(url: str, filename: str):
-    # https://stackoverflow.com/questions/37573483/progress-bar-while-download-file-over-http-with-requests
-    response = requests.get(url, stream=True)
-    total_size_in_bytes = int(response.headers.get('content-length', 0))
-    block_size = 1024
-    progress_bar = tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True, disable= not Shared.loading_bars_enabled)
-    with open(filename, 'wb') as file:
-        for data in response.iter_content(block_size):
-            progress_bar.update(len(data))
-            file.write(data)
+def lines_with_loading_bar(filename: str, description: str, encoding: str = 'utf-8') -> Iterable[str]:
+    """Yields the lines of a text file, measuring progress by the bytes read so far, so that the file doesn't need to
+    be read once beforehand just to count its lines."""
+    progress_bar = tqdm(total=os.path.getsize(filename), desc=description, unit='B', unit_scale=True,
+                        disable=not Shared.loading_bars_enabled)
+    unreported_bytes = 0
+    with open(filename, 'rb') as f:
+        for line in f:
+            unreported_bytes += len(line)
+            if unreported_bytes >= 1 << 20:
+                progress_bar.update(unreported_bytes)
+                unreported_bytes = 0
+            yield line.decode(encoding)
+
+    progress_bar.update(unreported_bytes)
     progress_bar.close()
 
 
-def download_to_stream_with_loading_bar(url: str) -> BytesIO:
-    response = requests.get(url, stream=True)
-    total_size_in_bytes = int(response.headers.get('content-length', 0))
-    block_size = 1024
-    progress_bar = tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True, disable=not Shared.loading_bars_enabled)
-    stream = BytesIO()
-    for data in response.iter_content(block_size):
-        progress_bar.update(len(data))
-        stream.write(data)
-    progress_bar.close()
-
-    stream.seek(0)
-    return stream
+def _continue_download(url: str, part_filename: str):
+    # downloads whatever is missing from the end of a partial file, asking the server for only that range
+    offset = os.path.getsize(part_filename) if os.path.exists(part_filename) else 0
+    headers = {'Accept-Encoding': 'identity'}  # ranges are of the file itself, not of an encoding of it
+    if offset > 0:
+        headers['Range'] = 'bytes={}-'.format(offset)
+
+    with requests.get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 416 and offset > 0:
+            return  # there's nothing past the end of the partial file, so it's already complete
+        response.raise_for_status()
+        if response.status_code != 206:
+            offset = 0  # the server sent the whole file rather than the range, so start over
+
+        total = int(response.headers.get('content-length', 0)) + offset
+        with open(part_filename, 'ab' if offset > 0 else 'wb') as f, \
+                tqdm.wrapattr(response.raw, 'read', total=total, initial=offset, desc=url.rsplit('/', 1)[-1],
+                              disable=not Shared.loading_bars_enabled) as stream:
+            shutil.copyfileobj(stream, f, DOWNLOAD_BLOCK_SIZE)
+
+
+def download_to_file_with_loading_bar(url: str, filename: str, sha256: Optional[str] = None):
+    """Downloads a file. It's written to a .part file alongside its destination and moved into place once it's
+    complete, so an interrupted download never leaves a partial file where a complete one is expected. Interrupted
+    downloads are resumed from where they stopped, whether they were interrupted in this run or an earlier one.
+
+    Args:
+        url: the URL to download.
+        filename: where to write the file.
+        sha256: the hex SHA-256 digest of the file, if it's known. A download that doesn't match it is discarded.
+    """
+    part_filename = filename + '.part'
+    retry_with_logging(_continue_download, tries=DOWNLOAD_TRIES, delay=1, fargs=[url, part_filename],
+                       exceptions=(requests.ConnectionError, requests.Timeout, urllib3.exceptions.HTTPError))
+    if sha256 is not None and file_hash(part_filename) != sha256.lower():
+        os.remove(part_filename)
+        raise CardBuilderException('Download of {} did not match its expected checksum'.format(url))
+
+    os.replace(part_filename, filename)
+
+
+def download_and_extract_to_file(url: str, filename: str, member: Optional[str] = None,
+                                 source_encoding: Optional[str] = None, sha256: Optional[str] = None):
+    """Downloads a file, decompressing it if its URL ends in .bz2, .gz, .tar.bz2, .tar.gz or .tgz. Compressed files are
+    downloaded (resumably, as by download_to_file_with_loading_bar) and then decompressed a block at a time, so only a
+    block of them is ever held in memory. The result is moved into place once it's complete.
+
+    Args:
+        url: the URL to download.
+        filename: where to write the downloaded (and decompressed) file.
+        member: for tar archives, the name of the archive member to extract. Defaults to filename.
+        source_encoding: if given, the file is converted from this encoding to UTF-8 as it's written.
+        sha256: the hex SHA-256 digest of the file at the URL, if it's known.
+    """
+    if not url.endswith(('.bz2', '.gz', '.tgz')) and source_encoding is None:
+        download_to_file_with_loading_bar(url, filename, sha256)
+        return
+
+    # the download is kept until it's been extracted, so a failed extraction doesn't mean downloading it again
+    download_filename = filename + '.download'
+    if not os.path.exists(download_filename):
+        download_to_file_with_loading_bar(url, download_filename, sha256)
+
+    part_filename = filename + '.part'
+    try:
+        with open(download_filename, 'rb') as download, open(part_filename, 'wb') as f:
+            if url.endswith(('.tar.bz2', '.tar.gz', '.tgz')):
+                archive = tarfile.open(fileobj=download)
+                member = member if member is not None else filename
+                try:
+                    content = archive.extractfile(member)
+                except KeyError:
+                    raise CardBuilderException('{} has no member named {}'.format(url, member))
+            elif url.endswith('.bz2'):
+                content = bz2.BZ2File(download)
+            elif url.endswith('.gz'):
+                content = gzip.GzipFile(fileobj=download)
+            else:
+                content = download
+
+            if source_encoding is not None:
+                reader = codecs.getreader(source_encoding)(content)
+                for text in iter(lambda: reader.read(DOWNLOAD_BLOCK_SIZE), ''):
+                    f.write(text.encode('utf-8'))
+            else:
+                shutil.copyfileobj(content, f, DOWNLOAD_BLOCK_SIZE)
+
+        os.replace(part_filename, filename)
+    finally:
+        if os.path.exists(part_filename):
+            os.remove(part_filename)
+    os.remove(download_filename)
+
+
+def run_downloads(downloads: Iterable[Callable[[], Any]], max_workers: int = MAX_CONCURRENT_DOWNLOADS):
+    """Runs downloads in a pool of threads and waits for them to finish. If one fails, downloads that haven't started
+    yet are cancelled, and the failure is raised once those in progress are done (and so can be resumed later)."""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(download) for download in downloads]
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                for pending in futures:
+                    pending.cancel()
+                break
+
+    for future in futures:
+        if not future.cancelled():
+            future.result()
 
 
 def grouper(n, iterable):
@@ -172,6 +294,16 @@ def grouper(n, iterable):
     return ((x for x in group if x is not None) for group in zip_longest(fillvalue=None, *args))
 
 
+def batched(iterable: Iterable, n: int) -> Iterable[List]:
+    """Splits an iterable into lists of n items (the last of which may be shorter). Unlike grouper, this doesn't pad
+    and filter every batch, or drop None items."""
+    iterator = iter(iterable)
+    batch = list(islice(iterator, n))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, n))
+
+
 def dedup_by(input_list: List, key: Callable) -> List:
     seen_set = set()
     return [x for x in input_list if key(x) not in seen_set and not seen_set.add(key(x))]
@@ -1,14 +1,17 @@
-import sqlite3
+from functools import partial
 from glob import glob
+from os import replace
 from os.path import exists
 from typing import Iterable, Tuple, List, Optional
 
 import requests
 from lxml import html
 
+from cardbuilder.common.database import Database
 from cardbuilder.common.fieldnames import Fieldname
 from cardbuilder.common.languages import ENGLISH
-from cardbuilder.common.util import log, InDataDir, loading_bar, DATABASE_NAME
+from cardbuilder.common.util import log, InDataDir, run_downloads, retry_with_logging, DOWNLOAD_TRIES, \
+    DOWNLOAD_TIMEOUT
 from cardbuilder.input.word import WordForm, Word
 from cardbuilder.input.word_list import WordList
 from cardbuilder.lookup.data_source import ExternalDataDataSource
@@ -26,8 +29,8 @@ class SvlWords(WordList, ExternalDataDataSource):
     is as retrieved - effectively random."""
 
     def _read_and_convert_data(self) -> Iterable[Tuple[str, str]]:
-        filenames_with_level = sorted(((fname, int(fname.split('.')[0].split('_')[-1:][0])) for fname in glob('svl_*')),
-                                      key=lambda x: x[1])
+        filenames_with_level = sorted(((fname, int(fname.split('.')[0].split('_')[-1:][0]))
+                                       for fname in glob('svl_lvl_*.txt')), key=lambda x: x[1])
         for name, level in filenames_with_level:
             with open(name, 'r', encoding='utf-8') as f:
                 words = [x.strip() for x in f.readlines()]
@@ -45,34 +48,41 @@ class SvlWords(WordList, ExternalDataDataSource):
         download_targets = [(filename, index) for filename, index in files_with_index if not exists(filename)]
         if len(download_targets) > 0:
             log(self, 'Some SVL files not found - downloading...')
-            for filename, index in loading_bar(download_targets, 'downloading svl files'):
-                if not exists(filename):
-                    numstring = '0{}'.format(index) if index < 10 else str(index)
-                    url = 'http://web.archive.org/web/20081219085635/http://www.alc.co.jp/goi/svl_l{}_list.htm'.format(
-                        numstring)
-                    page = requests.get(url)
-                    tree = html.fromstring(page.content)
-                    containing_element = next(x for x in tree.xpath('//font') if len(x) > 900)
-                    entries = {x.tail.strip() for x in containing_element if x.tag == 'br'}
-                    if containing_element.text is not None:
-                        entries.add(containing_element.text.strip())
-                    assert (len(entries) == 1000)
-                    with open(filename, 'w+', encoding='utf-8') as f:
-                        f.writelines(x + '\n' for x in entries)
+            run_downloads(partial(self._download_level, filename, index) for filename, index in download_targets)
+
+    @staticmethod
+    def _download_level(filename: str, index: int):
+        numstring = '0{}'.format(index) if index < 10 else str(index)
+        url = 'http://web.archive.org/web/20081219085635/http://www.alc.co.jp/goi/svl_l{}_list.htm'.format(numstring)
+        page = retry_with_logging(requests.get, tries=DOWNLOAD_TRIES, delay=1, fargs=[url],
+                                  fkwargs={'timeout': DOWNLOAD_TIMEOUT},
+                                  exceptions=(requests.ConnectionError, requests.Timeout))
+        page.raise_for_status()
+        tree = html.fromstring(page.content)
+        containing_element = next(x for x in tree.xpath('//font') if len(x) > 900)
+        entries = {x.tail.strip() for x in containing_element if x.tag == 'br'}
+        if containing_element.text is not None:
+            entries.add(containing_element.text.strip())
+        assert (len(entries) == 1000)
+        # written alongside and moved into place, so a half written level is never mistaken for a downloaded one
+        with open(filename + '.part', 'w+', encoding='utf-8') as f:
+            f.writelines(x + '\n' for x in entries)
+        replace(filename + '.part', filename)
 
     def __init__(self, order_by_wordfreq: bool = True, additional_forms: Optional[List[WordForm]] = None):
+        self._attach_database()
         with InDataDir():
-            self.conn = sqlite3.connect(DATABASE_NAME)
-
-            self.default_table = type(self).__name__.lower()
+            self.default_table = self._table_name(type(self).__name__.lower())
             self.conn.execute('''CREATE TABLE IF NOT EXISTS {}(
                 word TEXT PRIMARY KEY,
                 content INT
             );'''.format(self.default_table))
             self.conn.commit()
+            self._migrate_legacy_tables()
 
             self._fetch_remote_files_if_necessary()
             self._load_data_into_database()
+        Database.seal(self.get_database_name())
 
         c = self.conn.execute('SELECT word, content from {}'.format(self.default_table))
 
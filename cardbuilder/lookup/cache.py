@@ -0,0 +1,377 @@
+import asyncio
+import atexit
+import functools
+import re
+import sys
+import threading
+import weakref
+import zlib
+from collections import OrderedDict, Counter
+from copy import copy
+from time import monotonic
+from typing import Callable, List, Tuple, Optional, Any, Hashable, Dict, Iterable
+
+from cardbuilder.common.database import Database
+from cardbuilder.exceptions import WordLookupException
+from cardbuilder.input.word import Word
+from cardbuilder.lookup.lookup_data import LookupData
+from cardbuilder.lookup.value import Value, LinksValue
+
+
+class WriteBehindBuffer:
+    """Buffers rows on their way to a database table so they can be written in a single transaction. Buffered rows are
+    flushed once there are max_rows of them, once max_delay seconds have passed since the oldest of them was added,
+    and when the interpreter exits. Rows are keyed so that buffered content can be read before it has been written.
+
+    A buffer that's garbage collected before the interpreter exits drops its rows rather than flushing them from
+    whichever thread collected it, so owners that are discarded early should call flush() first."""
+
+    def __init__(self, write_rows: Callable[[List[Tuple]], None], max_rows: int = 100, max_delay: float = 5.0):
+        """
+
+        Args:
+            write_rows: writes a list of rows to the database and commits them.
+            max_rows: the number of buffered rows that triggers a flush.
+            max_delay: the maximum number of seconds a row can spend in the buffer before it is flushed.
+        """
+        self._write_rows = write_rows
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+
+        self._rows = OrderedDict()
+        self._oldest_row_time = None
+        self._lock = threading.RLock()
+        self._timer = None
+
+        # don't let the exit hook keep the buffer (and whatever owns write_rows) alive
+        self_ref = weakref.ref(self)
+        atexit.register(lambda: self_ref() is not None and self_ref().flush())
+
+    def add(self, key: Hashable, row: Tuple):
+        with self._lock:
+            self._rows[key] = row
+            self._rows.move_to_end(key)
+            if self._oldest_row_time is None:
+                self._oldest_row_time = monotonic()
+                self._schedule_flush()
+
+            if len(self._rows) >= self.max_rows or monotonic() - self._oldest_row_time >= self.max_delay:
+                self.flush()
+
+    def get(self, key: Hashable) -> Optional[Tuple]:
+        with self._lock:
+            return self._rows.get(key)
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            self._rows.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            self._rows.clear()
+            self._oldest_row_time = None
+
+    def flush(self):
+        # rows stay readable from the buffer until they've been written, so the lock is held through the write
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if len(self._rows) == 0:
+                return
+
+            self._write_rows(list(self._rows.values()))
+            self._rows.clear()
+            self._oldest_row_time = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key: Any):
+        return key in self._rows
+
+    def _schedule_flush(self):
+        self_ref = weakref.ref(self)
+
+        def timed_flush():
+            buffer = self_ref()
+            try:
+                if buffer is not None:
+                    buffer.flush()
+            finally:
+                # each timer runs on a thread of its own, so whatever connection the flush opened would otherwise be
+                # left open once the thread ends
+                Database.close()
+
+        self._timer = threading.Timer(self.max_delay, timed_flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+
+# splits markup and JSON into runs ending at a structural character, which tend to repeat across documents
+_segment_regex = re.compile(rb'[^<>{}\[\],\n]{0,255}[<>{}\[\],\n]?')
+
+
+def train_compression_dictionary(samples: Iterable[bytes], max_size: int = 32768) -> bytes:
+    """Builds a zlib preset dictionary from samples of the content it will be used to compress. Segments occurring
+    in more than one sample are ranked by how many bytes they appear to account for, and the best of them are packed
+    into the dictionary with the most valuable last, where deflate can refer to them most cheaply.
+
+    Args:
+        samples: examples of the content to be compressed.
+        max_size: the maximum size of the dictionary; zlib can't make use of more than 32KB.
+    """
+    sample_frequencies = Counter()
+    for sample in samples:
+        sample_frequencies.update({segment for segment in _segment_regex.findall(sample) if len(segment) > 3})
+
+    candidates = sorted(((count * len(segment), segment) for segment, count in sample_frequencies.items()
+                         if count > 1), reverse=True)
+    chosen_segments = []
+    size = 0
+    for _, segment in candidates:
+        if size + len(segment) <= max_size:
+            chosen_segments.append(segment)
+            size += len(segment)
+
+    return b''.join(reversed(chosen_segments))
+
+
+def compress(content: bytes, zdict: Optional[bytes] = None) -> bytes:
+    if not zdict:
+        return zlib.compress(content)
+
+    compressor = zlib.compressobj(zdict=zdict)
+    return compressor.compress(content) + compressor.flush()
+
+
+def decompress(compressed_content: bytes, zdict: Optional[bytes] = None) -> bytes:
+    if not zdict:
+        return zlib.decompress(compressed_content)
+
+    decompressor = zlib.decompressobj(zdict=zdict)
+    return decompressor.decompress(compressed_content) + decompressor.flush()
+
+
+class LookupCache:
+    """A bounded, in-process cache of lookup results, holding both lookup data and the WordLookupExceptions of failed
+    lookups. When either its entry count or its approximate size in bytes exceeds its limit, the least recently used
+    results are evicted."""
+
+    def __init__(self, max_entries: Optional[int] = 4096, max_bytes: Optional[int] = None):
+        """
+
+        Args:
+            max_entries: the maximum number of results to keep, or None for no limit. A limit of 0 disables caching.
+            max_bytes: the maximum approximate size in bytes of the kept results, or None for no limit.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._results = OrderedDict()
+        self._sizes = {}
+        self._total_size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries != 0 and self.max_bytes != 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return self._results[key]
+            else:
+                self.misses += 1
+                return None
+
+    def put(self, key: Hashable, result: Any):
+        if not self.enabled:
+            return
+
+        size = self.approximate_size(result)
+        with self._lock:
+            if key in self._results:
+                self._total_size -= self._sizes[key]
+            self._results[key] = result
+            self._results.move_to_end(key)
+            self._sizes[key] = size
+            self._total_size += size
+
+            while len(self._results) > 0 and \
+                    ((self.max_entries is not None and len(self._results) > self.max_entries) or
+                     (self.max_bytes is not None and self._total_size > self.max_bytes)):
+                evicted_key, _ = self._results.popitem(last=False)
+                self._total_size -= self._sizes.pop(evicted_key)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self._sizes.clear()
+            self._total_size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._results),
+            'bytes': self._total_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+    def __len__(self):
+        return len(self._results)
+
+    @classmethod
+    def approximate_size(cls, result: Any) -> int:
+        """Roughly estimates the memory held by a lookup result from the lengths of the strings it contains."""
+        if isinstance(result, (str, bytes)):
+            return sys.getsizeof(result)
+        elif isinstance(result, BaseException):
+            return 64 + sum(cls.approximate_size(arg) for arg in result.args)
+        elif isinstance(result, (list, tuple)):
+            return 8 * len(result) + sum(cls.approximate_size(item) for item in result)
+        elif isinstance(result, LookupData):
+            return 64 + cls.approximate_size(result.get_retained_raw_content() or '') + \
+                   sum(cls.approximate_size(value) for value in result.get_data().values())
+        elif isinstance(result, LinksValue) and not result.resolved:
+            return 64  # sizing unresolved links shouldn't resolve them
+        elif isinstance(result, Value):
+            return 16 + cls.approximate_size(result.get_data())
+        else:
+            return 16
+
+
+def rebind(result: Any, word: Word) -> Any:
+    """Returns a copy of a cached lookup result that refers to the given word. Cached results are shared by every Word
+    with the same forms, so they're handed out as copies; exceptions are copied too, so that raising them again
+    doesn't pile up tracebacks on the cached one."""
+    if isinstance(result, LookupData):
+        rebound = copy(result)
+        rebound.word = word
+        rebound._data = result.get_data()
+        return rebound
+    elif isinstance(result, WordLookupException):
+        return type(result)(*result.args)
+    else:
+        return result
+
+
+def _is_outermost(data_source, method_name: str, wrapper: Callable) -> bool:
+    # overrides that call super() would otherwise check and fill the cache once per level of the class hierarchy
+    return getattr(type(data_source), method_name) is wrapper
+
+
+def cached_lookup_word(lookup_word: Callable) -> Callable:
+    """Puts a data source's lookup cache in front of its lookup_word or alookup_word method."""
+
+    def cache_key(data_source, word: Word, form: str, following_link: bool, kwargs: Dict[str, Any]) \
+            -> Optional[Tuple[str, bool]]:
+        # lookups with extra, data source specific arguments can return different data for the same form
+        if kwargs or not _is_outermost(data_source, lookup_word.__name__, wrapper) or \
+                not data_source.lookup_cache_enabled():
+            return None
+        return data_source.lookup_cache_key(word, form), following_link
+
+    def from_cache(cached_result: Any, word: Word) -> LookupData:
+        result = rebind(cached_result, word)
+        if isinstance(result, WordLookupException):
+            raise result
+        return result
+
+    if asyncio.iscoroutinefunction(lookup_word):
+        @functools.wraps(lookup_word)
+        async def wrapper(self, word: Word, form: str, following_link: bool = False, **kwargs) -> LookupData:
+            key = cache_key(self, word, form, following_link, kwargs)
+            if key is None:
+                return await lookup_word(self, word, form, following_link=following_link, **kwargs)
+
+            cached_result = self.get_lookup_cache().get(key)
+            if cached_result is not None:
+                return from_cache(cached_result, word)
+
+            try:
+                result = await lookup_word(self, word, form, following_link=following_link)
+            except WordLookupException as ex:
+                self.get_lookup_cache().put(key, rebind(ex, word))
+                raise
+            # the caller gets a result of its own, so changing it doesn't change what later lookups get from the cache
+            self.get_lookup_cache().put(key, rebind(result, word))
+            return result
+    else:
+        @functools.wraps(lookup_word)
+        def wrapper(self, word: Word, form: str, following_link: bool = False, **kwargs) -> LookupData:
+            key = cache_key(self, word, form, following_link, kwargs)
+            if key is None:
+                return lookup_word(self, word, form, following_link=following_link, **kwargs)
+
+            cached_result = self.get_lookup_cache().get(key)
+            if cached_result is not None:
+                return from_cache(cached_result, word)
+
+            try:
+                result = lookup_word(self, word, form, following_link=following_link)
+            except WordLookupException as ex:
+                self.get_lookup_cache().put(key, rebind(ex, word))
+                raise
+            # the caller gets a result of its own, so changing it doesn't change what later lookups get from the cache
+            self.get_lookup_cache().put(key, rebind(result, word))
+            return result
+
+    return wrapper
+
+
+def cached_lookup_words(lookup_words: Callable) -> Callable:
+    """Puts a data source's lookup cache in front of its lookup_words or alookup_words method, so that only the forms
+    missing from the cache are passed on."""
+
+    def split_cached(data_source, word_forms: List[Tuple[Word, str]]) -> Tuple[Dict, Dict, List[Tuple[Word, str]]]:
+        cache = data_source.get_lookup_cache()
+        keys = {word_form: (data_source.lookup_cache_key(*word_form), False) for word_form in word_forms}
+        cached_results = {word_form: cache.get(key) for word_form, key in keys.items()}
+        uncached_word_forms = [word_form for word_form, result in cached_results.items() if result is None]
+        return keys, cached_results, uncached_word_forms
+
+    def merge(data_source, keys: Dict, cached_results: Dict, uncached_results: Dict) -> Dict:
+        cache = data_source.get_lookup_cache()
+        results = {}
+        for word_form, cached_result in cached_results.items():
+            if cached_result is not None:
+                results[word_form] = rebind(cached_result, word_form[0])
+            elif word_form in uncached_results:
+                results[word_form] = uncached_results[word_form]
+                cache.put(keys[word_form], rebind(results[word_form], word_form[0]))
+
+        return results
+
+    if asyncio.iscoroutinefunction(lookup_words):
+        @functools.wraps(lookup_words)
+        async def wrapper(self, word_forms: Iterable[Tuple[Word, str]]) -> Dict:
+            if not _is_outermost(self, lookup_words.__name__, wrapper) or not self.lookup_cache_enabled():
+                return await lookup_words(self, word_forms)
+
+            keys, cached_results, uncached_word_forms = split_cached(self, list(word_forms))
+            uncached_results = await lookup_words(self, uncached_word_forms) if len(uncached_word_forms) > 0 else {}
+            return merge(self, keys, cached_results, uncached_results)
+    else:
+        @functools.wraps(lookup_words)
+        def wrapper(self, word_forms: Iterable[Tuple[Word, str]]) -> Dict:
+            if not _is_outermost(self, lookup_words.__name__, wrapper) or not self.lookup_cache_enabled():
+                return lookup_words(self, word_forms)
+
+            keys, cached_results, uncached_word_forms = split_cached(self, list(word_forms))
+            uncached_results = lookup_words(self, uncached_word_forms) if len(uncached_word_forms) > 0 else {}
+            return merge(self, keys, cached_results, uncached_results)
+
+    return wrapper
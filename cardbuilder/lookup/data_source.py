@@ -1,48 +1,205 @@
+import asyncio
 import sqlite3
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from logging import WARNING
 from os.path import exists
-from typing import Optional, Iterable, Tuple, Callable
+from pathlib import Path
+from typing import Optional, Iterable, Tuple, Callable, Dict, Union, Any, List
 import zlib
+from json import dumps
+from time import time, monotonic
 
+from cardbuilder.common.compiled_dictionary import CompiledDictionary
 from cardbuilder.common.config import Config
-from cardbuilder.common.util import log, grouper, download_to_file_with_loading_bar, DATABASE_NAME, retry_with_logging, \
-    InDataDir
-from cardbuilder.exceptions import WordLookupException
+from cardbuilder.common.database import Database
+from cardbuilder.common.util import log, batched, download_to_file_with_loading_bar, retry_with_logging, InDataDir, \
+    file_hash
+from cardbuilder.exceptions import WordLookupException, CardBuilderException
 from cardbuilder.input.word import Word
+from cardbuilder.lookup.cache import WriteBehindBuffer, LookupCache, cached_lookup_word, cached_lookup_words, \
+    train_compression_dictionary, compress, decompress, rebind
 from cardbuilder.lookup.lookup_data import LookupData
+from cardbuilder.lookup.value import LinksValue
 
 
 class DataSource(ABC):
 
     content_type = 'TEXT'
+    database_name = None  # defaults to the lowercased class name
+    journal_mode = 'WAL'
+    max_query_parameters = 500  # comfortably below SQLite's limit on bound variables per statement
+    # whether the data found for a form can depend on the word being looked up, rather than just on the form
+    parse_depends_on_word = False
+    lookup_cache_entries = 4096  # the default bounds of the in-process lookup cache; see set_lookup_cache
+    lookup_cache_bytes = None
+    default_table_primary_key = True  # data sources that bulk load their table index it afterwards instead
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every lookup method goes through the in-process lookup cache, whichever class implements it
+        for method_name, decorator in (('lookup_word', cached_lookup_word), ('alookup_word', cached_lookup_word),
+                                       ('lookup_words', cached_lookup_words), ('alookup_words', cached_lookup_words)):
+            if method_name in cls.__dict__:
+                setattr(cls, method_name, decorator(cls.__dict__[method_name]))
 
     @abstractmethod
     def lookup_word(self, word: Word, form: str, following_link: bool = False) -> LookupData:
         raise NotImplementedError()
 
+    @cached_lookup_words
+    def lookup_words(self, word_forms: Iterable[Tuple[Word, str]]) \
+            -> Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]:
+        """Looks up many word forms at once. Subclasses that can retrieve content for several forms in a single query
+        should override this; the default implementation just calls lookup_word for each form.
+
+        Args:
+            word_forms: pairs of words and the specific forms of those words to look up.
+
+        Returns: a dictionary mapping each (word, form) pair to either its lookup data or, if the lookup failed, the
+        WordLookupException describing the failure. Failures are returned rather than raised.
+        """
+        # the lookup cache has already been checked for these forms, so skip checking it again for each one
+        lookup_word = getattr(type(self).lookup_word, '__wrapped__', type(self).lookup_word)
+        results = {}
+        for word, form in word_forms:
+            try:
+                results[(word, form)] = lookup_word(self, word, form)
+            except WordLookupException as ex:
+                results[(word, form)] = ex
+
+        return results
+
+    async def alookup_words(self, word_forms: Iterable[Tuple[Word, str]]) \
+            -> Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]:
+        """The asynchronous counterpart of lookup_words. The default implementation simply calls lookup_words, which
+        is appropriate for data sources whose lookups are local."""
+        return self.lookup_words(word_forms)
+
     @abstractmethod
     def parse_word_content(self, word: Word, form: str, content: str, following_link: bool = False) -> LookupData:
         raise NotImplementedError()
 
     def __init__(self):
-        with InDataDir():
-            self.conn = sqlite3.connect(DATABASE_NAME)
-
-        self.default_table = type(self).__name__.lower()
+        self._attach_database()
+        self.default_table = self._table_name(type(self).__name__.lower())
         self.conn.execute('''CREATE TABLE IF NOT EXISTS {}(
-            word TEXT PRIMARY KEY,
+            word TEXT{},
             content {}
-        );'''.format(self.default_table, self.content_type))
+        );'''.format(self.default_table, ' PRIMARY KEY' if self.default_table_primary_key else '', self.content_type))
         self.conn.commit()
+        self._migrate_legacy_tables()
+
+    @classmethod
+    def _is_legacy_table(cls, table_name: str) -> bool:
+        """Whether a table in the main database is one this data source kept its data in before each data source had a
+        database of its own. Back then, its default table was named after its class."""
+        return table_name == cls.__name__.lower()
+
+    @classmethod
+    def legacy_tables(cls) -> List[str]:
+        """Returns the names of this data source's legacy tables that are still in the main database. They're moved out
+        the first time the data source is created."""
+        return [table_name for table_name in Database.tables() if cls._is_legacy_table(table_name)]
+
+    def _legacy_table_destination(self, table_name: str) -> Optional[str]:
+        """Returns the table a legacy table's words and content are copied into, or None if they shouldn't be kept,
+        such as when they're cheaply ingested again anyway."""
+        return self.default_table
+
+    def _convert_legacy_content(self, content: Any) -> Any:
+        """Converts content from a legacy table into the form this data source stores it in now."""
+        return content
+
+    def _migrate_legacy_tables(self):
+        """Moves this data source's legacy tables out of the main database and into its own, so that nothing cached or
+        ingested before each data source had a database of its own is lost. A legacy table's content is committed to
+        its new table before the legacy table is dropped, so an interrupted migration just finishes the next time."""
+        conn = self.conn
+        legacy_tables = self.legacy_tables()
+        for legacy_table in legacy_tables:
+            destination = self._legacy_table_destination(legacy_table)
+            if destination is None:
+                log(self, 'dropping table {} from {}, as its data will be ingested again'.format(legacy_table,
+                                                                                                Database.path()))
+            elif conn.execute('SELECT EXISTS(SELECT 1 FROM {})'.format(destination)).fetchone()[0]:
+                log(self, 'dropping table {} from {}, as {} already has its data'.format(legacy_table, Database.path(),
+                                                                                        destination))
+            else:
+                log(self, 'moving table {} from {} into {}'.format(legacy_table, Database.path(), destination))
+                cursor = conn.execute('SELECT word, content FROM main.{}'.format(legacy_table))
+                conn.executemany('INSERT INTO {} (word, content) VALUES (?, ?)'.format(destination),
+                                 ((word, self._convert_legacy_content(content)) for word, content in cursor))
+                conn.commit()
+
+            conn.execute('DROP TABLE main.{}'.format(legacy_table))
+            conn.commit()
+
+        if legacy_tables:
+            conn.execute('VACUUM main')  # the main database is left with little more than the config
+
+    def get_lookup_cache(self) -> LookupCache:
+        """Returns the in-process cache of this data source's lookup results, which also exposes hit, miss and
+        eviction counts through its stats method."""
+        if getattr(self, '_lookup_cache', None) is None:
+            # created lazily, since some data sources don't call DataSource.__init__
+            self._lookup_cache = LookupCache(self.lookup_cache_entries, self.lookup_cache_bytes)
+        return self._lookup_cache
+
+    def set_lookup_cache(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        """Replaces the in-process lookup cache with an empty one with the given bounds. A bound of None means no
+        limit, and a bound of 0 disables the cache."""
+        self._lookup_cache = LookupCache(max_entries, max_bytes)
+
+    def lookup_cache_enabled(self) -> bool:
+        return self.get_lookup_cache().enabled
+
+    def lookup_cache_key(self, word: Word, form: str) -> str:
+        """Returns the key that lookup results for a form are cached under, which takes the word's other forms into
+        account when parse_depends_on_word is set."""
+        if not self.parse_depends_on_word:
+            return form
+
+        return dumps([form, list(word), sorted(additional_form.name for additional_form in word.additional_forms)],
+                     ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def get_database_name(cls) -> str:
+        """Returns the name of the database this data source keeps its tables in, which is also the stem of the
+        database's filename in the data directory."""
+        return cls.database_name if cls.database_name is not None else cls.__name__.lower()
 
-    def __del__(self):
-        self.conn.close()
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The calling thread's database connection, with this data source's database attached."""
+        return Database.connect(self.get_database_name())
+
+    def _attach_database(self):
+        Database.attach(self.get_database_name(), journal_mode=self.journal_mode)
+
+    def _table_name(self, name: str) -> str:
+        return '{}.{}'.format(self.get_database_name(), name)
 
     def get_table_rowcount(self, table_name: str = None):
         table_name = self.default_table if table_name is None else table_name
         c = self.conn.execute('SELECT COUNT(*) FROM {}'.format(table_name))
         return c.fetchone()[0]
 
+    def _select_contents(self, forms: Iterable[str], table_name: str = None) -> Dict[str, Any]:
+        return {form: row[0] for form, row in self._select_rows(forms, ('content',), table_name).items()}
+
+    def _select_rows(self, forms: Iterable[str], columns: Iterable[str], table_name: str = None) \
+            -> Dict[str, Tuple]:
+        table_name = self.default_table if table_name is None else table_name
+        columns = ', '.join(columns)
+        results = {}
+        for batch in batched(forms, self.max_query_parameters):
+            cursor = self.conn.execute('SELECT word, {} FROM {} WHERE word IN ({})'.format(
+                columns, table_name, ','.join('?' * len(batch))), batch)
+            results.update((row[0], row[1:]) for row in cursor)
+
+        return results
+
 
 class AggregatingDataSource(DataSource, ABC):
     """The base class for data sources that own other data sources and don't have a sqlite table of their own."""
@@ -52,18 +209,27 @@ class AggregatingDataSource(DataSource, ABC):
     def __init__(self):
         pass
 
-    def __del__(self):
-        pass
-
     def get_table_rowcount(self, table_name: str = None):
         raise NotImplementedError()
 
+    def get_owned_data_sources(self) -> List[DataSource]:
+        """Returns the data sources this one owns and aggregates the data of, in the order they were created."""
+        return [value for value in vars(self).values() if isinstance(value, DataSource)]
+
     def parse_word_content(self, word: Word, form: str, content: str, following_link: bool = False) -> LookupData:
         raise NotImplementedError()
 
 
 class WebApiDataSource(DataSource, ABC):
     content_type = 'BLOB'
+    max_concurrency = 8  # the maximum number of concurrent API queries made by asynchronous lookups
+    max_requests_per_second = None  # the rate asynchronous lookups start API queries at; None means no limit
+    cache_flush_rows = 100  # buffered cache writes are flushed once this many have accumulated...
+    cache_flush_seconds = 5.0  # ...or once the oldest of them has been buffered for this long
+    negative_cache_ttl = 60 * 60 * 24 * 30  # seconds a cached miss is trusted for; None never expires, 0 disables
+    cache_parsed_data = True  # whether to also cache parsed lookup data, so that cache hits skip parse_word_content
+    # cached responses are compressed with a dictionary trained on this many of them, once there are that many
+    compression_dictionary_samples = 200
 
     @abstractmethod
     def _query_api(self, form: str) -> str:
@@ -73,6 +239,11 @@ class WebApiDataSource(DataSource, ABC):
     def _api_version() -> int:
         return 0
 
+    @staticmethod
+    def _parser_version() -> int:
+        """Like _api_version, but only invalidates cached parsed data; raw responses are kept and parsed again."""
+        return 0
+
     def __init__(self, enable_cache_retrieval=True):
         """
 
@@ -81,6 +252,21 @@ class WebApiDataSource(DataSource, ABC):
             SQLite cache.
         """
         super().__init__()
+        self._add_cache_columns(self.conn)
+        self.parsed_table = self._table_name(type(self).__name__.lower() + '_parsed')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS {}(
+            word TEXT PRIMARY KEY,
+            api_version INTEGER,
+            parser_version INTEGER,
+            content BLOB
+        );'''.format(self.parsed_table))
+        self._create_compression_dictionaries_table(self.conn)
+        self.conn.commit()
+
+        self._cache_buffer = WriteBehindBuffer(self._write_cache_rows, self.cache_flush_rows,
+                                               self.cache_flush_seconds)
+        self._parsed_cache_buffer = WriteBehindBuffer(self._write_parsed_cache_rows, self.cache_flush_rows,
+                                                      self.cache_flush_seconds)
         version_key = type(self).__name__+'_api_version'
 
         try:
@@ -89,12 +275,20 @@ class WebApiDataSource(DataSource, ABC):
                 log(self, 'API version appears to have changed - was {}, is now {}. '
                           'Clearing cache and updating version...'.format(prev_api_version, self._api_version()))
                 self.conn.execute('DELETE FROM {}'.format(self.default_table))
+                self.conn.execute('DELETE FROM {}'.format(self.parsed_table))
                 self.conn.commit()
                 Config.set(version_key, str(self._api_version()))
         except KeyError:
             log(self, 'Found no API version, setting it to {}'.format(self._api_version()))
             Config.set(version_key, str(self._api_version()))
 
+        self._compression_dictionaries = self._load_compression_dictionaries(self.conn)
+        self._compression_dictionary_id = max(self._compression_dictionaries, default=None)
+        if self._compression_dictionary_id is None and \
+                self.get_table_rowcount() >= self.compression_dictionary_samples:
+            self._compression_dictionary_id = self.train_compression_dictionary()
+            self._compression_dictionaries = self._load_compression_dictionaries(self.conn)
+
         self.enable_cache_retrieval = enable_cache_retrieval
         if self.enable_cache_retrieval:
             log(self, 'Found {} cached entries'.format(self.get_table_rowcount()))
@@ -104,54 +298,722 @@ class WebApiDataSource(DataSource, ABC):
     def set_cache_retrieval(self, value: bool):
         self.enable_cache_retrieval = value
 
+    def lookup_cache_enabled(self) -> bool:
+        return self.enable_cache_retrieval and super().lookup_cache_enabled()
+
+    def set_negative_cache_ttl(self, value: Optional[float]):
+        self.negative_cache_ttl = value
+        self.get_lookup_cache().clear()  # the in-process cache may hold misses the new TTL would expire
+
+    def set_parsed_cache(self, value: bool):
+        self.cache_parsed_data = value
+
+    def flush_cache(self):
+        """Writes any buffered cache entries to the database. This happens automatically, but can be called to make
+        sure the cache is up to date before something else reads the database."""
+        self._cache_buffer.flush()
+        self._parsed_cache_buffer.flush()
+
+    def purge_negative_cache(self) -> int:
+        """Removes all cached misses, so that words which weren't found are queried again next time they're looked up.
+
+        Returns: the number of cached misses removed.
+        """
+        self._cache_buffer.flush()
+        self.get_lookup_cache().clear()
+        return self.delete_negative_cache_entries()
+
+    @classmethod
+    def train_compression_dictionary(cls) -> Optional[int]:
+        """Trains a compression dictionary on a sample of this data source's cached responses and stores it, so that
+        it's used to compress responses cached from now on.
+
+        Returns: the id of the new dictionary, or None if there wasn't enough cached content to train one.
+        """
+        conn = Database.connect(cls.get_database_name())
+        if not cls._add_cache_columns(conn):
+            return None
+
+        cls._create_compression_dictionaries_table(conn)
+        dictionaries = cls._load_compression_dictionaries(conn)
+        cursor = conn.execute('SELECT content, dict_id FROM {} ORDER BY RANDOM() LIMIT ?'.format(
+            cls._cache_table_name()), (cls.compression_dictionary_samples,))
+        samples = [decompress(content, dictionaries.get(dict_id)) for content, dict_id in cursor]
+
+        zdict = train_compression_dictionary(samples)
+        if len(zdict) == 0:
+            return None
+
+        cursor = conn.execute('INSERT INTO {} (content) VALUES (?)'.format(cls._dictionaries_table_name()), (zdict,))
+        conn.commit()
+        log(cls, 'Trained a {} byte compression dictionary on {} cached entries'.format(len(zdict), len(samples)))
+        return cursor.lastrowid
+
+    @classmethod
+    def recompress_cache(cls) -> Tuple[int, int]:
+        """Trains a new compression dictionary on this data source's cached responses, recompresses every cached
+        response with it and reclaims the space saved. Like delete_negative_cache_entries, this doesn't need an
+        instance. Previous dictionaries are kept, since live instances may still be compressing with them.
+
+        Returns: the total size of the cached responses in bytes before and after recompression.
+        """
+        conn = Database.connect(cls.get_database_name())
+        if not cls._add_cache_columns(conn):
+            return 0, 0
+
+        cls._create_compression_dictionaries_table(conn)
+        size_query = 'SELECT COALESCE(SUM(LENGTH(content)), 0) FROM {}'.format(cls._cache_table_name())
+        size_before = conn.execute(size_query).fetchone()[0]
+
+        dict_id = cls.train_compression_dictionary()
+        if dict_id is None:
+            return size_before, size_before
+
+        dictionaries = cls._load_compression_dictionaries(conn)
+        last_rowid = -1
+        while True:
+            rows = conn.execute('SELECT rowid, content, dict_id FROM {} WHERE rowid > ? ORDER BY rowid LIMIT ?'.format(
+                cls._cache_table_name()), (last_rowid, cls.max_query_parameters)).fetchall()
+            if len(rows) == 0:
+                break
+
+            conn.executemany('UPDATE {} SET content=?, dict_id=? WHERE rowid=?'.format(cls._cache_table_name()),
+                             ((compress(decompress(content, dictionaries.get(row_dict_id)), dictionaries[dict_id]),
+                               dict_id, rowid) for rowid, content, row_dict_id in rows))
+            last_rowid = rows[-1][0]
+
+        conn.commit()
+        conn.execute('VACUUM {}'.format(cls.get_database_name()))
+        return size_before, conn.execute(size_query).fetchone()[0]
+
+    @classmethod
+    def _cache_table_name(cls) -> str:
+        return '{}.{}'.format(cls.get_database_name(), cls.__name__.lower())
+
+    @classmethod
+    def _dictionaries_table_name(cls) -> str:
+        return cls._cache_table_name() + '_dictionaries'
+
+    @classmethod
+    def _create_compression_dictionaries_table(cls, conn: sqlite3.Connection):
+        conn.execute('''CREATE TABLE IF NOT EXISTS {}(
+            dict_id INTEGER PRIMARY KEY,
+            content BLOB
+        );'''.format(cls._dictionaries_table_name()))
+
+    @classmethod
+    def _load_compression_dictionaries(cls, conn: sqlite3.Connection) -> Dict[int, bytes]:
+        return dict(conn.execute('SELECT dict_id, content FROM {}'.format(cls._dictionaries_table_name())))
+
+    @classmethod
+    def delete_negative_cache_entries(cls) -> int:
+        """Removes all cached misses from this data source's database without needing an instance, which some data
+        sources can't create without an API key. Misses still buffered by a live instance aren't affected.
+
+        Returns: the number of cached misses removed.
+        """
+        conn = Database.connect(cls.get_database_name())
+        if not cls._add_cache_columns(conn):
+            return 0
+
+        cursor = conn.execute('DELETE FROM {} WHERE miss_message IS NOT NULL'.format(cls._cache_table_name()))
+        conn.commit()
+        return cursor.rowcount
+
     def lookup_word(self, word: Word, form: str, following_link: bool = False) -> LookupData:
-        cached_content = None
+        cached_entry = None
         if self.enable_cache_retrieval:
-            cached_content = self._query_cached_api_results(form)
+            cached_entry = self._query_cached_api_results(form)
 
-        if cached_content is not None:
-            return self.parse_word_content(word, form, cached_content, following_link=following_link)
+        if cached_entry is not None:
+            return self._parse_cached_content(word, form, *cached_entry, following_link=following_link)
         else:
             content = self._query_api(form)
+            return self._parse_and_cache_content(word, form, content, following_link=following_link)
 
-            # parse it first so we don't save it if we can't parse it
-            parsed_content = self.parse_word_content(word, form, content, following_link=following_link)
-            compressed_content = zlib.compress(content.encode('utf-8'))
+    async def alookup_word(self, word: Word, form: str, following_link: bool = False) -> LookupData:
+        """The asynchronous counterpart of lookup_word. API queries are limited to max_concurrency at a time, while
+        parsing and cache writes happen on the event loop's thread."""
+        cached_entry = None
+        if self.enable_cache_retrieval:
+            cached_entry = self._query_cached_api_results(form)
 
-            # update cache
-            self.conn.execute('INSERT OR REPLACE INTO {} VALUES (?, ?)'.format(self.default_table),
-                              (form, compressed_content))
-            self.conn.commit()
+        if cached_entry is not None:
+            return self._parse_cached_content(word, form, *cached_entry, following_link=following_link)
+        else:
+            content = await self._limited_aquery_api(form)
+            return self._parse_and_cache_content(word, form, content, following_link=following_link)
+
+    def lookup_words(self, word_forms: Iterable[Tuple[Word, str]]) \
+            -> Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]:
+        """Probes the cache for all requested forms in a single query, then queries the API only for forms that
+        weren't cached. Newly retrieved content is written to the cache in a single transaction."""
+        word_forms = list(word_forms)
+        cached_entries = self._query_cached_api_results_for(word_forms)
+        fetched_contents = {}
+        try:
+            for form in self._uncached_forms(word_forms, cached_entries):
+                fetched_contents[form] = self._query_api(form)
+        finally:
+            # whatever we managed to retrieve is worth parsing and caching even if a later request fails
+            results = self._parse_and_cache(word_forms, cached_entries, fetched_contents)
+
+        return results
+
+    async def alookup_words(self, word_forms: Iterable[Tuple[Word, str]]) \
+            -> Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]:
+        """The asynchronous counterpart of lookup_words; uncached forms are queried concurrently, up to
+        max_concurrency at a time."""
+        word_forms = list(word_forms)
+        cached_entries = self._query_cached_api_results_for(word_forms)
+        uncached_forms = self._uncached_forms(word_forms, cached_entries)
+        responses = await asyncio.gather(*(self._limited_aquery_api(form) for form in uncached_forms),
+                                         return_exceptions=True)
+        fetched_contents = {form: response for form, response in zip(uncached_forms, responses)
+                            if not isinstance(response, BaseException)}
+        results = self._parse_and_cache(word_forms, cached_entries, fetched_contents)
+
+        failure = next((response for response in responses if isinstance(response, BaseException)), None)
+        if failure is not None:
+            raise failure
+
+        return results
+
+    def set_max_concurrency(self, value: int):
+        self.max_concurrency = value
+        self._semaphore = None
+        if getattr(self, '_executor', None) is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def set_rate_limit(self, max_requests_per_second: Optional[float]):
+        self.max_requests_per_second = max_requests_per_second
+        self._next_request_time = None
+
+    async def _aquery_api(self, form: str) -> str:
+        """The asynchronous counterpart of _query_api. The default implementation runs _query_api on a worker thread,
+        so subclasses only need to override this if they have a natively asynchronous way of querying their API."""
+        if getattr(self, '_executor', None) is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                thread_name_prefix=type(self).__name__)
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._query_api, form)
+
+    async def _limited_aquery_api(self, form: str) -> str:
+        # semaphores belong to the event loop they're first used in, so make a new one if the loop has changed
+        loop = asyncio.get_running_loop()
+        if getattr(self, '_semaphore', None) is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
 
-            return parsed_content
+        async with self._semaphore:
+            await self._wait_for_rate_limit()
+            return await self._aquery_api(form)
 
-    def _query_cached_api_results(self, form: str) -> Optional[str]:
-        cursor = self.conn.execute('SELECT content FROM {} WHERE word=?'.format(self.default_table), (form,))
-        result = cursor.fetchone()
-        return zlib.decompress(result[0]).decode('utf-8') if result is not None else None
+    async def _wait_for_rate_limit(self):
+        if not self.max_requests_per_second:
+            return
+
+        # queries are spaced evenly, each reserving the next free slot before waiting for it
+        now = monotonic()
+        next_request_time = getattr(self, '_next_request_time', None)
+        request_time = now if next_request_time is None else max(now, next_request_time)
+        self._next_request_time = request_time + 1 / self.max_requests_per_second
+        if request_time > now:
+            await asyncio.sleep(request_time - now)
+
+    def _parse_cached_content(self, word: Word, form: str, content: str, miss_message: Optional[str],
+                              following_link: bool = False, parsed_contents: Dict[str, str] = None) -> LookupData:
+        """Turns cached content into lookup data, preferring previously parsed data when there is some.
+
+        Args:
+            parsed_contents: serialized lookup data already retrieved from the parsed cache, if the caller has
+            queried it in bulk; otherwise the parsed cache is queried for this form alone.
+        """
+        if miss_message is not None and not self.parse_depends_on_word:
+            raise WordLookupException(miss_message)
+
+        if self.cache_parsed_data and not following_link:
+            key = self.lookup_cache_key(word, form)
+            if parsed_contents is not None:
+                serialized = parsed_contents.get(key)
+            else:
+                serialized = self._query_parsed_cache_batch([key]).get(key)
+
+            if serialized is not None:
+                return self.lookup_data_type.deserialize(word, content, serialized)
+
+        return self._parse_into_parsed_cache(word, form, content, following_link=following_link)
+
+    def _parse_into_parsed_cache(self, word: Word, form: str, content: str, following_link: bool = False) \
+            -> LookupData:
+        parsed_content = self.parse_word_content(word, form, content, following_link=following_link)
+        # data parsed while following links can differ from a regular lookup, so it isn't cached. Neither is data with
+        # links, which refer to other lookups rather than holding values of their own; it's parsed on every lookup
+        has_links = any(isinstance(value, LinksValue) for value in parsed_content.get_data().values())
+        if self.cache_parsed_data and not following_link and not has_links:
+            key = self.lookup_cache_key(word, form)
+            self._parsed_cache_buffer.add(key, (key, self._api_version(), self._parser_version(),
+                                                zlib.compress(parsed_content.serialize().encode('utf-8'))))
+
+        return parsed_content
+
+    def _parse_and_cache_content(self, word: Word, form: str, content: str, following_link: bool = False) \
+            -> LookupData:
+        try:
+            parsed_content = self._parse_into_parsed_cache(word, form, content, following_link=following_link)
+        except WordLookupException as ex:
+            self._cache_api_results({form: content}, {form: str(ex)})
+            raise
+
+        self._cache_api_results({form: content})
+        return parsed_content
+
+    def _query_cached_api_results_for(self, word_forms: List[Tuple[Word, str]]) \
+            -> Dict[str, Tuple[str, Optional[str]]]:
+        if self.enable_cache_retrieval:
+            return self._query_cached_api_results_batch({form for _, form in word_forms})
+        else:
+            return {}
+
+    @staticmethod
+    def _uncached_forms(word_forms: List[Tuple[Word, str]], cached_entries: Dict[str, Any]) -> List[str]:
+        return list(dict.fromkeys(form for _, form in word_forms if form not in cached_entries))
+
+    def _parse_and_cache(self, word_forms: List[Tuple[Word, str]],
+                         cached_entries: Dict[str, Tuple[str, Optional[str]]], fetched_contents: Dict[str, str]) \
+            -> Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]:
+        parsed_contents = {}
+        if self.cache_parsed_data:
+            parsed_contents = self._query_parsed_cache_batch(self.lookup_cache_key(word, form)
+                                                             for word, form in word_forms if form in cached_entries)
+
+        results = {}
+        for word, form in word_forms:
+            try:
+                if form in cached_entries:
+                    results[(word, form)] = self._parse_cached_content(word, form, *cached_entries[form],
+                                                                       parsed_contents=parsed_contents)
+                elif form in fetched_contents:
+                    results[(word, form)] = self._parse_into_parsed_cache(word, form, fetched_contents[form])
+            except WordLookupException as ex:
+                results[(word, form)] = ex
+
+        # fetched content is only cached as a miss if none of the words it was fetched for could be found in it
+        found_forms = {form for (_, form), result in results.items() if not isinstance(result, WordLookupException)}
+        miss_messages = {form: str(result) for (_, form), result in results.items()
+                         if form in fetched_contents and form not in found_forms}
+
+        self._cache_api_results(fetched_contents, miss_messages)
+        return results
+
+    def _cache_api_results(self, contents_by_form: Dict[str, str], miss_messages_by_form: Dict[str, str] = None):
+        """Buffers content for writing to the cache, rather than committing it one row at a time, so a cold cache
+        doesn't cost a sync per word. Forms with a miss message are cached as misses, unless negative caching is
+        disabled."""
+        miss_messages_by_form = {} if miss_messages_by_form is None else miss_messages_by_form
+        cached_at = time()
+        for form, content in contents_by_form.items():
+            miss_message = miss_messages_by_form.get(form)
+            if miss_message is not None and self.negative_cache_ttl == 0:
+                continue
+
+            compressed_content = compress(content.encode('utf-8'), self._compression_dictionary())
+            self._cache_buffer.add(form, (form, compressed_content, miss_message, cached_at,
+                                          self._compression_dictionary_id))
+
+    def _write_cache_rows(self, rows: List[Tuple[str, bytes, Optional[str], float, Optional[int]]]):
+        self.conn.executemany('INSERT OR REPLACE INTO {} (word, content, miss_message, cached_at, dict_id) '
+                              'VALUES (?, ?, ?, ?, ?)'.format(self.default_table), rows)
+        self.conn.commit()
+
+    def _write_parsed_cache_rows(self, rows: List[Tuple[str, int, int, bytes]]):
+        self.conn.executemany('INSERT OR REPLACE INTO {} VALUES (?, ?, ?, ?)'.format(self.parsed_table), rows)
+        self.conn.commit()
+
+    def _query_parsed_cache_batch(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Returns serialized lookup data for each key with parsed data from the current API and parser versions."""
+        keys = set(keys)
+        buffered_rows = {key: row for key, row in ((key, self._parsed_cache_buffer.get(key)) for key in keys)
+                         if row is not None}
+        rows = self._select_rows(keys.difference(buffered_rows), ('api_version', 'parser_version', 'content'),
+                                 self.parsed_table)
+        rows.update((key, row[1:]) for key, row in buffered_rows.items())
+
+        return {key: zlib.decompress(content).decode('utf-8') for key, (api_version, parser_version, content)
+                in rows.items() if api_version == self._api_version() and parser_version == self._parser_version()}
+
+    @classmethod
+    def _add_cache_columns(cls, conn: sqlite3.Connection) -> bool:
+        """Brings a cache table created by an earlier version up to date.
+
+        Returns: whether the cache table exists.
+        """
+        # caches created before negative caching and compression dictionaries only have word and content columns
+        database_name, table_name = cls._cache_table_name().split('.')
+        columns = {row[1] for row in conn.execute('PRAGMA {}.table_info({})'.format(database_name, table_name))}
+        if len(columns) == 0:
+            return False
+
+        for column, column_type in (('miss_message', 'TEXT'), ('cached_at', 'REAL'), ('dict_id', 'INTEGER')):
+            if column not in columns:
+                conn.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(cls._cache_table_name(), column, column_type))
+        conn.commit()
+        return True
+
+    def _compression_dictionary(self, dict_id: Optional[int] = None) -> Optional[bytes]:
+        dict_id = self._compression_dictionary_id if dict_id is None else dict_id
+        if dict_id is not None and dict_id not in self._compression_dictionaries:
+            # trained by another process since we loaded the dictionaries
+            self._compression_dictionaries = self._load_compression_dictionaries(self.conn)
+
+        return self._compression_dictionaries.get(dict_id)
+
+    def _cache_entry(self, compressed_content: bytes, miss_message: Optional[str], cached_at: Optional[float],
+                     dict_id: Optional[int]) -> Optional[Tuple[str, Optional[str]]]:
+        if miss_message is not None and self.negative_cache_ttl is not None and \
+                (cached_at is None or time() - cached_at >= self.negative_cache_ttl):
+            return None  # expired misses are treated as if they had never been cached
+
+        content = decompress(compressed_content, self._compression_dictionary(dict_id) if dict_id is not None else None)
+        return content.decode('utf-8'), miss_message
+
+    def _query_cached_api_results(self, form: str) -> Optional[Tuple[str, Optional[str]]]:
+        """Returns the cached content for a form along with its miss message, which is None unless the content was
+        cached as a miss, or None if nothing usable is cached for the form."""
+        row = self._cache_buffer.get(form)
+        if row is None:
+            cursor = self.conn.execute('SELECT word, content, miss_message, cached_at, dict_id FROM {} '
+                                       'WHERE word=?'.format(self.default_table), (form,))
+            row = cursor.fetchone()
+
+        return self._cache_entry(*row[1:]) if row is not None else None
+
+    def _query_cached_api_results_batch(self, forms: Iterable[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        forms = set(forms)
+        buffered_rows = {form: row for form, row in ((form, self._cache_buffer.get(form)) for form in forms)
+                         if row is not None}
+        rows = self._select_rows(forms.difference(buffered_rows), ('content', 'miss_message', 'cached_at', 'dict_id'))
+        rows.update((form, row[1:]) for form, row in buffered_rows.items())
+
+        entries = {form: self._cache_entry(*row) for form, row in rows.items()}
+        return {form: entry for form, entry in entries.items() if entry is not None}
 
 
 class ExternalDataDataSource(DataSource, ABC):
 
     batch_size = 10000
+    # external data is written once and then sealed, so there are no concurrent readers to be concerned about
+    journal_mode = 'DELETE'
+    default_table_primary_key = False
+    # whether to serve lookups from a compiled, memory-mapped copy of the default table instead of querying SQLite
+    use_compiled_dictionary = True
+    _compiled_dictionary = None
+    default_table = None  # set by DataSource.__init__, which sources with several tables of their own may not call
+    manifest_table_name = 'ingestion_manifest'
+    file_sha256 = None  # the hex SHA-256 digest of the file at url, for sources that know it
+    # whether entries link to other entries; if so, _link_targets must be implemented, and where each link leads is
+    # worked out into the link targets table once data has been ingested
+    follows_links = False
+    link_targets_table_name = 'link_targets'
+    link_cache_entries = 65536  # the bound of the in-process memo of followed links; see _follow_link
+    _link_cache = None
 
     @abstractmethod
     def _read_and_convert_data(self) -> Iterable[Tuple[str, str]]:
         raise NotImplementedError()
 
+    @staticmethod
+    def _parser_version() -> int:
+        """The version of the code that reads the external data into tables. Increasing it makes existing installs
+        ingest their data again, so do so whenever a change to _read_and_convert_data changes what it produces."""
+        return 0
+
+    @staticmethod
+    def _schema_version() -> int:
+        """The version of this data source's table definitions. Increasing it makes existing installs drop their tables
+        and create them again before ingesting, so do so whenever a table's columns change."""
+        return 0
+
     def __init__(self):
         super().__init__()
         with InDataDir():
             retry_with_logging(self._fetch_remote_files_if_necessary, tries=2, delay=1)
         self._load_data_into_database()
+        if self.follows_links:
+            self._load_link_targets()
+        Database.seal(self.get_database_name())  # fully ingested, so it can be attached immutable from here on
+        self._compiled_dictionary = self._open_compiled_dictionary()
 
     def lookup_word(self, word: Word, form: str, following_link: bool = False) -> LookupData:
-        cursor = self.conn.execute('SELECT content FROM {} WHERE word=?'.format(self.default_table), (form,))
-        result = cursor.fetchone()
-        if result is None:
+        if self._compiled_dictionary is not None:
+            content = self._compiled_dictionary.get(form)
+        else:
+            cursor = self.conn.execute('SELECT content FROM {} WHERE word=?'.format(self.default_table), (form,))
+            result = cursor.fetchone()
+            content = result[0] if result is not None else None
+        if content is None:
             raise WordLookupException('form "{}" not found in data source table for {}'.format(form,
                                                                                                type(self).__name__))
-        return self.parse_word_content(word, form, result[0], following_link=following_link)
+        return self.parse_word_content(word, form, content, following_link=following_link)
+
+    def lookup_words(self, word_forms: Iterable[Tuple[Word, str]]) \
+            -> Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]:
+        """Retrieves content for all requested forms with batched ``IN`` queries instead of one query per form, or from
+        the compiled dictionary if there is one."""
+        word_forms = list(word_forms)
+        forms = {form for _, form in word_forms}
+        if self._compiled_dictionary is not None:
+            contents = self._compiled_dictionary.get_many(forms)
+        else:
+            contents = self._select_contents(forms)
+        results = {}
+        for word, form in word_forms:
+            if form not in contents:
+                results[(word, form)] = WordLookupException('form "{}" not found in data source table for {}'.format(
+                    form, type(self).__name__))
+                continue
+
+            try:
+                results[(word, form)] = self.parse_word_content(word, form, contents[form])
+            except WordLookupException as ex:
+                results[(word, form)] = ex
+
+        return results
+
+    def _link_targets(self, content: str) -> Iterable[str]:
+        """Returns the forms that an entry's content links to. Must be implemented by data sources that set
+        follows_links."""
+        raise NotImplementedError()
+
+    def _load_link_targets(self):
+        """Works out where every link in the default table leads: to the entry for its target form, whose content is
+        stored alongside the link so that following it takes a single read, or to nothing if there's no such entry, so
+        that a missing target is known to be missing without searching for it."""
+        link_targets_table = self._table_name(self.link_targets_table_name)
+        database_name, unqualified_name = link_targets_table.split('.')
+        # tables created before links stored their targets' content are made again
+        columns = {row[1] for row in self.conn.execute('PRAGMA {}.table_info({})'.format(database_name,
+                                                                                         unqualified_name))}
+        if len(columns) > 0 and 'content' not in columns:
+            self.conn.execute('DROP TABLE {}'.format(link_targets_table))
+            self.conn.execute('DELETE FROM {} WHERE table_name=?'.format(self._table_name(self.manifest_table_name)),
+                              (link_targets_table,))
+        self.conn.execute('CREATE TABLE IF NOT EXISTS {}(target TEXT PRIMARY KEY, word TEXT, content {}) '
+                          'WITHOUT ROWID'.format(link_targets_table, self.content_type))
+        self.conn.commit()
+
+        def read_link_targets() -> Iterable[Tuple[str]]:
+            for content, in self.conn.execute('SELECT content FROM {}'.format(self.default_table)):
+                for target in self._link_targets(content):
+                    yield target,
+
+        input_path = self._input_path()
+        self._load_data_into_database(link_targets_table, read_link_targets,
+                                      'INSERT OR IGNORE INTO {} SELECT link.target, entry.word, entry.content FROM '
+                                      '(SELECT ? AS target) AS link LEFT JOIN {} AS entry ON entry.word=link.target'
+                                      .format(link_targets_table, self.default_table),
+                                      input_file=str(input_path) if input_path is not None else None,
+                                      dependencies=[self.default_table])
+
+    def _follow_link(self, word: Word, target: str) -> LookupData:
+        """Looks up the entry a link leads to, as lookup_word(word, target, following_link=True) would. Where each link
+        leads, including to nothing, is remembered, so popular targets are only found and parsed once.
+
+        Raises: WordLookupException if the link leads nowhere.
+        """
+        if self._link_cache is None:
+            self._link_cache = LookupCache(self.link_cache_entries)
+
+        result = self._link_cache.get(target)
+        if result is None:
+            try:
+                result = self._resolve_link(word, target)
+            except WordLookupException as ex:
+                result = ex
+            self._link_cache.put(target, result)
+
+        result = rebind(result, word)
+        if isinstance(result, WordLookupException):
+            raise result
+        return result
+
+    def _lazy_links(self, word: Word, targets: List[str]) -> LinksValue:
+        """Returns a LinksValue that follows links to the given targets the first time its data is needed. Links that
+        lead nowhere should be left out, which _check_link can find out without following them."""
+        return LinksValue(lambda: [self._follow_link(word, target) for target in targets])
+
+    def _check_link(self, word: Word, target: str):
+        """Raises the WordLookupException that following a link would if the link leads nowhere. Where the link
+        targets table knows where a link leads, the link isn't followed to find out."""
+        if self._link_target_row(target, 'word') is None:
+            self._follow_link(word, target)
+
+    def _link_target_row(self, target: str, columns: str) -> Optional[Tuple]:
+        # the given columns of the link targets table's row for a target, or None if the table doesn't know the target.
+        # raises WordLookupException if the table knows the link leads nowhere
+        if not self.follows_links:
+            return None
+
+        row = self.conn.execute('SELECT word IS NULL, {} FROM {} WHERE target=?'.format(
+            columns, self._table_name(self.link_targets_table_name)), (target,)).fetchone()
+        if row is None:
+            return None  # a link not seen at ingestion, which has to be searched for as usual
+        elif row[0]:
+            raise WordLookupException('link target "{}" not found in data source table for {}'.format(
+                target, type(self).__name__))
+        return row[1:]
+
+    def _resolve_link(self, word: Word, target: str) -> LookupData:
+        row = self._link_target_row(target, 'word, content')
+        if row is None:
+            return self.lookup_word(word, target, following_link=True)
+        target_word, content = row
+        return self.parse_word_content(word, target_word, content, following_link=True)
+
+    @classmethod
+    def compiled_dictionary_path(cls) -> Path:
+        """Returns the path of this data source's compiled dictionary, which may not exist yet."""
+        return CompiledDictionary.path(cls.get_database_name())
+
+    def compile_dictionary(self) -> int:
+        """Compiles the content of the default table into a read-only dictionary file, which is memory-mapped and
+        searched directly for lookups from then on. This happens automatically once data has been ingested, so it only
+        needs to be called directly to rebuild the file.
+
+        Returns: the number of entries compiled.
+        """
+        path = self.compiled_dictionary_path()
+        log(self, 'compiling {} into {}'.format(self.default_table, path))
+        # SQLite orders text by its UTF-8 bytes by default, which is the order compiled dictionaries are searched in
+        cursor = self.conn.execute('SELECT word, content FROM {} ORDER BY word'.format(self.default_table))
+        return CompiledDictionary.write(path, cursor)
+
+    def _remove_compiled_dictionary(self, table_name: str):
+        # anything compiled from an earlier copy of the default table is out of date once the table is ingested or
+        # adopted, and is compiled again from the table when the data source is opened
+        if table_name == self.default_table and self.compiled_dictionary_path().exists():
+            self.compiled_dictionary_path().unlink()
+
+    def _open_compiled_dictionary(self) -> Optional[CompiledDictionary]:
+        if not self.use_compiled_dictionary or self.content_type != 'TEXT':
+            return None
+
+        path = self.compiled_dictionary_path()
+        try:
+            if not path.exists():
+                self.compile_dictionary()
+            return CompiledDictionary(path)
+        except (OSError, CardBuilderException) as ex:
+            log(self, 'could not use compiled dictionary at {}, falling back to sqlite: {}'.format(path, ex), WARNING)
+            return None
+
+    def _attach_database(self):
+        """Attaches this data source's database and makes sure it has an ingestion manifest. Tables that were created
+        by a previous schema version are dropped, so that they're created again with the current schema; a database
+        too damaged to read (such as by an interrupted bulk load) is deleted and started from scratch."""
+        super()._attach_database()
+        database_name = self.get_database_name()
+        try:
+            self._drop_outdated_tables()
+        except sqlite3.OperationalError:
+            raise  # such as the database being locked, which says nothing about its content
+        except sqlite3.DatabaseError as ex:
+            log(self, 'could not read database {} ({}), so it will be recreated'.format(database_name, ex), WARNING)
+            Database.delete(database_name)
+            super()._attach_database()
+            self._drop_outdated_tables()
+
+    def _drop_outdated_tables(self):
+        manifest_table = self._table_name(self.manifest_table_name)
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS {}(
+            table_name TEXT PRIMARY KEY,
+            input_size INTEGER,
+            input_mtime REAL,
+            input_hash TEXT,
+            row_count INTEGER,
+            parser_version INTEGER,
+            schema_version INTEGER,
+            complete INTEGER,
+            dependencies TEXT
+        );'''.format(manifest_table))
+        # manifests created before tables could depend on other tables don't record their dependencies
+        database_name, unqualified_manifest_table = manifest_table.split('.')
+        if 'dependencies' not in {row[1] for row in self.conn.execute('PRAGMA {}.table_info({})'.format(
+                database_name, unqualified_manifest_table))}:
+            self.conn.execute('ALTER TABLE {} ADD COLUMN dependencies TEXT'.format(manifest_table))
+        cursor = self.conn.execute('SELECT table_name FROM {} WHERE schema_version != ?'.format(manifest_table),
+                                   (self._schema_version(),))
+        for table_name, in cursor.fetchall():
+            log(self, 'table {} has an outdated schema, and will be recreated'.format(table_name))
+            self.conn.execute('DROP TABLE IF EXISTS {}'.format(table_name))
+            self.conn.execute('DELETE FROM {} WHERE table_name=?'.format(manifest_table), (table_name,))
+        self.conn.commit()
+
+    def _input_path(self) -> Optional[Path]:
+        """Returns the file the default table is ingested from, if it's known, so that changes to it can be detected.
+        Defaults to the filename in the data directory for data sources that define one."""
+        return InDataDir.directory / self.filename if hasattr(self, 'filename') else None
+
+    def _read_manifest(self, table_name: str) -> Optional[Tuple]:
+        return self.conn.execute('SELECT input_size, input_mtime, input_hash, row_count, parser_version, complete, '
+                                 'dependencies FROM {} WHERE table_name=?'.format(
+                                     self._table_name(self.manifest_table_name)), (table_name,)).fetchone()
+
+    def _write_manifest(self, conn: sqlite3.Connection, table_name: str, input_path: Optional[Path],
+                        row_count: Optional[int], complete: bool, dependencies: Iterable[str] = ()):
+        input_size, input_mtime, input_hash = None, None, None
+        if complete and input_path is not None and input_path.exists():
+            input_stat = input_path.stat()
+            input_size, input_mtime, input_hash = input_stat.st_size, input_stat.st_mtime, file_hash(input_path)
+
+        conn.execute('INSERT OR REPLACE INTO {} (table_name, input_size, input_mtime, input_hash, row_count, '
+                     'parser_version, schema_version, complete, dependencies) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'.format(
+                         self._table_name(self.manifest_table_name)),
+                     (table_name, input_size, input_mtime, input_hash, row_count, self._parser_version(),
+                      self._schema_version(), complete, self._dependencies_signature(dependencies)))
+        conn.commit()
+
+    def _dependencies_signature(self, dependencies: Iterable[str]) -> Optional[str]:
+        # identifies what the tables a table is derived from held when it was ingested, by what their manifests say
+        # about where their content came from. Their manifests change whenever they're ingested again
+        dependencies = sorted(dependencies)
+        if len(dependencies) == 0:
+            return None
+
+        signature = []
+        for table_name in dependencies:
+            manifest = self._read_manifest(table_name)
+            signature.append([table_name, *(manifest[2:5] if manifest is not None else (None, None, None))])
+        return dumps(signature)
+
+    def _ingestion_staleness(self, table_name: str, manifest: Optional[Tuple], input_path: Optional[Path],
+                             dependencies: Iterable[str] = ()) -> Optional[str]:
+        """Returns why a table needs to be ingested, or None if its content is up to date."""
+        if manifest is None:
+            return 'has not been ingested'
+
+        input_size, input_mtime, input_hash, _, parser_version, complete, dependencies_signature = manifest
+        if not complete:
+            return 'was not completely ingested'
+        if parser_version != self._parser_version():
+            return 'was ingested by parser version {}, not {}'.format(parser_version, self._parser_version())
+        if dependencies_signature != self._dependencies_signature(dependencies):
+            return 'was derived from tables which have been ingested again since'
+        if input_path is None or input_hash is None or not input_path.exists():
+            return None  # without the input there's nothing to compare against, so trust what was ingested
+
+        input_stat = input_path.stat()
+        if (input_stat.st_size, input_stat.st_mtime) == (input_size, input_mtime):
+            return None
+        # a file that was only touched is hashed once more, and then recognized by its new mtime
+        if input_stat.st_size == input_size and file_hash(input_path) == input_hash:
+            self.conn.execute('UPDATE {} SET input_mtime=? WHERE table_name=?'.format(
+                self._table_name(self.manifest_table_name)), (input_stat.st_mtime, table_name))
+            self.conn.commit()
+            return None
+
+        return 'was ingested from a different version of {}'.format(input_path)
 
     def _fetch_remote_files_if_necessary(self):
         if not hasattr(self, 'filename') or not hasattr(self, 'url'):
@@ -159,26 +1021,77 @@ class ExternalDataDataSource(DataSource, ABC):
                                       'implement _fetch_remote_files_if_necessary()')
         if not exists(self.filename):
             log(self, '{} not found - downloading...'.format(self.filename))
-            download_to_file_with_loading_bar(self.url, self.filename)
+            download_to_file_with_loading_bar(self.url, self.filename, self.file_sha256)
 
     def _load_data_into_database(self, table_name: str = None, iter_func: Callable[[], Iterable] = None,
-                                 sql: str = None):
-        table_name = self.default_table if table_name is None else table_name
+                                 sql: str = None, index_sql: Iterable[str] = None, input_file: Optional[str] = None,
+                                 dependencies: Iterable[str] = ()):
+        """Populates a table unless the ingestion manifest shows it's already up to date. A table is ingested again if
+        its last ingestion didn't finish, if _parser_version has changed, or if its input file or any table it's derived
+        from has changed since. The data is bulk loaded in a single transaction, and indexes are built once the data is
+        in rather than updated row by row.
+
+        Args:
+            table_name: the table to populate; defaults to the default table.
+            iter_func: returns the rows to insert; defaults to _read_and_convert_data.
+            sql: the statement to insert each row with.
+            index_sql: statements creating the table's indexes. The default table gets a unique index on word.
+            input_file: the file the table's data is read from, relative to the data directory. Defaults to
+            _input_path() for the default table.
+            dependencies: the tables the table's data is derived from. It's ingested again whenever any of them has
+            been since it was.
+        """
+        if table_name is None:
+            table_name = self.default_table
+            if index_sql is None and not self.default_table_primary_key:
+                database_name, unqualified_name = table_name.split('.')
+                index_sql = ['CREATE UNIQUE INDEX IF NOT EXISTS {0}.{1}_word ON {1}(word)'.format(database_name,
+                                                                                                 unqualified_name)]
         iter_func = self._read_and_convert_data if iter_func is None else iter_func
         sql = 'INSERT INTO {} VALUES (?, ?)'.format(table_name) if sql is None else sql
-        data_count = self.get_table_rowcount(table_name)
-        if data_count != 0:
-            log(self, 'found {} database entries for table {}'.format(data_count, table_name))
-            return
+        if input_file is not None:
+            input_path = InDataDir.directory / input_file
         else:
-            log(self, 'sqlite table {} appears to be empty, and will be populated'.format(table_name))
-            with InDataDir():
-                for batch_iter in grouper(self.batch_size, iter_func()):
-                    self.conn.executemany(sql, batch_iter)
-                    self.conn.commit()
-
-            log(self, 'finished populating sqlite table {} with {} entries'.format(table_name,
-                                                                                   self.get_table_rowcount(table_name)))
+            input_path = self._input_path() if table_name == self.default_table else None
+
+        manifest = self._read_manifest(table_name)
+        if manifest is None and self.conn.execute('SELECT EXISTS(SELECT 1 FROM {})'.format(table_name)).fetchone()[0]:
+            # ingested before there was a manifest, or moved out of the main database; record it rather than ingesting
+            # again, as the input may be gone. It may not have the indexes ingestion would have built, though
+            for statement in index_sql if index_sql is not None else []:
+                self.conn.execute(statement)
+            self._remove_compiled_dictionary(table_name)
+            self._write_manifest(self.conn, table_name, input_path, self.get_table_rowcount(table_name), True,
+                                 dependencies)
+            manifest = self._read_manifest(table_name)
+
+        staleness = self._ingestion_staleness(table_name, manifest, input_path, dependencies)
+        if staleness is None:
+            log(self, 'found {} database entries for table {}'.format(manifest[3], table_name))
+            return
+
+        log(self, 'sqlite table {} {}, and will be populated'.format(table_name, staleness))
+        self._remove_compiled_dictionary(table_name)
+        self._write_manifest(self.conn, table_name, input_path, None, False)
+
+        row_count = 0
+        database_name, unqualified_name = table_name.split('.')
+        with InDataDir(), Database.bulk_load(database_name) as conn:
+            conn.execute('DELETE FROM {}'.format(table_name))
+            if index_sql is not None:
+                # the indexes are rebuilt once the data is in, rather than kept up to date while it's loaded
+                for index_name, in conn.execute('SELECT name FROM {}.sqlite_master WHERE type=\'index\' AND '
+                                                'tbl_name=? AND sql IS NOT NULL'.format(database_name),
+                                                (unqualified_name,)).fetchall():
+                    conn.execute('DROP INDEX {}.{}'.format(database_name, index_name))
+            for batch in batched(iter_func(), self.batch_size):
+                row_count += conn.executemany(sql, batch).rowcount
+            for statement in index_sql if index_sql is not None else []:
+                conn.execute(statement)
+
+        # only marked complete once the data is committed, so an interrupted load is redone next time
+        self._write_manifest(self.conn, table_name, input_path, row_count, True, dependencies)
+        log(self, 'finished populating sqlite table {} with {} entries'.format(table_name, row_count))
 
 
 
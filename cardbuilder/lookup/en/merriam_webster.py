@@ -1,6 +1,6 @@
 import re
 from json import loads
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Iterable, Dict, Union
 
 import requests
 from bs4 import BeautifulSoup
@@ -11,7 +11,7 @@ from cardbuilder.common.fieldnames import Fieldname
 from cardbuilder.common.util import log
 from cardbuilder.exceptions import WordLookupException, CardBuilderUsageException
 from cardbuilder.input.word import Word
-from cardbuilder.lookup.data_source import WebApiDataSource, AggregatingDataSource
+from cardbuilder.lookup.data_source import WebApiDataSource, AggregatingDataSource, DataSource
 from cardbuilder.lookup.lookup_data import LookupData, outputs
 from cardbuilder.lookup.value import MultiListValue, ListValue
 
@@ -110,6 +110,39 @@ class ScrapingMerriamWebster(WebApiDataSource):
         })
 
 
+api_key_regex = re.compile(r'.+-.+-.+-.+')
+
+
+def resolve_api_key(data_source: DataSource, api_key: Optional[str], conf_name: str) -> str:
+    """Works out which API key a data source should use.
+
+    Args:
+        data_source: the data source the key is for.
+        api_key: either the key itself or the path of a file containing it, which is saved in the config under
+        conf_name for next time, or None to use the key already saved there.
+        conf_name: the name the key is saved in the config under.
+
+    Returns: the API key.
+    """
+    if api_key is None:
+        try:
+            return Config.get(conf_name)
+        except KeyError:
+            raise CardBuilderUsageException('{} was passed None for an API key but could not find it in the config '
+                                            'database. Please pass in a key'.format(type(data_source).__name__))
+
+    if api_key_regex.match(api_key) and '.' not in api_key:
+        log(data_source, '{} looks like API key - using it'.format(api_key))
+    else:
+        key_file = api_key
+        with open(key_file, encoding='utf-8') as f:
+            api_key = f.readlines()[0]
+        log(data_source, 'read API key {} from file {} - using it'.format(api_key, key_file))
+    Config.set(conf_name, api_key)
+
+    return api_key
+
+
 @outputs({
     Fieldname.SYNONYMS: MultiListValue,
     Fieldname.ANTONYMS: MultiListValue
@@ -117,10 +150,18 @@ class ScrapingMerriamWebster(WebApiDataSource):
 class CollegiateThesaurus(WebApiDataSource):
     # https://dictionaryapi.com/products/api-collegiate-thesaurus
 
-    def __init__(self, api_key):
+    api_key_conf_name = 'thesaurus_api_key'
+
+    def __init__(self, api_key: Optional[str] = None):
+        """
+
+        Args:
+            api_key: the API key, or the path of a file containing it. Only needed the first time, as it's saved in the
+            config.
+        """
+        self.api_key = resolve_api_key(self, api_key, self.api_key_conf_name)
         super().__init__()
-        log(self, 'initializing Collegiate Thesaurus with api key {}'.format(api_key))
-        self.api_key = api_key
+        log(self, 'initializing Collegiate Thesaurus with api key {}'.format(self.api_key))
 
     def _query_api(self, word) -> str:
         url = 'https://www.dictionaryapi.com/api/v3/references/thesaurus/json/{word}?key={api_key}'.format(
@@ -164,15 +205,22 @@ class CollegiateThesaurus(WebApiDataSource):
 class LearnerDictionary(WebApiDataSource):
     # https://dictionaryapi.com/products/api-learners-dictionary
 
+    api_key_conf_name = 'mw_learners_api_key'
     audio_file_format = 'mp3'
     number_subdir_regex = re.compile(r'^[^a-zA-Z]+')
     # this is fairly aggressive - for example it entirely erases "{it} chiefly US {/it}"
     formatting_marker_regex = re.compile(r'{.*}')
 
-    def __init__(self, api_key):
+    def __init__(self, api_key: Optional[str] = None):
+        """
+
+        Args:
+            api_key: the API key, or the path of a file containing it. Only needed the first time, as it's saved in the
+            config.
+        """
+        self.api_key = resolve_api_key(self, api_key, self.api_key_conf_name)
         super().__init__()
-        log(self, 'initializing Learner\'s Dictionary with api key {}'.format(api_key))
-        self.api_key = api_key
+        log(self, 'initializing Learner\'s Dictionary with api key {}'.format(self.api_key))
 
     def _query_api(self, word) -> str:
         url = 'https://www.dictionaryapi.com/api/v3/references/learners/json/{word}?key={api_key}'.format(
@@ -288,57 +336,78 @@ class MerriamWebster(AggregatingDataSource):
     # https://dictionaryapi.com/products/json
     # Each lookup here is two requests to MW; be careful if using an account limited to 1000/day
 
-    keylike = re.compile(r'.+-.+-.+-.+')
+    keylike = api_key_regex
 
-    learners_api_conf_name = 'mw_learners_api_key'
-    thesaurus_api_conf_name = 'thesaurus_api_key'
+    learners_api_conf_name = LearnerDictionary.api_key_conf_name
+    thesaurus_api_conf_name = CollegiateThesaurus.api_key_conf_name
 
     def __init__(self, learners_api_key: Optional[str] = None, thesaurus_api_key: Optional[str] = None,
                  pos_in_definitions=False):
-        api_keys = []
-        for idx, key in enumerate([learners_api_key, thesaurus_api_key]):
-            key_name = self.learners_api_conf_name if idx == 0 else self.thesaurus_api_conf_name
-            if key is None:
-                try:
-                    api_key = Config.get(key_name)
-                except KeyError:
-                    raise CardBuilderUsageException('MerriamWebster was passed None for an API key but could not'
-                                                    'find it in the config database. Please pass in a key')
-            else:
-                if self.keylike.match(key) and '.' not in key:
-                    log(self, '{} looks like API key - using it'.format(key))
-                    api_key = key
-                else:
-                    with open(key, encoding='utf-8') as f:
-                        api_key = f.readlines()[0]
-                    log(self, 'read API key {} from file {} - using it'.format(api_key, key))
-                Config.set(key_name, api_key)
-
-            api_keys.append(api_key)
-
         # deliberately don't call super().__init__() because MW doesn't need an sqlite table
-        # the learners dict and thesaurus have their own tables
+        # the learners dict and thesaurus have their own tables, and work out their own API keys
         log(self, 'Instantiating {} dictionary with owernship of {} and {}'.format(
             *(x.__name__ for x in (MerriamWebster, LearnerDictionary, CollegiateThesaurus))))
-        self.learners_dict = LearnerDictionary(api_keys[0])
-        self.thesaurus = CollegiateThesaurus(api_keys[1])
+        self.learners_dict = LearnerDictionary(learners_api_key)
+        self.thesaurus = CollegiateThesaurus(thesaurus_api_key)
         self.pos_in_definitions = pos_in_definitions
 
-    def __del__(self):
-        pass  # no need to close any database connections like DataSource does
-
     def lookup_word(self, word: Word, form: str, following_link: bool = False) -> LookupData:
         dictionary_data = self.learners_dict.lookup_word(word, form)
-
-        output = dictionary_data.get_data()
         try:  # thesaurus gags an awful lot
             thesaurus_data = self.thesaurus.lookup_word(word, form)
+        except WordLookupException as ex:
+            thesaurus_data = ex
+
+        return self._aggregate(word, form, dictionary_data, thesaurus_data)
+
+    def lookup_words(self, word_forms: Iterable[Tuple[Word, str]]) \
+            -> Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]:
+        word_forms = list(word_forms)
+        dictionary_results = self.learners_dict.lookup_words(word_forms)
+        thesaurus_results = self.thesaurus.lookup_words(self._found_word_forms(dictionary_results))
+
+        return self._aggregate_results(word_forms, dictionary_results, thesaurus_results)
+
+    async def alookup_words(self, word_forms: Iterable[Tuple[Word, str]]) \
+            -> Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]:
+        word_forms = list(word_forms)
+        dictionary_results = await self.learners_dict.alookup_words(word_forms)
+        thesaurus_results = await self.thesaurus.alookup_words(self._found_word_forms(dictionary_results))
+
+        return self._aggregate_results(word_forms, dictionary_results, thesaurus_results)
+
+    @staticmethod
+    def _found_word_forms(dictionary_results: Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]) \
+            -> List[Tuple[Word, str]]:
+        # as with single lookups, only query the thesaurus for words the dictionary actually has
+        return [word_form for word_form, result in dictionary_results.items()
+                if not isinstance(result, WordLookupException)]
+
+    def _aggregate_results(self, word_forms: List[Tuple[Word, str]],
+                           dictionary_results: Dict[Tuple[Word, str], Union[LookupData, WordLookupException]],
+                           thesaurus_results: Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]) \
+            -> Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]:
+        results = {}
+        for word, form in word_forms:
+            if (word, form) in thesaurus_results:
+                results[(word, form)] = self._aggregate(word, form, dictionary_results[(word, form)],
+                                                        thesaurus_results[(word, form)])
+            else:
+                results[(word, form)] = dictionary_results[(word, form)]
+
+        return results
+
+    def _aggregate(self, word: Word, form: str, dictionary_data: LookupData,
+                   thesaurus_data: Union[LookupData, WordLookupException]) -> LookupData:
+        output = dictionary_data.get_data()
+        if isinstance(thesaurus_data, WordLookupException):
+            content = dictionary_data.get_raw_content()
+        else:
             output = {
                 **output, **thesaurus_data.get_data()
             }
-            content = dictionary_data.get_raw_content() + self.aggregated_content_delimiter \
-                      + thesaurus_data.get_raw_content()
-        except WordLookupException:
-            content = dictionary_data.get_raw_content()
+            raw_contents = (dictionary_data.get_raw_content(), thesaurus_data.get_raw_content())
+            # raw content that was dropped after parsing can't be aggregated
+            content = self.aggregated_content_delimiter.join(raw_contents) if None not in raw_contents else None
 
         return self.lookup_data_type(word, form, content, output)
@@ -1,12 +1,11 @@
 import csv
-import sqlite3
-from typing import Iterable, Tuple
+from typing import Iterable, Tuple, Dict, Union
 
 from cardbuilder.common.fieldnames import Fieldname
-from cardbuilder.common.util import fast_linecount, InDataDir, loading_bar, log, DATABASE_NAME, retry_with_logging
+from cardbuilder.common.util import InDataDir, lines_with_loading_bar, log
 from cardbuilder.exceptions import WordLookupException
 from cardbuilder.input.word import Word
-from cardbuilder.lookup.data_source import ExternalDataDataSource
+from cardbuilder.lookup.data_source import ExternalDataDataSource, DataSource
 from cardbuilder.lookup.lookup_data import LookupData, outputs
 from cardbuilder.lookup.value import SingleValue
 
@@ -37,14 +36,18 @@ class WordFrequency(ExternalDataDataSource):
             Fieldname.SUPPLEMENTAL: SingleValue(content),
         })
 
+    def lookup_words(self, word_forms: Iterable[Tuple[Word, str]]) \
+            -> Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]:
+        # frequencies are already in memory, so there's no query to batch
+        return DataSource.lookup_words(self, word_forms)
+
     def _read_and_convert_data(self) -> Iterable[Tuple[str, int]]:
         frequency = {}
         with InDataDir():
-            line_count = fast_linecount(self.filename)
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f, delimiter='\t')
-                for word, freq in loading_bar(reader, 'reading {}'.format(self.filename), line_count):
-                    frequency[word] = int(freq)
+            reader = csv.reader(lines_with_loading_bar(self.filename, 'reading {}'.format(self.filename)),
+                                delimiter='\t')
+            for word, freq in reader:
+                frequency[word] = int(freq)
 
         return frequency.items()
 
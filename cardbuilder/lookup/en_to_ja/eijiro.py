@@ -1,13 +1,21 @@
 import re
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from io import SEEK_END
+from itertools import chain
+from json import dumps, loads
 from logging import WARNING
+from multiprocessing import get_context
+from os import cpu_count
 from os.path import abspath
+from pathlib import Path
 from string import digits
-from typing import Tuple, Iterable, Optional
+from typing import Tuple, Iterable, Optional, List, Dict
 
 from cardbuilder.common.config import Config
 from cardbuilder.common.fieldnames import Fieldname
-from cardbuilder.common.util import fast_linecount, loading_bar, log
+from cardbuilder.common.util import loading_bar, log
 from cardbuilder.exceptions import CardBuilderException, WordLookupException
 from cardbuilder.input.word import Word
 from cardbuilder.lookup.data_source import ExternalDataDataSource
@@ -42,6 +50,20 @@ content_sectioning_symbol_map = {
 }
 
 
+ParsedLine = Tuple[Optional[str], Dict[str, List[str]], List[str]]  # part of speech, field values, linked words
+
+
+def _parse_eijiro_chunk(filename: str, bounds: Tuple[int, int]) -> List[Tuple[str, List[ParsedLine]]]:
+    start, end = bounds
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).decode(Eijiro.encoding).split('\n')
+    if lines[-1] == '':
+        lines.pop()  # after the chunk's final newline
+
+    return list(Eijiro._merge_entries((word, [parsed]) for word, parsed in map(Eijiro._parse_line, lines)))
+
+
 @outputs({**{Fieldname.LINKS: LinksValue, Fieldname.DEFINITIONS: MultiListValue},
           **{fname: MultiListValue for fname in content_sectioning_symbol_map.values() if fname != Fieldname.LINKS}})
 class Eijiro(ExternalDataDataSource):
@@ -50,8 +72,14 @@ class Eijiro(ExternalDataDataSource):
 
     eijiro_conf_value = 'eijiro_loaded'
 
+    encoding = 'shift_jisx0213'
+    follows_links = True
     line_head_symbol = '■'
     entry_delimiter = ' : '
+    # entries used to be stored unparsed: their lines joined by one delimiter, each line prefixed with its part of
+    # speech and another delimiter if it had one
+    legacy_header_data_delimiter = '⦀'
+    legacy_line_data_delimiter = '⚬'
 
     content_sectioning_symbols = set(content_sectioning_symbol_map.keys())
 
@@ -105,112 +133,186 @@ class Eijiro(ExternalDataDataSource):
         '〈米海軍俗〉': '米海軍で使われる俗語'
     }.items()}
 
-    header_data_delimiter = '⦀'
-    line_data_delimiter = '⚬'
+    # the dictionary is read in chunks of about this many bytes, parsed in this many processes (by default, one per CPU)
+    ingestion_chunk_size = 8 << 20
+    ingestion_processes = None
+
+    @classmethod
+    def _parse_line(cls, line: str) -> Tuple[str, Optional[ParsedLine]]:
+        header_end = line.index(cls.entry_delimiter)
+        header = line[1:header_end].strip()  # start at 1 to drop the ■
+        content = line[header_end + len(cls.entry_delimiter):].strip()
+
+        pos_marking_match = next(cls.header_pos_regex.finditer(header), None)
+        if pos_marking_match is not None:
+            pos_content = pos_marking_match.group(0)[1:-1]
+            word = header[:pos_marking_match.start()].strip()
+            if '-' in pos_content:
+                pos = next(x.strip() for x in pos_content.split('-') if x.strip() not in digitset)
+                pos = cls.pos_dictionary.get(pos, pos)
+            else:
+                pos = pos_content.strip()
+        else:
+            word = header.strip()
+            pos = None
 
-    def _read_and_convert_data(self) -> Iterable[Tuple[str, str]]:
-        if self.file_loc is None:
-            raise FileNotFoundError('Must set Eijiro location the first time for data ingestion')
-        lines = fast_linecount(self.file_loc)
-        prev_word = None
-        prev_content = None
-        for line in loading_bar(open(self.file_loc, 'r', encoding='shift_jisx0213'), 'reading eijiro', lines):
-            header_end = line.index(Eijiro.entry_delimiter)
-            header = line[1:header_end].strip()  # start at 1 to drop the ■
-            content = line[header_end + len(Eijiro.entry_delimiter):].strip()
-
-            pos_marking_match = next(Eijiro.header_pos_regex.finditer(header), None)
-            if pos_marking_match is not None:
-                pos_content = pos_marking_match.group(0)[1:-1]
-                word = header[:pos_marking_match.start()].strip()
-                if '-' in pos_content:
-                    pos = next(x.strip() for x in pos_content.split('-') if x.strip() not in digitset)
-                    pos = Eijiro.pos_dictionary.get(pos, pos)
+        return word, cls._parse_line_content(pos, content)
+
+    @classmethod
+    def _parse_line_content(cls, pos: Optional[str], content: str) -> Optional[ParsedLine]:
+        """Splits a line's content into its sections, returning its part of speech, the values of each of its fields
+        by field name, and the words it links to, or None if its sections can't be made sense of."""
+        fields = defaultdict(list)
+        links = []
+
+        content_sections = Eijiro.content_sectioning_regex.split(content)
+        if content_sections[0] not in Eijiro.content_sectioning_symbols:
+            leading_content = content_sections.pop(0)
+            if leading_content:  # leading content is sometimes empty, don't want to add blank definitions
+                fields[Fieldname.DEFINITIONS.name].append(leading_content)
+
+        section_header = None
+        for section in content_sections:
+            if section_header is None and section in Eijiro.content_sectioning_symbols:
+                section_header = section
+            elif section_header is not None and section not in Eijiro.content_sectioning_symbols:
+                key = content_sectioning_symbol_map[section_header]
+                if key == Fieldname.LINKS:
+                    if '>' not in section:
+                        return None
+                    links.append(section[:section.index('>')])
                 else:
-                    pos = pos_content.strip()
+                    fields[key.name].append(section.strip('、'))
+
+                section_header = None
             else:
-                word = header.strip()
-                pos = None
+                return None
 
-            if pos is not None:
-                content = self.header_data_delimiter.join((pos, content))
+        return pos, dict(fields), links
 
-            if prev_word is not None and prev_content is not None:
+    @classmethod
+    def _merge_entries(cls, entries: Iterable[Tuple[str, List[ParsedLine]]]) -> Iterable[Tuple[str, List[ParsedLine]]]:
+        """Merges consecutive entries for the same headword, accumulating their lines in a list."""
+        prev_word, prev_lines = None, None
+        for word, lines in entries:
+            if prev_word is not None:
                 # the .lower() here is necessary because sometimes there are sequential entries that go back and forth
                 # on case, like "the" -> "The" -> "the". As is, we end up using the case attached to the last entry
                 if word.lower() == prev_word.lower():
-                    content = self.line_data_delimiter.join((prev_content, content))
-                    # if we've ever seen a lowercase form, hold onto it for lookup
+                    prev_lines.extend(lines)
+                    # if we've ever seen a lowercase form, hold onto it for lookup. an entry's word is only uppercase
+                    # if none of its lines' words were lowercase
                     prev_word = word if word.islower() else prev_word
-                else:
-                    yield prev_word, prev_content
-                    prev_word = word
-            else:
-                prev_word = word
+                    continue
+                yield prev_word, prev_lines
 
-            prev_content = content
+            prev_word, prev_lines = word, lines
 
-        yield prev_word, prev_content
+        if prev_word is not None:
+            yield prev_word, prev_lines
 
-    def parse_word_content(self, word: Word, form: str, content: str, following_link: bool = False) -> LookupData:
-        lines = content.split(self.line_data_delimiter)
-        line_parses = []
-        for line in lines:
-            line_attrs = defaultdict(list)
-
-            if self.header_data_delimiter in line:
-                header_data, line = line.split(self.header_data_delimiter)
-                # only data in the header seems to be the POS
-                line_attrs[Fieldname.PART_OF_SPEECH] = header_data
-
-            content_sections = Eijiro.content_sectioning_regex.split(line)
-            if content_sections[0] not in Eijiro.content_sectioning_symbols:
-                leading_content = content_sections.pop(0)
-                if leading_content:  # leading content is sometimes empty, don't want to add blank definitions
-                    line_attrs[Fieldname.DEFINITIONS].append(leading_content)
-
-            section_header = None
-            for section in content_sections:
-                if section_header is None and section in Eijiro.content_sectioning_symbols:
-                    section_header = section
-                elif section_header is not None and section not in Eijiro.content_sectioning_symbols:
-                    key = content_sectioning_symbol_map[section_header]
-                    if key == Fieldname.LINKS:
-                        if not following_link:
-                            linked_word = section[:section.index('>')]
-                            try:
-                                line_attrs[Fieldname.LINKS].append(self.lookup_word(word, linked_word,
-                                                                                    following_link=True))
-                            except WordLookupException:
-                                log(self, 'Found link to apparently missing word "{}" in definition of word "{}"'.format(
-                                    linked_word, form
-                                ), WARNING)
-                    else:
-                        line_attrs[key].append(section.strip('、'))
-
-                    section_header = None
-                else:
-                    raise CardBuilderException('Unexpected sectioning sequence in Eijiro dictionary')
-
-            line_parses.append(line_attrs)
+    @staticmethod
+    def _serialize_entry(lines: List[Optional[ParsedLine]]) -> str:
+        # an entry's field values are grouped by part of speech, in the order each field and part of speech first
+        # appears in its lines
+        if any(line is None for line in lines):
+            return dumps({'error': 'Unexpected sectioning sequence in Eijiro dictionary'})
 
         aggregated_parse = defaultdict(lambda: defaultdict(list))
         links = []
-        for val_map in line_parses:
-            pos = val_map.get(Fieldname.PART_OF_SPEECH, None)
-            if Fieldname.LINKS in val_map:
-                links.extend(val_map[Fieldname.LINKS])
-            for key, val in ((k, v) for k, v in val_map.items() if k != Fieldname.PART_OF_SPEECH
-                                                                   and k != Fieldname.LINKS):
-                aggregated_parse[key][pos].extend(val)
+        for pos, fields, line_links in lines:
+            links.extend(line_links)
+            for key, vals in fields.items():
+                aggregated_parse[key][pos].extend(vals)
+
+        return dumps({
+            'links': links,
+            'fields': {key: [[[val for val in vals if val], pos] for pos, vals in val_dict.items()]
+                       for key, val_dict in aggregated_parse.items()}
+        }, ensure_ascii=False)
+
+    def _convert_legacy_content(self, content: str) -> str:
+        lines = []
+        for line in content.split(self.legacy_line_data_delimiter):
+            pos = None
+            if self.legacy_header_data_delimiter in line:
+                pos, line = line.split(self.legacy_header_data_delimiter)
+            lines.append(self._parse_line_content(pos, line))
+
+        return self._serialize_entry(lines)
+
+    def _chunk_bounds(self) -> List[Tuple[int, int]]:
+        # chunks end at newlines, which are never part of a multibyte Shift_JIS character
+        bounds = []
+        with open(self.file_loc, 'rb') as f:
+            file_size = f.seek(0, SEEK_END)
+            start = 0
+            while start < file_size:
+                f.seek(min(start + self.ingestion_chunk_size, file_size) - 1)
+                f.readline()
+                bounds.append((start, f.tell()))
+                start = f.tell()
+
+        return bounds
+
+    def _parse_chunks(self) -> Iterable[List[Tuple[str, List[ParsedLine]]]]:
+        bounds = self._chunk_bounds()
+        parse_chunk = partial(_parse_eijiro_chunk, self.file_loc)
+        process_count = self.ingestion_processes if self.ingestion_processes is not None else cpu_count() or 1
+        if process_count == 1 or len(bounds) == 1:
+            yield from map(parse_chunk, loading_bar(bounds, 'reading eijiro'))
+            return
+
+        with ProcessPoolExecutor(max_workers=process_count, mp_context=get_context('spawn')) as executor:
+            pending = deque()
+            for chunk_bounds in loading_bar(bounds, 'reading eijiro'):
+                pending.append(executor.submit(parse_chunk, chunk_bounds))
+                if len(pending) >= 2 * process_count:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _read_and_convert_data(self) -> Iterable[Tuple[str, str]]:
+        if self.file_loc is None:
+            raise FileNotFoundError('Must set Eijiro location the first time for data ingestion')
+
+        # entries are parsed and merged within each chunk by the process that read it, and then merged across chunk
+        # boundaries here. each is stored parsed, so looking a word up only has to deserialize it
+        for word, lines in self._merge_entries(chain.from_iterable(self._parse_chunks())):
+            yield word, self._serialize_entry(lines)
+
+    @staticmethod
+    def _parser_version() -> int:
+        return 1
+
+    def _link_targets(self, content: str) -> Iterable[str]:
+        return loads(content).get('links', [])
+
+    def parse_word_content(self, word: Word, form: str, content: str, following_link: bool = False) -> LookupData:
+        entry = loads(content)
+        if 'error' in entry:
+            raise CardBuilderException(entry['error'])
+
+        links = []
+        if not following_link:
+            for linked_word in entry['links']:
+                try:
+                    self._check_link(word, linked_word)
+                    links.append(linked_word)
+                except WordLookupException:
+                    log(self, 'Found link to apparently missing word "{}" in definition of word "{}"'.format(
+                        linked_word, form
+                    ), WARNING)
 
         output = {}
         if links:
-            output[Fieldname.LINKS] = LinksValue(links)
-        for val_key, val_dict in aggregated_parse.items():
-            output[val_key] = MultiListValue([([val for val in vals if val], pos) for pos, vals in val_dict.items()])
+            output[Fieldname.LINKS] = self._lazy_links(word, links)
+        for key, pos_vals in entry['fields'].items():
+            output[Fieldname[key]] = MultiListValue([(vals, pos) for vals, pos in pos_vals])
 
-        if Fieldname.LINKS in output:
+        # linked entries are only looked up here if there are fields they could fill in
+        fillable_fields = Fieldname.link_friendly_fields() & self.lookup_data_type.fields().keys()
+        if Fieldname.LINKS in output and any(key not in output or output[key].is_empty() for key in fillable_fields):
             for linked_word_dict in output[Fieldname.LINKS].get_data():
                 for key, value in linked_word_dict.get_data().items():
                     if (key not in output or not output[key].get_data()) and key in Fieldname.link_friendly_fields():
@@ -221,6 +323,9 @@ class Eijiro(ExternalDataDataSource):
     def _fetch_remote_files_if_necessary(self):
         pass  # No remote files to fetch, takes an explicit file location
 
+    def _input_path(self) -> Optional[Path]:
+        return Path(self.file_loc) if self.file_loc is not None else None
+
     def __init__(self, eijiro_location: Optional[str] = None):
         if eijiro_location is not None:
             self.file_loc = abspath(eijiro_location)
@@ -1,13 +1,14 @@
 import csv
+import shutil
 from collections import defaultdict
+from functools import partial
+from os import remove, replace
 from os.path import exists
 from string import ascii_lowercase
 from typing import Tuple, Iterable
 
-import requests
-
 from cardbuilder.common.fieldnames import Fieldname
-from cardbuilder.common.util import log, loading_bar
+from cardbuilder.common.util import log, download_to_file_with_loading_bar, run_downloads
 from cardbuilder.exceptions import WordLookupException
 from cardbuilder.input.word import Word
 from cardbuilder.lookup.data_source import ExternalDataDataSource
@@ -23,19 +24,25 @@ class EJDictHand(ExternalDataDataSource):
     filename = 'ejdicthand.txt'
     definition_delim = ' / '
     link_symbol = '='
+    follows_links = True
+    piece_url_template = 'https://raw.githubusercontent.com/kujirahand/EJDict/master/src/{}.txt'
 
     # https://kujirahand.com/web-tools/EJDictFreeDL.php
     def _fetch_remote_files_if_necessary(self):
         if not exists(EJDictHand.filename):
             log(self, '{} not found - downloading and assembling file pieces...'.format(self.filename))
-            all_content = bytes()
-            for letter in loading_bar(ascii_lowercase, 'downloading EJDict-hand files'):
-                url = 'https://raw.githubusercontent.com/kujirahand/EJDict/master/src/{}.txt'.format(letter)
-                request = requests.get(url)
-                all_content = all_content + request.content
+            # pieces are kept until the file is assembled, so an interrupted setup only downloads what's missing
+            pieces = ['ejdicthand_{}.txt'.format(letter) for letter in ascii_lowercase]
+            run_downloads(partial(download_to_file_with_loading_bar, self.piece_url_template.format(letter), piece)
+                          for letter, piece in zip(ascii_lowercase, pieces) if not exists(piece))
 
-            with open(self.filename, 'wb+') as f:
-                f.write(all_content)
+            with open(self.filename + '.part', 'wb') as f:
+                for piece in pieces:
+                    with open(piece, 'rb') as piece_file:
+                        shutil.copyfileobj(piece_file, f)
+            replace(self.filename + '.part', self.filename)
+            for piece in pieces:
+                remove(piece)
 
     def _read_and_convert_data(self) -> Iterable[Tuple[str, str]]:
         definition_map = defaultdict(list)
@@ -48,6 +55,9 @@ class EJDictHand(ExternalDataDataSource):
 
         return ((word, self.definition_delim.join(defs)) for word, defs in definition_map.items())
 
+    def _link_targets(self, content: str) -> Iterable[str]:
+        return [c[1:] for c in content.split(self.definition_delim) if c.startswith(self.link_symbol)]
+
     def parse_word_content(self, word: Word, form: str, content: str, following_link: bool = False) -> LookupData:
         content_items = content.split(self.definition_delim)
         definitions = [c for c in content_items if not c.startswith(self.link_symbol)]
@@ -56,10 +66,11 @@ class EJDictHand(ExternalDataDataSource):
             if len(links) > 0 and not following_link:
                 first_link = links[0]
                 remaining_links = links[1:]
-                output = self.lookup_word(word, first_link, following_link=True)
+                output = self._follow_link(word, first_link)
                 if len(remaining_links) > 0:
-                    output[Fieldname.LINKS] = LinksValue([self.lookup_word(word, linked_word, following_link=True)
-                                                          for linked_word in remaining_links])
+                    for linked_word in remaining_links:
+                        self._check_link(word, linked_word)
+                    output[Fieldname.LINKS] = self._lazy_links(word, remaining_links)
             else:
                 raise WordLookupException('Empty entry found for word {} in EJDictHand'.format(form))
         else:
@@ -67,7 +78,8 @@ class EJDictHand(ExternalDataDataSource):
                 Fieldname.DEFINITIONS: ListValue(definitions),
             })
             if len(links) > 0 and not following_link:
-                output[Fieldname.LINKS] = LinksValue([self.lookup_word(word, linked_word, following_link=True)
-                                                      for linked_word in links])
+                for linked_word in links:
+                    self._check_link(word, linked_word)
+                output[Fieldname.LINKS] = self._lazy_links(word, links)
 
         return output
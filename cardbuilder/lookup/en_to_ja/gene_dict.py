@@ -1,10 +1,9 @@
-import tarfile
 from json import dumps, loads
 from os.path import exists
 from typing import Iterable, Tuple
 
 from cardbuilder.common.fieldnames import Fieldname
-from cardbuilder.common.util import log, download_to_stream_with_loading_bar
+from cardbuilder.common.util import log, download_and_extract_to_file
 from cardbuilder.input.word import Word
 from cardbuilder.lookup.data_source import ExternalDataDataSource
 from cardbuilder.lookup.lookup_data import outputs, LookupData
@@ -70,10 +69,6 @@ class GeneDict(ExternalDataDataSource):
     def _fetch_remote_files_if_necessary(self):
         if not exists(self.filename):
             log(self, '{} not found - downloading and extracting...'.format(self.filename))
-            stream = download_to_stream_with_loading_bar(self.url)
-            tar = tarfile.open(fileobj=stream, mode='r:gz')
-            gene_data = tar.extractfile('gene.txt').read().decode('shift_jisx0213')
-            with open(self.filename, 'w+', encoding='utf-8') as f:
-                f.write(gene_data)
+            download_and_extract_to_file(self.url, self.filename, member='gene.txt', source_encoding='shift_jisx0213')
 
 
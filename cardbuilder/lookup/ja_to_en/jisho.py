@@ -22,6 +22,8 @@ from cardbuilder.lookup.value import SingleValue, ListValue, MultiListValue
 class Jisho(WebApiDataSource):
     """The DataSource class for jisho.org's API"""
 
+    parse_depends_on_word = True  # matches can come from any of the word's forms, not just the one being looked up
+
     @staticmethod
     def _to_katakana_reading(form: str) -> str:
         return ''.join(x['kana'] for x in Shared.get_kakasi().convert(form))
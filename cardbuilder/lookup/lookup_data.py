@@ -1,6 +1,9 @@
+import zlib
 from abc import ABC, abstractmethod
 from copy import copy
-from typing import Dict
+from enum import Enum
+from json import dumps, loads
+from typing import Dict, Optional, Union
 
 from cardbuilder.common.fieldnames import Fieldname
 from cardbuilder.exceptions import CardBuilderUsageException
@@ -8,9 +11,20 @@ from cardbuilder.input.word import Word
 from cardbuilder.lookup.value import Value, SingleValue
 
 
+class RawContentRetention(Enum):
+    """What lookup data does with the raw content it was parsed from. Raw content can be much larger than the data
+    parsed from it (a whole HTML page, say), so large runs that don't need it can compress or drop it."""
+    KEEP = 'keep'
+    COMPRESS = 'compress'  # kept compressed, and decompressed whenever it's retrieved
+    DROP = 'drop'  # get_raw_content returns None
+
+
 class LookupData(ABC):
     """An empty base class for all word data so that a common type exists"""
 
+    # applies to all lookup data, unless set on the lookup_data_type of a particular data source
+    raw_content_retention = RawContentRetention.KEEP
+
     @classmethod
     def fields(cls) -> Dict[Fieldname, type]:
         raise NotImplementedError()
@@ -36,12 +50,44 @@ class LookupData(ABC):
 
         raise NotImplementedError()
 
-    def get_raw_content(self) -> str:
+    def get_raw_content(self) -> Optional[str]:
+        """Returns the raw content this data was parsed from, or None if it was dropped; see raw_content_retention."""
+        if isinstance(self._raw_data, bytes):
+            return zlib.decompress(self._raw_data).decode('utf-8')
         return copy(self._raw_data)
 
+    def get_retained_raw_content(self) -> Union[str, bytes, None]:
+        """Returns the raw content as it's held in memory, which is compressed bytes if it's being kept compressed."""
+        return self._raw_data
+
+    @classmethod
+    def _retain_raw_content(cls, raw_data: Optional[str]) -> Union[str, bytes, None]:
+        if raw_data is None or cls.raw_content_retention == RawContentRetention.KEEP:
+            return raw_data
+        elif cls.raw_content_retention == RawContentRetention.COMPRESS:
+            return zlib.compress(raw_data.encode('utf-8'))
+        else:
+            return None
+
     def get_data(self) -> Dict[Fieldname, Value]:
         return copy(self._data)
 
+    def serialize(self) -> str:
+        """Returns a compact representation of this data's found form and values, from which it can be rebuilt with
+        deserialize. Raises NotImplementedError if any of its values can't be represented as primitives."""
+        return dumps([self.found_form, {key.value: value.to_primitive() for key, value in self._data.items()}],
+                     ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def deserialize(cls, word: Word, raw_data: str, serialized: str) -> 'LookupData':
+        found_form, primitives = loads(serialized)
+        data = {}
+        for key, primitive in primitives.items():
+            fieldname = Fieldname(key)
+            data[fieldname] = cls.fields()[fieldname](primitive)
+
+        return cls(word, found_form, raw_data, data)
+
     @abstractmethod
     def __setitem__(self, key: Fieldname, value: Value):
         raise NotImplementedError()
@@ -109,7 +155,7 @@ def outputs(output_spec: Dict[Fieldname, type]):
             def __init__(self, word: Word, found_form: str, raw_data: str, data: Dict[Fieldname, Value]):
                 self.word = word
                 self.found_form = found_form
-                self._raw_data = raw_data
+                self._raw_data = self._retain_raw_content(raw_data)
 
                 for fieldname, value in data.items():
                     if fieldname not in self._fields:
@@ -121,7 +167,7 @@ def outputs(output_spec: Dict[Fieldname, type]):
                         ))
 
                 # don't pass on any empty values
-                self._data = {k: v for k, v in data.items() if len(v.get_data()) > 0}
+                self._data = {k: v for k, v in data.items() if not v.is_empty()}
 
         GeneratedLookupData.__name__ = clazz.__name__ + 'LookupData'
 
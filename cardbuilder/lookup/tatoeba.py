@@ -1,62 +1,159 @@
 import csv
+import pickle
 import re
-import sqlite3
-import tarfile
-from bz2 import BZ2Decompressor
-from collections import defaultdict
-from json import loads
+from collections import defaultdict, deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from heapq import heappush, heapreplace, merge
+from itertools import groupby, islice
+from multiprocessing import get_context
+from os import cpu_count
 from os.path import exists
 from string import punctuation
-from typing import List, Tuple, Iterable
+from tempfile import TemporaryFile
+from typing import List, Tuple, Iterable, Dict, Union, Optional, Callable, IO
 
 from fugashi import Tagger
 
+from cardbuilder.common.database import Database
 from cardbuilder.common.fieldnames import Fieldname
 from cardbuilder.common.languages import JAPANESE
-from cardbuilder.common.util import is_hiragana, fast_linecount, loading_bar, log, download_to_stream_with_loading_bar, \
-    DATABASE_NAME, InDataDir
+from cardbuilder.common.util import is_hiragana, loading_bar, log, download_and_extract_to_file, InDataDir, \
+    lines_with_loading_bar, batched, run_downloads
 from cardbuilder.exceptions import WordLookupException, CardBuilderUsageException
 from cardbuilder.input.word import Word
-from cardbuilder.lookup.data_source import ExternalDataDataSource
+from cardbuilder.lookup.data_source import ExternalDataDataSource, DataSource
 from cardbuilder.lookup.lookup_data import outputs, LookupData
 from cardbuilder.lookup.value import MultiValue
 
 
+Postings = Dict[str, List[Tuple[Tuple[int, ...], int]]]  # word -> heap of (negated rank key, sentence ID)
+
+_process_tagger = None  # the tagger of a tokenizer process
+
+
+def _push_posting(postings: Postings, word: str, negated_key: Tuple[int, ...], ident: int, max_postings: int) -> int:
+    # each word keeps a heap of its best ranked sentences, negated so that the worst of them is on top. returns how
+    # many postings were added, so callers can keep track of how many they hold
+    heap = postings[word]
+    if len(heap) < max_postings:
+        heappush(heap, (negated_key, ident))
+        return 1
+    elif negated_key > heap[0][0]:
+        heapreplace(heap, (negated_key, ident))
+    return 0
+
+
+def _add_sentence_postings(postings: Postings, words: Iterable[str], negated_key: Tuple[int, ...], ident: int,
+                           max_postings: int) -> int:
+    return sum(_push_posting(postings, word, negated_key, ident, max_postings)
+               for word in set(w for w in words if not w.isnumeric() and w not in punctuation))
+
+
+def _sorted_postings(postings: Postings) -> Iterable[Tuple[str, List[Tuple[Tuple[int, ...], int]]]]:
+    # words in order, each with its postings from best to worst
+    return ((word, sorted(postings[word], reverse=True)) for word in sorted(postings))
+
+
+def _spill_postings(postings: Postings, run_file: IO[bytes]):
+    for word_postings in _sorted_postings(postings):
+        pickle.dump(word_postings, run_file, pickle.HIGHEST_PROTOCOL)
+    run_file.seek(0)
+
+
+def _read_spilled_postings(run_file: IO[bytes]) -> Iterable[Tuple[str, List[Tuple[Tuple[int, ...], int]]]]:
+    while True:
+        try:
+            yield pickle.load(run_file)
+        except EOFError:
+            return
+
+
+def _split_japanese_sentence(tagger: Tagger, sentence: str) -> List[str]:
+    # hacky and only accommodates  exact matches (I.E. conjugated verbs are shot), could probably be done better
+    split_words_generator = (str(x) for x in tagger(sentence))
+    split_words = [x for x in split_words_generator if not (len(x) == 1 and is_hiragana(x))]
+    return split_words
+
+
+def _init_tokenizer_process():
+    global _process_tagger
+    _process_tagger = Tagger('-Owakati')
+
+
+def _index_japanese_chunk(rank_key: Callable[[int, str], Tuple[int, ...]], max_postings: int,
+                          chunk: List[Tuple[int, str]]) -> Postings:
+    postings = defaultdict(list)
+    for ident, sent in chunk:
+        negated_key = tuple(-x for x in rank_key(ident, sent))
+        _add_sentence_postings(postings, _split_japanese_sentence(_process_tagger, sent), negated_key, ident,
+                               max_postings)
+
+    return postings
+
+
 @outputs({
     Fieldname.EXAMPLE_SENTENCES: MultiValue
 })
 class TatoebaExampleSentences(ExternalDataDataSource):
 
-    links_table_name = 'tatoeba_links'
-    sentences_table_name_formatstring = 'tatoeba_{}_sentences'
-    index_table_name_formatstring = 'tatoeba_{}_index'
+    database_name = 'tatoeba'
+    links_table_name_formatstring = 'tatoeba.tatoeba_links_{}_{}'  # one table for each pair of languages
+    sentences_table_name_formatstring = 'tatoeba.tatoeba_{}_sentences'
+    postings_table_name_formatstring = 'tatoeba.tatoeba_{}_{}_postings'  # one table for each direction of each pair
+    max_sentences = 20  # the most sentence pairs a lookup returns by default
+    indexed_sentences_per_word = 100  # how many of each word's best ranked translated sentences are kept per word
+    # Japanese sentences are tokenized for indexing in this many processes (by default, one per CPU), this many
+    # sentences at a time
+    tokenizer_processes = None
+    tokenizer_chunk_size = 5000
+    # once the index being built holds this many postings, they're written out to a temporary file and merged with the
+    # others at the end, so building the index never needs more memory than this no matter how many sentences there are
+    max_postings_in_memory = 2000000
     punctuation_regex = re.compile('[{}]'.format(re.escape(punctuation)))
     links_file = 'links.csv'
     links_url = 'https://downloads.tatoeba.org/exports/links.tar.bz2'
     sentences_filename_template = '{}_sentences.tsv'
     data_dict = {}
 
-    def lookup_word(self, word: Word, form: str, following_link: bool = False) -> LookupData:
-        c = self.conn.execute("select sent_id_list from tatoeba_{}_index where word=?;".format(self.source_lang), (form,))
-        index_result = c.fetchone()
-        if index_result is None:
-            raise WordLookupException('Word "{}" not found in the Tatoeba index for language {}'.format(form,
-                                                                                                        self.source_lang))
-        else:
-            index_ids = loads(index_result[0])
+    @staticmethod
+    def _schema_version() -> int:
+        return 1
+
+    @classmethod
+    def _is_legacy_table(cls, table_name: str) -> bool:
+        return table_name.startswith('tatoeba_')
+
+    def _legacy_table_destination(self, table_name: str) -> Optional[str]:
+        return None  # the tables are laid out differently now, and are built again from the downloaded files
+
+    def lookup_word(self, word: Word, form: str, following_link: bool = False,
+                    max_sentences: Optional[int] = None) -> LookupData:
+        """
 
+        Args:
+            max_sentences: the most sentence pairs to return, best ranked first. Defaults to the max_sentences class
+            attribute, and can't usefully be more than indexed_sentences_per_word.
+        """
         c = self.conn.execute('''
-        select tatoeba_{0}_sentences.sentence as {0}_sentence, tatoeba_{1}_sentences.sentence as {1}_sentence
-        from tatoeba_{0}_sentences 
-        inner join tatoeba_links on tatoeba_{0}_sentences.sent_id=src_sent_id
-        inner join tatoeba_{1}_sentences on tatoeba_{1}_sentences.sent_id=target_sent_id
-        where tatoeba_{0}_sentences.sent_id in ({2});
-        '''.format(self.source_lang, self.target_lang, ','.join(str(x) for x in index_ids)))
+        select source_sentences.sentence, target_sentences.sentence
+        from {0} as postings
+        inner join {1} as source_sentences on source_sentences.sent_id=postings.sent_id
+        inner join {2} as links on links.src_sent_id=postings.sent_id
+        inner join {3} as target_sentences on target_sentences.sent_id=links.target_sent_id
+        where postings.word=?
+        order by postings.rank
+        limit ?;
+        '''.format(self.postings_table_name,
+                   self.sentences_table_name_formatstring.format(self.source_lang), self.links_table_name,
+                   self.sentences_table_name_formatstring.format(self.target_lang)),
+                              (form, self.max_sentences if max_sentences is None else max_sentences))
 
         example_sentence_pairs = c.fetchall()
         if len(example_sentence_pairs) == 0:
-            raise WordLookupException('Found no corresponding example sentences for word {} in'
-                                      ' Tatoeba data for language {}'.format(form, self.target_lang))
+            raise WordLookupException('Found no example sentences for word "{}" in Tatoeba data for languages {} and '
+                                      '{}'.format(form, self.source_lang, self.target_lang))
 
         example_sentences_value = MultiValue(example_sentence_pairs)
 
@@ -64,72 +161,174 @@ class TatoebaExampleSentences(ExternalDataDataSource):
             Fieldname.EXAMPLE_SENTENCES: example_sentences_value
         })
 
+    def lookup_words(self, word_forms: Iterable[Tuple[Word, str]]) \
+            -> Dict[Tuple[Word, str], Union[LookupData, WordLookupException]]:
+        # tatoeba doesn't use the default table, so fall back to looking up each form individually
+        return DataSource.lookup_words(self, word_forms)
+
     def _create_tables(self):
-        # links table
+        # links table, which only holds links between this pair of languages, in both directions
         self.conn.execute('''CREATE TABLE IF NOT EXISTS {}(
              src_sent_id INT,
              target_sent_id INT
          );'''.format(self.links_table_name))
-        self.conn.execute('''CREATE INDEX IF NOT EXISTS links_source_sentence
-            ON {} (src_sent_id);'''.format(self.links_table_name))
+        # which replaces the old table of links between every language
+        self.conn.execute('DROP TABLE IF EXISTS {}.tatoeba_links'.format(self.database_name))
 
-        # index of words to sentence IDs table
+        # posting list of each word's best ranked sentence IDs among those translated into the target language,
+        # clustered by word and then rank so that a word's postings are read together and in order
         self.conn.execute('''CREATE TABLE IF NOT EXISTS {}(
-             word TEXT PRIMARY KEY,
-             sent_id_list TEXT
-         );'''.format(self.index_table_name_formatstring.format(self.source_lang)))
+             word TEXT,
+             rank INTEGER,
+             sent_id INTEGER,
+             PRIMARY KEY (word, rank)
+         ) WITHOUT ROWID;'''.format(self.postings_table_name))
+        # which replaces the old index of each word to a JSON list of its sentence IDs, and the old posting lists
+        # shared by every target language, whose best ranked sentences could all be untranslated
+        self.conn.execute('DROP TABLE IF EXISTS {}.tatoeba_{}_index'.format(self.database_name, self.source_lang))
+        self.conn.execute('DROP TABLE IF EXISTS {}.tatoeba_{}_postings'.format(self.database_name, self.source_lang))
 
         # sentences table for both languages
         for lang in (self.source_lang, self.target_lang):
+            # an INTEGER PRIMARY KEY is the table's rowid, so it needs no separate index
             self.conn.execute('''CREATE TABLE IF NOT EXISTS {}(
-                 sent_id INT PRIMARY KEY,
+                 sent_id INTEGER PRIMARY KEY,
                  sentence TEXT
              );'''.format(self.sentences_table_name_formatstring.format(lang)))
 
         self.conn.commit()
 
+    def _sentence_id_bitmap(self, lang: str) -> bytearray:
+        """Returns a bitmap with a bit set for each of a language's sentence IDs, which takes up a small fraction of
+        the memory a set of the IDs would."""
+        table_name = self.sentences_table_name_formatstring.format(lang)
+        max_id = self.conn.execute('SELECT MAX(sent_id) FROM {}'.format(table_name)).fetchone()[0]
+        bitmap = bytearray((max_id or 0) // 8 + 1)
+        for ident, in self.conn.execute('SELECT sent_id FROM {}'.format(table_name)):
+            bitmap[ident >> 3] |= 1 << (ident & 7)
+
+        return bitmap
+
+    @staticmethod
+    def _in_bitmap(bitmap: bytearray, ident: int) -> bool:
+        return (ident >> 3) < len(bitmap) and bitmap[ident >> 3] & (1 << (ident & 7)) != 0
+
     def _read_links_data(self) -> Iterable[Tuple[int, int]]:
-        #  each link is guaranteed to be in the file going both directions, so no special logic is necessary
+        # each link is guaranteed to be in the file going both directions, so no special logic is necessary. Only
+        # links between the two languages' sentences are kept, out of the links between every pair of languages
+        source_ids = self._sentence_id_bitmap(self.source_lang)
+        target_ids = self._sentence_id_bitmap(self.target_lang)
         with InDataDir():
-            line_count = fast_linecount(self.links_file)
             log(self, 'Reading Tatoeba link data into database')
-            with open(self.links_file, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f, delimiter='\t')
-                for source_id, target_id in loading_bar(reader, 'reading links.csv', line_count):
-                    yield int(source_id), int(target_id)
+            reader = csv.reader(lines_with_loading_bar(self.links_file, 'reading links.csv'), delimiter='\t')
+            for source_id, target_id in reader:
+                source_id, target_id = int(source_id), int(target_id)
+                if (self._in_bitmap(source_ids, source_id) and self._in_bitmap(target_ids, target_id)) or \
+                        (self._in_bitmap(target_ids, source_id) and self._in_bitmap(source_ids, target_id)):
+                    yield source_id, target_id
 
     def _read_language_sents(self, lang) -> Iterable[Tuple[int, str]]:
         filename = self.sentences_filename_template.format(lang)
-        line_count = fast_linecount(filename)
-        with open(filename, 'r', encoding='utf-8') as f:
-            reader = csv.reader(f, delimiter='\t')
-            for ident, _, sentence in loading_bar(reader, 'reading {}'.format(filename), line_count):
-                yield int(ident), sentence
-
-    def _compute_and_yield_index_data(self, id_sent_data: List[Tuple[int, str]]) -> Iterable[Tuple[str, str]]:
-        # the word index would certainly take up less memory as a trie, but it's probably not worth the trouble
-        results = defaultdict(set)
-        for ident, sent in loading_bar(id_sent_data, 'indexing sentences'):
-            words = self._split_sentence(sent)
-            for word in (w for w in words if not w.isnumeric() and w not in punctuation):
-                results[word].add(ident)
-
-        for word, identity_set in results.items():
-            yield word, str(list(identity_set))
+        reader = csv.reader(lines_with_loading_bar(filename, 'reading {}'.format(filename)), delimiter='\t')
+        for ident, _, sentence in reader:
+            yield int(ident), sentence
+
+    def _read_source_sents(self) -> Iterable[Tuple[int, str]]:
+        # streamed from the cursor rather than fetched all at once, and only read when the index needs building. Only
+        # sentences with a translation are indexed, as no others could be returned by a lookup
+        yield from self.conn.execute('''
+        select sent_id, sentence from {0} as source_sentences
+        where exists (select 1 from {1} as links where links.src_sent_id=source_sentences.sent_id);
+        '''.format(self.sentences_table_name_formatstring.format(self.source_lang), self.links_table_name))
+
+    @staticmethod
+    def _sentence_rank_key(ident: int, sent: str) -> Tuple[int, int]:
+        # shorter sentences make better examples, and are quicker to read on a card
+        return len(sent), ident
+
+    def _compute_and_yield_index_data(self, id_sent_data: Iterable[Tuple[int, str]]) \
+            -> Iterable[Tuple[str, int, int]]:
+        # the best postings of any subset of the sentences include the best postings of all of them that are in it,
+        # so merging the postings of chunks or of spilled runs gives the same result as indexing every sentence at once
+        with ExitStack() as stack:
+            runs = []
+            results, postings_in_memory = defaultdict(list), 0
+
+            def spill_if_full():
+                nonlocal results, postings_in_memory
+                if postings_in_memory >= self.max_postings_in_memory:
+                    runs.append(stack.enter_context(TemporaryFile()))
+                    _spill_postings(results, runs[-1])
+                    results, postings_in_memory = defaultdict(list), 0
+
+            if self.source_lang == JAPANESE and self.tokenizer_processes != 1:
+                for chunk_postings in self._index_japanese_in_processes(id_sent_data):
+                    for word, heap in chunk_postings.items():
+                        for negated_key, ident in heap:
+                            postings_in_memory += _push_posting(results, word, negated_key, ident,
+                                                                self.indexed_sentences_per_word)
+                    spill_if_full()
+            else:
+                for ident, sent in loading_bar(id_sent_data, 'indexing sentences'):
+                    negated_key = tuple(-x for x in self._sentence_rank_key(ident, sent))
+                    postings_in_memory += _add_sentence_postings(results, self._split_sentence(sent), negated_key,
+                                                                 ident, self.indexed_sentences_per_word)
+                    spill_if_full()
+
+            if runs:
+                log(self, 'merging {} spilled runs of postings'.format(len(runs) + 1))
+
+            # postings are yielded in primary key order, which is the fastest order to insert them in
+            word_postings = merge(*(_read_spilled_postings(run) for run in runs), _sorted_postings(results),
+                                  key=lambda item: item[0])
+            for word, group in groupby(word_postings, key=lambda item: item[0]):
+                best_postings = merge(*(postings for _, postings in group), reverse=True)
+                for rank, (_, ident) in enumerate(islice(best_postings, self.indexed_sentences_per_word)):
+                    yield word, rank, ident
+
+    def _index_japanese_in_processes(self, id_sent_data: Iterable[Tuple[int, str]]) -> Iterable[Postings]:
+        """Tokenizes sentences in chunks in a pool of processes, each with its own tagger, and yields the postings of
+        each chunk in order. Only a few chunks are in flight at once, so the sentences are never all in memory."""
+        process_count = self.tokenizer_processes if self.tokenizer_processes is not None else cpu_count() or 1
+        index_chunk = partial(_index_japanese_chunk, type(self)._sentence_rank_key, self.indexed_sentences_per_word)
+        # spawned rather than forked, as this process has database connections and threads of its own
+        with ProcessPoolExecutor(max_workers=process_count, mp_context=get_context('spawn'),
+                                 initializer=_init_tokenizer_process) as executor:
+            pending = deque()
+            for chunk in batched(loading_bar(id_sent_data, 'indexing sentences'), self.tokenizer_chunk_size):
+                pending.append(executor.submit(index_chunk, chunk))
+                if len(pending) >= 2 * process_count:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
 
     def __init__(self, source_lang: str, target_lang: str):
         self.source_lang = source_lang
         self.target_lang = target_lang
+        # both directions of a pair share a links table
+        self.links_table_name = self.links_table_name_formatstring.format(*sorted((source_lang, target_lang)))
+        self.postings_table_name = self.postings_table_name_formatstring.format(source_lang, target_lang)
         # intentionally don't call parent init; tatoeba doesn't use default sql table
+        self._attach_database()
+        self._migrate_legacy_tables()
         with InDataDir():
-            self.conn = sqlite3.connect(DATABASE_NAME)
             self._fetch_remote_files_if_necessary()
 
         self._create_tables()
-        self._load_data_into_database(self.links_table_name, self._read_links_data)
         for lang in (self.source_lang, self.target_lang):
             self._load_data_into_database(self.sentences_table_name_formatstring.format(lang),
-                                          lambda: self._read_language_sents(lang))
+                                          lambda: self._read_language_sents(lang),
+                                          input_file=self.sentences_filename_template.format(lang))
+        # links are filtered by the sentences loaded above, so they're filtered again whenever either language's
+        # sentences change, including through another pair of languages. The index covers lookups, which then never
+        # need to read the links table itself
+        unqualified_links_table_name = self.links_table_name.split('.')[1]
+        self._load_data_into_database(self.links_table_name, self._read_links_data, index_sql=[
+            'CREATE INDEX IF NOT EXISTS {}.{}_source_target ON {} (src_sent_id, target_sent_id)'.format(
+                self.database_name, unqualified_links_table_name, unqualified_links_table_name)],
+                                      input_file=self.links_file,
+                                      dependencies=[self.sentences_table_name_formatstring.format(lang)
+                                                    for lang in (self.source_lang, self.target_lang)])
 
         if source_lang == JAPANESE:
             self.tagger = Tagger('-Owakati')
@@ -137,11 +336,14 @@ class TatoebaExampleSentences(ExternalDataDataSource):
         else:
             self._split_sentence = self._split_by_spaces
 
-        cursor = self.conn.execute('SELECT sent_id, sentence FROM {}'.format(
-            self.sentences_table_name_formatstring.format(self.source_lang)))
-        source_lang_data = cursor.fetchall()
-        self._load_data_into_database(self.index_table_name_formatstring.format(self.source_lang),
-                                      lambda: self._compute_and_yield_index_data(source_lang_data))
+        # the index is computed from the source language's sentences that are linked to the target language, so it's
+        # out of date whenever either of those is
+        self._load_data_into_database(self.postings_table_name,
+                                      lambda: self._compute_and_yield_index_data(self._read_source_sents()),
+                                      sql='INSERT INTO {} VALUES (?, ?, ?)'.format(self.postings_table_name),
+                                      dependencies=[self.sentences_table_name_formatstring.format(self.source_lang),
+                                                    self.links_table_name])
+        Database.seal(self.database_name)
 
     def _fetch_remote_files_if_necessary(self):
         url_template = 'https://downloads.tatoeba.org/exports/per_language/{}/{}_sentences.tsv.bz2'
@@ -153,25 +355,19 @@ class TatoebaExampleSentences(ExternalDataDataSource):
             (self.links_file, self.links_url)
         ]
 
+        downloads = []
         for filename, url in filenames_and_urls:
             if not exists(filename):
                 log(self, '{} not found - downloading and extracting...'.format(filename))
 
-                stream_data = download_to_stream_with_loading_bar(url)
-                if url[-8:] == '.tar.bz2':
-                    tar = tarfile.open(fileobj=stream_data, mode='r:bz2')
-                    tar.extract(filename)
-                elif url[-4:] == '.bz2':
-                    with open(filename, 'wb+') as f:
-                        f.write(BZ2Decompressor().decompress(stream_data.read()))
-                else:
+                if not url.endswith('.bz2'):
                     raise CardBuilderUsageException('Retrieved unexpected file format from Tatoeba: {}'.format(url))
+                downloads.append(partial(download_and_extract_to_file, url, filename))
+
+        run_downloads(downloads)
 
     def _split_japanese_sentence(self, sentence: str) -> List[str]:
-        # hacky and only accommodates  exact matches (I.E. conjugated verbs are shot), could probably be done better
-        split_words_generator = (str(x) for x in self.tagger(sentence))
-        split_words = [x for x in split_words_generator if not (len(x) == 1 and is_hiragana(x))]
-        return split_words
+        return _split_japanese_sentence(self.tagger, sentence)
 
     def _split_by_spaces(self, sentence: str) -> List[str]:
         cleaned_sentence = self.punctuation_regex.sub(' ', sentence.lower())
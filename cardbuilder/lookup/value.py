@@ -1,6 +1,6 @@
 from abc import ABC, abstractmethod
 from copy import copy
-from typing import List, Tuple, Optional, Sequence
+from typing import List, Tuple, Optional, Sequence, Union, Callable
 
 from cardbuilder.exceptions import CardBuilderUsageException
 
@@ -14,6 +14,14 @@ class Value(ABC):
     def get_data(self) -> Sequence:
         return copy(self._data)
 
+    def to_primitive(self):
+        """Returns this value's data in the form of primitives accepted by its constructor, so that the value can be
+        serialized and rebuilt later."""
+        raise NotImplementedError('{} cannot be converted to primitives'.format(type(self).__name__))
+
+    def is_empty(self) -> bool:
+        return len(self.get_data()) == 0
+
     def __eq__(self, other):
         return isinstance(other, type(self)) and self._data == other._data
 
@@ -40,6 +48,9 @@ class SingleValue(Value):
     def get_data(self) -> str:
         return copy(self._data)
 
+    def to_primitive(self) -> input_type:
+        return self._data
+
 
 class MultiValue(Value):
     """Represents multiple values, each optionally paired with a header value. Useful for capturing pairs or mappings
@@ -56,6 +67,10 @@ class MultiValue(Value):
     def get_data(self) -> List[Tuple[SingleValue, Optional[SingleValue]]]:
         return copy(self._data)
 
+    def to_primitive(self) -> List[Tuple[SingleValue.input_type, Optional[SingleValue.input_type]]]:
+        return [(data.to_primitive(), header.to_primitive() if header is not None else None)
+                for data, header in self._data]
+
 
 class ListValue(Value):
     """
@@ -71,6 +86,9 @@ class ListValue(Value):
     def get_data(self) -> List[SingleValue]:
         return copy(self._data)
 
+    def to_primitive(self) -> input_type:
+        return [x.to_primitive() for x in self._data]
+
 
 class MultiListValue(Value):
     """
@@ -89,19 +107,39 @@ class MultiListValue(Value):
     def get_data(self) -> List[Tuple[ListValue, Optional[SingleValue]]]:
         return copy(self._data)
 
+    def to_primitive(self) -> List[Tuple[ListValue.input_type, Optional[SingleValue.input_type]]]:
+        return [(list_data.to_primitive(), header.to_primitive() if header is not None else None)
+                for list_data, header in self._data]
+
 
 class LinksValue(Value):
     """
     Represents a link in a dictionary to another word. Useful only in very specific cases.
+
+    The linked data can be given as a function that looks it up instead, in which case it's only looked up the first
+    time it's needed, and data that's never used is never looked up.
     """
-    def __init__(self, link_data: List['LookupData']):
-        self._data = link_data
+    def __init__(self, link_data: Union[List['LookupData'], Callable[[], List['LookupData']]]):
+        if callable(link_data):
+            self._data = None
+            self._resolve = link_data
+        else:
+            self._data = link_data
+            self._resolve = None
+
+    @property
+    def resolved(self) -> bool:
+        return self._resolve is None
 
     def get_data(self) -> List['LookupData']:
+        if self._resolve is not None:
+            self._data = self._resolve()
+            self._resolve = None
         return self._data
 
+    def is_empty(self) -> bool:
+        # unresolved links are assumed to lead somewhere, rather than resolved just to find out
+        return self.resolved and len(self._data) == 0
 
-
-
-
-
+    def __eq__(self, other):
+        return isinstance(other, type(self)) and self.get_data() == other.get_data()
@@ -1,6 +1,7 @@
-from typing import Union, List, Iterable, Callable, Dict
+import asyncio
+from typing import Union, List, Iterable, Callable, Dict, AsyncIterator, Generator, Tuple
 
-from cardbuilder.common.util import loading_bar
+from cardbuilder.common.util import loading_bar, batched
 from cardbuilder.exceptions import CardResolutionException, WordLookupException, CardBuilderUsageException
 from cardbuilder.input.word import Word
 from cardbuilder.input.word_list import WordList
@@ -12,6 +13,8 @@ from cardbuilder.resolution.field import Field
 
 class ResolutionEngine:
 
+    lookup_batch_size = 500
+
     def __init__(self, fields: List[Field],
                  mutator: Callable[[Dict[DataSource, LookupData]], Dict[DataSource, LookupData]] = None):
         self.mutator = self.default_mutator if mutator is None else mutator
@@ -38,23 +41,103 @@ class ResolutionEngine:
 
     def cards(self, words: Union[List[str], WordList]) -> Iterable[CardData]:
         self.failed_resolutions = []
-        for word in loading_bar(words, 'populating cards'):
+        for batch in batched(loading_bar(words, 'populating cards'), self.lookup_batch_size):
+            lookup_results = self._lookup_batch(batch)
+            for word in batch:
+                try:
+                    yield self._resolve_fieldlist(word, lookup_results)
+                except CardResolutionException as ex:
+                    self.failed_resolutions.append((word, ex))
+
+    async def acards(self, words: Union[List[str], WordList]) -> AsyncIterator[CardData]:
+        """The asynchronous counterpart of cards. Each batch of words is looked up in all data sources concurrently,
+        and data sources that support it (such as web APIs) look up the words in each batch concurrently as well."""
+        self.failed_resolutions = []
+        for batch in batched(loading_bar(words, 'populating cards'), self.lookup_batch_size):
+            lookup_results = await self._alookup_batch(batch)
+            for word in batch:
+                try:
+                    yield self._resolve_fieldlist(word, lookup_results)
+                except CardResolutionException as ex:
+                    self.failed_resolutions.append((word, ex))
+
+    def _lookup_batch(self, words: List[Word]) \
+            -> Dict[DataSource, Dict[Word, Union[LookupData, WordLookupException]]]:
+        forms_by_word = self._forms_by_word(words)
+        results = {}
+        for datasource in self.datasource_by_name.values():
+            plan = self._plan_lookups(forms_by_word)
+            try:
+                word_forms = next(plan)
+                while True:
+                    word_forms = plan.send(datasource.lookup_words(word_forms))
+            except StopIteration as stop:
+                results[datasource] = stop.value
+
+        return results
+
+    async def _alookup_batch(self, words: List[Word]) \
+            -> Dict[DataSource, Dict[Word, Union[LookupData, WordLookupException]]]:
+        forms_by_word = self._forms_by_word(words)
+
+        async def lookup_in(datasource: DataSource) -> Dict[Word, Union[LookupData, WordLookupException]]:
+            plan = self._plan_lookups(forms_by_word)
             try:
-                yield self._resolve_fieldlist(word)
-            except CardResolutionException as ex:
-                self.failed_resolutions.append((word, ex))
+                word_forms = next(plan)
+                while True:
+                    word_forms = plan.send(await datasource.alookup_words(word_forms))
+            except StopIteration as stop:
+                return stop.value
 
-    def _resolve_fieldlist(self, word: Word) -> CardData:
+        datasources = list(self.datasource_by_name.values())
+        source_results = await asyncio.gather(*(lookup_in(datasource) for datasource in datasources))
+        return dict(zip(datasources, source_results))
+
+    @staticmethod
+    def _forms_by_word(words: List[Word]) -> Dict[Word, List[str]]:
+        return {word: list(dict.fromkeys(word)) for word in words}  # dedup while preserving order
+
+    @staticmethod
+    def _plan_lookups(forms_by_word: Dict[Word, List[str]]) \
+            -> Generator[List[Tuple[Word, str]], Dict[Tuple[Word, str], Union[LookupData, WordLookupException]],
+                         Dict[Word, Union[LookupData, WordLookupException]]]:
+        """Plans the lookups for a batch of words in a single data source. Rather than trying each word's forms one at
+        a time, all words' first forms are looked up together, then the second forms of words that weren't found, and
+        so on, so that the data source sees one batched lookup per form priority level.
+
+        This is a generator which yields the (word, form) pairs to look up next and expects to be sent the results of
+        those lookups. Its return value maps each word to either the data for the first of its forms that was found,
+        or the failure for its first form."""
+        source_results = {}
+        unresolved = list(forms_by_word.keys())
+        priority = 0
+        while len(unresolved) > 0:
+            word_forms = [(word, forms_by_word[word][priority]) for word in unresolved]
+            lookups = yield word_forms
+            priority += 1
+            unresolved = []
+            for word, form in word_forms:
+                result = lookups[(word, form)]
+                if isinstance(result, WordLookupException):
+                    source_results.setdefault(word, result)  # record the first failure
+                    if priority < len(forms_by_word[word]):
+                        unresolved.append(word)
+                else:
+                    source_results[word] = result
+
+        return source_results
+
+    def _resolve_fieldlist(self, word: Word,
+                           lookup_results: Dict[DataSource, Dict[Word, Union[LookupData, WordLookupException]]]) \
+            -> CardData:
         data_by_source = {}
         failures_by_source = {}
         for datasource in self.datasource_by_name.values():
-            for form in word:
-                try:
-                    data_by_source[datasource] = datasource.lookup_word(word, form)
-                    break  # if we find something, we're done
-                except WordLookupException as ex:
-                    if datasource not in failures_by_source:  # record the first failure
-                        failures_by_source[datasource] = ex
+            result = lookup_results[datasource][word]
+            if isinstance(result, WordLookupException):
+                failures_by_source[datasource] = result
+            else:
+                data_by_source[datasource] = result
 
         data_by_source = self.mutator(data_by_source)
         resolved_fields = []
@@ -0,0 +1,129 @@
+import asyncio
+from argparse import ArgumentParser
+from logging import WARNING
+from typing import List, Tuple, Iterable
+
+from cardbuilder.common import languages
+from cardbuilder.common.util import log, loading_bar
+from cardbuilder.exceptions import WordLookupException, CardBuilderUsageException
+from cardbuilder.input.input_list import InputList
+from cardbuilder.input.instantiable import instantiable_word_lists
+from cardbuilder.input.word import Word, WordForm
+from cardbuilder.lookup.data_source import WebApiDataSource, AggregatingDataSource
+from cardbuilder.lookup.instantiable import instantiable_data_sources
+from cardbuilder.scripts.helpers import log_failed_resolutions
+from cardbuilder.scripts.router import command
+
+
+async def prefetch_words(data_source: WebApiDataSource, words: Iterable[Word]) \
+        -> Tuple[int, int, List[Tuple[Word, BaseException]]]:
+    """Looks up words in a web API data source concurrently so that their content ends up in its cache. Each word's
+    forms are tried in order until one is found, as they would be when building cards, and forms that are already
+    cached aren't queried again.
+
+    Args:
+        data_source: the data source whose cache to fill. Its max_concurrency and max_requests_per_second bound how
+        many API queries are made at once and how quickly they're made.
+        words: the words to look up.
+
+    Returns: the number of words that were found, the number that weren't, and the words whose lookups failed for any
+    other reason (such as a network error), with the exception they failed with.
+    """
+    async def prefetch_word(word: Word) -> bool:
+        for form in dict.fromkeys(word):
+            try:
+                await data_source.alookup_word(word, form)
+                return True
+            except WordLookupException:
+                pass
+
+        return False
+
+    words = list(words)
+    found, missing, failures = 0, 0, []
+    lookups = [asyncio.ensure_future(prefetch_word(word)) for word in words]
+    try:
+        for word, lookup in zip(words, loading_bar(lookups, 'prefetching {}'.format(type(data_source).__name__))):
+            try:
+                if await lookup:
+                    found += 1
+                else:
+                    missing += 1
+            except Exception as ex:
+                failures.append((word, ex))
+    finally:
+        data_source.flush_cache()
+
+    return found, missing, failures
+
+
+@command('prefetch')
+def main():
+    """
+    Fills the caches of web API data sources for a list of words ahead of time, querying several words at once, so that
+    building cards for those words later doesn't need to wait on (or have access to) the internet.
+
+    Supports the following arguments:
+
+    --input     The input list of words to prefetch; can be a text file or the name of a WordList.
+    --language  The language of the words in the input file. Not needed for WordLists.
+    --start     (Optional) an integer specifying the beginning of the range of input words to prefetch.
+    --stop      (Optional) an integer specifying the end of the range of input words to prefetch.
+    --concurrency   (Optional) the maximum number of queries to make to each data source at once.
+    --rate      (Optional) the maximum number of queries to make to each data source per second.
+
+    Followed by the names of the data sources to prefetch, such as ``jisho``.
+
+    Used like ``cardbuilder prefetch --input words.txt --language jpn --rate 5 jisho``.
+    """
+    parser = ArgumentParser()
+    parser.add_argument('--input', help='The location of a file to use for raw input or a reference to a wordlist',
+                        type=str, required=True)
+    parser.add_argument('--language', help='The language of the words in the input file',
+                        choices=[languages.ENGLISH, languages.JAPANESE, languages.HEBREW, languages.ESPERANTO])
+    parser.add_argument('--start', help='Index of first word to include', type=int)
+    parser.add_argument('--stop', help='Index of last word to include', type=int)
+    parser.add_argument('--concurrency', help='The maximum number of queries made to each data source at once',
+                        type=int)
+    parser.add_argument('--rate', help='The maximum number of queries made to each data source per second',
+                        type=float)
+    parser.add_argument('sources', nargs='+', choices=list(instantiable_data_sources.keys()),
+                        help='The data sources to prefetch')
+    args = parser.parse_args()
+
+    if args.input in instantiable_word_lists:
+        words = instantiable_word_lists[args.input]()
+    elif args.language is None:
+        raise CardBuilderUsageException('Must provide --language when the input is a file')
+    else:
+        words = InputList(args.input, args.language, [WordForm.PHONETICALLY_EQUIVALENT])
+    words = list(words)[args.start:args.stop]
+
+    for source_name in args.sources:
+        data_source_class = instantiable_data_sources[source_name]
+        if not issubclass(data_source_class, (WebApiDataSource, AggregatingDataSource)):
+            log(None, '{} doesn\'t query a web API, so there is nothing to prefetch'.format(source_name), WARNING)
+            continue
+
+        # API keys and the like come from the config, as they do when building cards
+        data_source = data_source_class()
+        if isinstance(data_source, AggregatingDataSource):
+            # aggregated data is cached by the web API data sources being aggregated, so those are what's prefetched
+            web_api_data_sources = [(owned_data_source, '{} ({})'.format(source_name, type(owned_data_source).__name__))
+                                    for owned_data_source in data_source.get_owned_data_sources()
+                                    if isinstance(owned_data_source, WebApiDataSource)]
+            if len(web_api_data_sources) == 0:
+                log(None, '{} doesn\'t query a web API, so there is nothing to prefetch'.format(source_name), WARNING)
+        else:
+            web_api_data_sources = [(data_source, source_name)]
+
+        for web_api_data_source, name in web_api_data_sources:
+            if args.concurrency is not None:
+                web_api_data_source.set_max_concurrency(args.concurrency)
+            if args.rate is not None:
+                web_api_data_source.set_rate_limit(args.rate)
+
+            found, missing, failures = asyncio.run(prefetch_words(web_api_data_source, words))
+            log(None, 'Prefetched {} words for {}: {} found, {} not found, {} failed'.format(
+                len(words), name, found, missing, len(failures)))
+            log_failed_resolutions(failures)
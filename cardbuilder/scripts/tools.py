@@ -1,9 +1,14 @@
 import glob
 import os
 import sys
+from pathlib import Path
 
+from cardbuilder.common.compiled_dictionary import CompiledDictionary
 from cardbuilder.common.config import Config
+from cardbuilder.common.database import Database
 from cardbuilder.common.util import DATABASE_NAME, InDataDir, log
+from cardbuilder.lookup.data_source import AggregatingDataSource, WebApiDataSource
+from cardbuilder.lookup.instantiable import instantiable_data_sources
 from cardbuilder.scripts.router import command, commands
 
 
@@ -51,17 +56,112 @@ def view_conf() -> None:
     print(Config.get_conf())
 
 
+def _remove_database_files(path: Path):
+    for filename in (str(path), str(path) + '-wal', str(path) + '-shm', str(path) + '-journal'):
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
 @command('purge_db')
 def purge_database() -> None:
     """
-    Deletes Cardbuilder's local database, clearing the config and any cached content.
+    Deletes all of Cardbuilder's local databases, clearing the config and any cached or ingested content.
 
     Used like ``cardbuilder purge_db``
     """
     _confirm_intent('purge cardbuilder\'s entire local database')
 
+    Database.close()
     with InDataDir():
-        os.remove(DATABASE_NAME)
+        for filename in [DATABASE_NAME] + glob.glob('*' + Database.extension):
+            _remove_database_files(Path(filename).absolute())
+        for filename in glob.glob('*' + CompiledDictionary.extension):
+            os.remove(filename)
+
+
+@command('purge_source')
+def purge_source() -> None:
+    """
+    Deletes the local database of a single data source, such as its cached web content or ingested dictionary data,
+    without touching any other data source. The data will be cached or ingested again the next time it is used.
+
+    Used like ``cardbuilder purge_source <data source>``, where the data source is a name like ``jisho``.
+    """
+    if len(sys.argv) < 2:
+        print('Please pass in the name of the data source to purge, like "purge_source jisho"')
+        return
+
+    source_name = sys.argv[1]
+    if source_name in instantiable_data_sources:
+        data_source_class = instantiable_data_sources[source_name]
+        if issubclass(data_source_class, AggregatingDataSource):
+            print('{} keeps its data in other data sources; please purge those instead'.format(source_name))
+            return
+        database_name = data_source_class.get_database_name()
+        legacy_tables = data_source_class.legacy_tables()
+    else:
+        database_name = source_name
+        legacy_tables = []
+
+    path = Database.path(database_name)
+    if not path.exists() and len(legacy_tables) == 0:
+        print('Found no database for {} at {}'.format(source_name, path))
+        return
+
+    _confirm_intent('delete all local data for {}'.format(source_name))
+    Database.delete(database_name)
+    # left in the main database by earlier versions, if the data source hasn't been used since
+    for table_name in legacy_tables:
+        Database.connect().execute('DROP TABLE {}'.format(table_name))
+    Database.connect().commit()
+    compiled_path = CompiledDictionary.path(database_name)
+    if compiled_path.exists():
+        compiled_path.unlink()
+
+
+@command('purge_misses')
+def purge_misses() -> None:
+    """
+    Deletes the cached misses of a web API data source, so that words it previously couldn't find are queried again
+    the next time they're looked up. Content that was found stays cached.
+
+    Used like ``cardbuilder purge_misses <data source>``, where the data source is a name like ``jisho``.
+    """
+    if len(sys.argv) < 2:
+        print('Please pass in the name of the data source whose misses you would like to purge, like '
+              '"purge_misses jisho"')
+        return
+
+    source_name = sys.argv[1]
+    data_source_class = instantiable_data_sources.get(source_name)
+    if data_source_class is None or not issubclass(data_source_class, WebApiDataSource):
+        print('{} is not a web API data source, so it doesn\'t cache misses'.format(source_name))
+        return
+
+    print('Purged {} cached misses for {}'.format(data_source_class.delete_negative_cache_entries(), source_name))
+
+
+@command('recompress_cache')
+def recompress_cache() -> None:
+    """
+    Recompresses the cached content of a web API data source with a compression dictionary trained on that content,
+    which shrinks the cache and speeds up reading from it. Content cached from then on is compressed the same way.
+
+    Used like ``cardbuilder recompress_cache <data source>``, where the data source is a name like ``jisho``.
+    """
+    if len(sys.argv) < 2:
+        print('Please pass in the name of the data source whose cache you would like to recompress, like '
+              '"recompress_cache jisho"')
+        return
+
+    source_name = sys.argv[1]
+    data_source_class = instantiable_data_sources.get(source_name)
+    if data_source_class is None or not issubclass(data_source_class, WebApiDataSource):
+        print('{} is not a web API data source, so it has no cache to recompress'.format(source_name))
+        return
+
+    size_before, size_after = data_source_class.recompress_cache()
+    print('Recompressed the cache for {} from {} to {} bytes'.format(source_name, size_before, size_after))
 
 
 @command('purge_conf')
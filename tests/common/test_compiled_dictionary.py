@@ -0,0 +1,66 @@
+import pytest
+
+from cardbuilder.common.compiled_dictionary import CompiledDictionary
+from cardbuilder.common.database import Database
+from cardbuilder.common.fieldnames import Fieldname
+from cardbuilder.common.languages import ENGLISH
+from cardbuilder.exceptions import CardBuilderException
+from cardbuilder.input.word import Word
+from tests.resolution.test_resolution_engine import DummyDictionary
+
+
+class TestCompiledDictionary:
+
+    def test_write_and_read(self, tmp_path):
+        entries = {'Run': 'to move quickly', 'dog': 'a cute pupper', 'run': 'an act of running', '犬': 'いぬ'}
+        path = tmp_path / 'test.dict'
+        assert CompiledDictionary.write(path, sorted(entries.items(), key=lambda x: x[0].encode('utf-8'))) == 4
+
+        dictionary = CompiledDictionary(path)
+        assert len(dictionary) == 4
+        for key, content in entries.items():
+            assert dictionary.get(key) == content
+        assert dictionary.get('cat') is None
+        assert 'RUN' not in dictionary
+        assert dictionary.get_many(['dog', '犬', 'cat']) == {'dog': 'a cute pupper', '犬': 'いぬ'}
+        dictionary.close()
+
+        with pytest.raises(CardBuilderException):
+            CompiledDictionary.write(tmp_path / 'unsorted.dict', [('run', ''), ('dog', '')])
+        assert not (tmp_path / 'unsorted.dict').exists()
+
+    def test_external_data_source(self):
+        data_source = DummyDictionary()
+        assert data_source.compiled_dictionary_path().exists()
+        assert data_source._compiled_dictionary is not None
+
+        dog = Word('dog', ENGLISH)
+        compiled_results = data_source.lookup_words([(dog, 'dog'), (dog, 'Run'), (dog, 'cat')])
+        data_source._compiled_dictionary = None
+        data_source.set_lookup_cache(max_entries=0)
+        sqlite_results = data_source.lookup_words([(dog, 'dog'), (dog, 'Run'), (dog, 'cat')])
+
+        for form in ('dog', 'Run'):
+            assert compiled_results[(dog, form)][Fieldname.DEFINITIONS] == \
+                   sqlite_results[(dog, form)][Fieldname.DEFINITIONS]
+        assert isinstance(compiled_results[(dog, 'cat')], type(sqlite_results[(dog, 'cat')]))
+
+    def test_adopted_table(self):
+        default_table = DummyDictionary().default_table
+        database_name = DummyDictionary.get_database_name()
+        Database.forget(database_name)
+        Database.attach(database_name)
+
+        # a table with no manifest is adopted as it is, so what was compiled from it before can't be trusted
+        conn = Database.connect(database_name)
+        conn.execute('UPDATE {} SET content=? WHERE word=?'.format(default_table), ('a good boy', 'dog'))
+        conn.execute('DELETE FROM {}.{}'.format(database_name, DummyDictionary.manifest_table_name))
+        conn.commit()
+
+        data_source = DummyDictionary()
+        assert data_source._compiled_dictionary is not None
+        assert data_source.lookup_word(Word('dog', ENGLISH), 'dog')[Fieldname.DEFINITIONS].get_data() == 'a good boy'
+
+        data_source._compiled_dictionary.close()
+        Database.delete(database_name)
+        data_source.compiled_dictionary_path().unlink()
@@ -0,0 +1,101 @@
+import sqlite3
+from threading import Thread
+
+import pytest
+
+from cardbuilder.common.database import Database
+from cardbuilder.exceptions import CardBuilderException
+
+
+class TestDatabase:
+
+    def test_per_thread_connections(self):
+        conn = Database.connect()
+        assert Database.connect() is conn
+
+        other_thread_conns = []
+        thread = Thread(target=lambda: other_thread_conns.append(Database.connect()))
+        thread.start()
+        thread.join()
+
+        assert other_thread_conns[0] is not conn
+
+    def test_pragmas(self):
+        conn = Database.connect()
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == Database.busy_timeout_ms
+
+    def test_attach_and_seal(self):
+        Database.attach('database_test')
+        conn = Database.connect('database_test')
+        conn.execute('CREATE TABLE IF NOT EXISTS database_test.vals(val TEXT)')
+        conn.execute('DELETE FROM database_test.vals')
+        conn.execute('INSERT INTO database_test.vals VALUES (?)', ('dog',))
+        conn.commit()
+
+        Database.seal('database_test')
+        conn = Database.connect('database_test')
+        assert conn.execute('SELECT val FROM database_test.vals').fetchall() == [('dog',)]
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute('INSERT INTO database_test.vals VALUES (?)', ('cat',))
+
+        Database.forget('database_test')
+        Database.path('database_test').unlink()
+
+    def test_attach_limit(self):
+        names = ['database_limit_test_{}'.format(i) for i in range(15)]
+        for name in names:
+            Database.attach(name)
+            Database.connect(name).execute('CREATE TABLE IF NOT EXISTS {}.vals(val TEXT)'.format(name))
+
+        for name in names:
+            assert Database.connect(name).execute('SELECT COUNT(*) FROM {}.vals'.format(name)).fetchone()[0] == 0
+
+        for name in names:
+            Database.forget(name)
+            Database.path(name).unlink()
+
+    def test_bulk_load(self):
+        Database.attach('bulk_load_test', journal_mode='DELETE')
+        conn = Database.connect('bulk_load_test')
+        conn.execute('CREATE TABLE IF NOT EXISTS bulk_load_test.vals(val TEXT)')
+        conn.execute('DELETE FROM bulk_load_test.vals')
+        conn.commit()
+
+        with Database.bulk_load('bulk_load_test') as conn:
+            assert conn.execute('PRAGMA bulk_load_test.journal_mode').fetchone()[0] == 'memory'
+            conn.executemany('INSERT INTO bulk_load_test.vals VALUES (?)', (('val{}'.format(i),) for i in range(100)))
+
+        with pytest.raises(ValueError):
+            with Database.bulk_load('bulk_load_test') as conn:
+                conn.execute('INSERT INTO bulk_load_test.vals VALUES (?)', ('rolled back',))
+                raise ValueError()
+
+        assert conn.execute('SELECT COUNT(*) FROM bulk_load_test.vals').fetchone()[0] == 100
+        assert conn.execute('PRAGMA bulk_load_test.journal_mode').fetchone()[0] == 'delete'
+        assert conn.execute('PRAGMA bulk_load_test.synchronous').fetchone()[0] == 2
+
+        Database.forget('bulk_load_test')
+        Database.path('bulk_load_test').unlink()
+
+    def test_attach_limit_in_transaction(self):
+        names = ['database_limit_test_{}'.format(i) for i in range(15)]
+        for name in names:
+            Database.attach(name)
+            Database.connect(name).execute('CREATE TABLE IF NOT EXISTS {}.vals(val TEXT)'.format(name))
+
+        conn = Database.connect(names[0])
+        conn.execute('DELETE FROM {}.vals'.format(names[0]))
+        conn.commit()
+
+        # making room for the other databases would mean committing this, so attaching them fails instead
+        conn.execute('INSERT INTO {}.vals VALUES (?)'.format(names[0]), ('uncommitted',))
+        with pytest.raises(CardBuilderException):
+            for name in names:
+                Database.connect(name)
+
+        conn.rollback()
+        assert conn.execute('SELECT COUNT(*) FROM {}.vals'.format(names[0])).fetchone()[0] == 0
+
+        for name in names:
+            Database.delete(name)
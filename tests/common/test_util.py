@@ -0,0 +1,116 @@
+import bz2
+import gzip
+import hashlib
+import io
+import tarfile
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from threading import Thread
+
+import pytest
+
+from cardbuilder.common.util import download_and_extract_to_file, download_to_file_with_loading_bar, run_downloads
+from cardbuilder.exceptions import CardBuilderException
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class FlakyRangeHandler(QuietHandler):
+    """Serves byte ranges, and drops the connection halfway through the first response it sends."""
+    served_dir = None
+    requested_ranges = []
+
+    def do_GET(self):
+        content = (self.served_dir / self.path.lstrip('/')).read_bytes()
+        start = int(self.headers['Range'][len('bytes='):-1]) if 'Range' in self.headers else 0
+        type(self).requested_ranges.append(start)
+        self.send_response(206 if start > 0 else 200)
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+        if len(type(self).requested_ranges) == 1:
+            self.wfile.write(content[start:len(content) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(content[start:])
+
+
+@pytest.fixture
+def file_server(tmp_path):
+    served_dir = tmp_path / 'served'
+    served_dir.mkdir()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=str(served_dir)))
+    yield from serve(server, served_dir)
+
+
+@pytest.fixture
+def flaky_file_server(tmp_path):
+    served_dir = tmp_path / 'served'
+    served_dir.mkdir()
+    FlakyRangeHandler.requested_ranges = []
+    FlakyRangeHandler.served_dir = served_dir
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyRangeHandler)
+    yield from serve(server, served_dir)
+
+
+def serve(server, served_dir):
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield served_dir, 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+
+
+class TestDownloads:
+    content = ''.join('{}\t犬が走る。\r\n'.format(i) for i in range(100000))
+
+    def test_plain_and_compressed(self, file_server, tmp_path):
+        served_dir, base_url = file_server
+        encoded = self.content.encode('utf-8')
+        (served_dir / 'plain.tsv').write_bytes(encoded)
+        (served_dir / 'sentences.tsv.bz2').write_bytes(bz2.compress(encoded))
+        (served_dir / 'sentences.tsv.gz').write_bytes(gzip.compress(encoded))
+
+        download_to_file_with_loading_bar(base_url + 'plain.tsv', str(tmp_path / 'plain.tsv'))
+        assert (tmp_path / 'plain.tsv').read_bytes() == encoded
+        for name in ('sentences.tsv.bz2', 'sentences.tsv.gz'):
+            filename = str(tmp_path / name) + '.out'
+            download_and_extract_to_file(base_url + name, filename)
+            assert open(filename, 'rb').read() == encoded
+
+    def test_tar_member_and_encoding(self, file_server, tmp_path):
+        served_dir, base_url = file_server
+        encoded = self.content.encode('shift_jisx0213')
+        with tarfile.open(served_dir / 'archive.tar.gz', 'w:gz') as archive:
+            for name, data in (('readme.txt', b'hello'), ('gene.txt', encoded)):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+
+        filename = str(tmp_path / 'gene_dict.txt')
+        download_and_extract_to_file(base_url + 'archive.tar.gz', filename, member='gene.txt',
+                                     source_encoding='shift_jisx0213')
+        assert open(filename, 'rb').read() == self.content.encode('utf-8')
+
+    def test_failed_download(self, file_server, tmp_path):
+        _, base_url = file_server
+        filename = str(tmp_path / 'missing.tsv')
+        with pytest.raises(Exception):
+            download_and_extract_to_file(base_url + 'missing.tsv.bz2', filename)
+        assert list(tmp_path.glob('missing.tsv*')) == []
+
+    def test_resume_and_checksum(self, flaky_file_server, tmp_path):
+        served_dir, base_url = flaky_file_server
+        encoded = self.content.encode('utf-8')
+        (served_dir / 'links.csv').write_bytes(encoded)
+
+        filename = str(tmp_path / 'links.csv')
+        with pytest.raises(CardBuilderException):
+            download_to_file_with_loading_bar(base_url + 'links.csv', filename, sha256='0' * 64)
+        assert FlakyRangeHandler.requested_ranges == [0, len(encoded) // 2]
+        assert list(tmp_path.glob('links.csv*')) == []
+
+        run_downloads([partial(download_to_file_with_loading_bar, base_url + 'links.csv', filename,
+                               hashlib.sha256(encoded).hexdigest())])
+        assert open(filename, 'rb').read() == encoded
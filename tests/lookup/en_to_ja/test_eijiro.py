@@ -1,6 +1,8 @@
 import pytest
 
 from cardbuilder.common.config import Config
+from cardbuilder.common.database import Database
+from cardbuilder.common.fieldnames import Fieldname
 from cardbuilder.common.languages import ENGLISH
 from cardbuilder.input.word import Word
 from cardbuilder.lookup.data_source import DataSource
@@ -26,3 +28,106 @@ class TestEijiro(DataSourceTest):
 
         print('debug')
         #TODO: flesh out this test, add a test for words with links (previously caused problems)
+
+
+class LocalEijiro(Eijiro):
+    database_name = 'eijiro_test'
+    eijiro_conf_value = 'eijiro_test_loaded'
+    lines = [
+        '■dog {名} : 犬■・The dog barks.',
+        '■dog {動-1} : 〔人の〕後を付ける',
+        '■Dog : ドッグ（人名）',
+        '■The : ザ',
+        '■the : その',
+        '■THE : 〔略〕テスト',
+        '■cat : 猫、＝<→kitty>',
+        '■kitty : 子猫【＠】キティ',
+        '■kitten : ＝<→kitty>',
+        '■puppy : 子犬、＝<→doggo>',
+    ]
+
+
+class TestEijiroIngestion:
+
+    def test_chunked_ingestion(self, tmp_path):
+        eijiro_file = tmp_path / 'eijiro.txt'
+        eijiro_file.write_bytes(''.join(line + '\r\n' for line in LocalEijiro.lines).encode(Eijiro.encoding))
+        data_source = LocalEijiro(str(eijiro_file))
+
+        dog_data = data_source.lookup_word(Word('Dog', ENGLISH), 'dog')  # stored under its lowercase headword
+        assert dog_data[Fieldname.DEFINITIONS].to_primitive() == [(['犬'], '名'), (['〔人の〕後を付ける'], '動詞形'),
+                                                                (['ドッグ（人名）'], None)]
+        assert dog_data[Fieldname.EXAMPLE_SENTENCES].to_primitive() == [(['The dog barks.'], '名')]
+        assert data_source.lookup_word(Word('the', ENGLISH), 'the')[Fieldname.DEFINITIONS].to_primitive() == \
+               [(['ザ', 'その', '〔略〕テスト'], None)]
+        cat_data = data_source.lookup_word(Word('cat', ENGLISH), 'cat')
+        assert [link[Fieldname.DEFINITIONS].to_primitive() for link in cat_data[Fieldname.LINKS].get_data()] == \
+               [[(['子猫'], None)]]
+        kitten_data = data_source.lookup_word(Word('kitten', ENGLISH), 'kitten')
+        assert kitten_data[Fieldname.DEFINITIONS].to_primitive() == [(['子猫'], None)]  # filled in from the link
+
+        # entries straddling chunk boundaries, wherever they fall, come out the same as from reading the whole file
+        data_source.ingestion_processes = 1
+        expected_entries = list(data_source._read_and_convert_data())
+        assert [word for word, _ in expected_entries] == ['dog', 'the', 'cat', 'kitty', 'kitten', 'puppy']
+        for chunk_size in range(1, eijiro_file.stat().st_size + 1):
+            data_source.ingestion_chunk_size = chunk_size
+            assert list(data_source._read_and_convert_data()) == expected_entries
+
+        data_source.ingestion_processes, data_source.ingestion_chunk_size = 2, 16
+        assert list(data_source._read_and_convert_data()) == expected_entries
+
+    def test_link_resolution(self, tmp_path):
+        eijiro_file = tmp_path / 'eijiro.txt'
+        eijiro_file.write_bytes(''.join(line + '\r\n' for line in LocalEijiro.lines).encode(Eijiro.encoding))
+        data_source = LocalEijiro(str(eijiro_file))
+        data_source.set_lookup_cache(max_entries=0)
+
+        # links store the content they lead to, so following one doesn't look its target up again
+        link_targets_table = data_source._table_name(data_source.link_targets_table_name)
+        kitty_content = data_source.conn.execute('SELECT content FROM {} WHERE word=?'.format(
+            data_source.default_table), ('kitty',)).fetchone()[0]
+        assert sorted(data_source.conn.execute('SELECT target, word, content FROM {}'.format(
+            link_targets_table)).fetchall(), key=str) == [('doggo', None, None), ('kitty', 'kitty', kitty_content)]
+        followed_lookups = []
+        lookup_word = data_source.lookup_word
+        data_source.lookup_word = lambda word, form, following_link=False: \
+            followed_lookups.append(form) if following_link else lookup_word(word, form)
+
+        # links are only followed when their data is needed, and then only once per target. doggo is known to be missing
+        # without being searched for
+        cat_links = data_source.lookup_word(Word('cat', ENGLISH), 'cat')[Fieldname.LINKS]
+        assert not cat_links.resolved
+        data_source.lookup_word(Word('kitten', ENGLISH), 'kitten')  # has no definitions of its own, so follows its link
+        assert [link.found_form for link in cat_links.get_data()] == ['kitty']
+        assert Fieldname.LINKS not in data_source.lookup_word(Word('puppy', ENGLISH), 'puppy')
+        stats = data_source._link_cache.stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+        assert followed_lookups == []
+
+    def test_legacy_migration(self, tmp_path):
+        eijiro_file = tmp_path / 'eijiro.txt'
+        eijiro_file.write_bytes(''.join(line + '\r\n' for line in LocalEijiro.lines).encode(Eijiro.encoding))
+        expected_entries = sorted(LocalEijiro(str(eijiro_file))._read_and_convert_data())
+
+        # entries as they were stored unparsed in the main database, before each data source had a database of its own
+        Database.delete(LocalEijiro.database_name)
+        conn = Database.connect()
+        conn.execute('CREATE TABLE localeijiro(word TEXT PRIMARY KEY, content TEXT)')
+        conn.executemany('INSERT INTO localeijiro VALUES (?, ?)', [
+            ('dog', '名⦀犬■・The dog barks.⚬動詞形⦀〔人の〕後を付ける⚬ドッグ（人名）'),
+            ('the', 'ザ⚬その⚬〔略〕テスト'),
+            ('cat', '猫、＝<→kitty>'),
+            ('kitty', '子猫【＠】キティ'),
+            ('kitten', '＝<→kitty>'),
+            ('puppy', '子犬、＝<→doggo>')
+        ])
+        conn.commit()
+
+        # no input is needed, as the legacy entries are moved into the data source's own database and converted
+        data_source = LocalEijiro()
+        assert 'localeijiro' not in Database.tables()
+        assert sorted(data_source.conn.execute('SELECT word, content FROM {}'.format(
+            data_source.default_table))) == expected_entries
+        assert data_source.lookup_word(Word('kitten', ENGLISH), 'kitten')[Fieldname.DEFINITIONS].to_primitive() == \
+               [(['子猫'], None)]
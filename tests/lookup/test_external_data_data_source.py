@@ -0,0 +1,81 @@
+import os
+from pathlib import Path
+from typing import Iterable, Tuple, Optional
+
+from cardbuilder.common.database import Database
+from cardbuilder.common.fieldnames import Fieldname
+from cardbuilder.common.languages import ENGLISH
+from cardbuilder.common.util import InDataDir
+from cardbuilder.input.word import Word
+from cardbuilder.lookup.data_source import ExternalDataDataSource
+from cardbuilder.lookup.lookup_data import outputs, LookupData
+from cardbuilder.lookup.value import SingleValue
+
+
+@outputs({
+    Fieldname.DEFINITIONS: SingleValue
+})
+class FileDictionary(ExternalDataDataSource):
+    database_name = 'file_dictionary_test'
+    input_path = InDataDir.directory / 'file_dictionary_test.txt'
+    reads = 0
+
+    def _fetch_remote_files_if_necessary(self):
+        pass
+
+    def _input_path(self) -> Optional[Path]:
+        return self.input_path
+
+    def _read_and_convert_data(self) -> Iterable[Tuple[str, str]]:
+        type(self).reads += 1
+        with open(self.input_path, encoding='utf-8') as f:
+            for line in f:
+                yield tuple(line.rstrip('\n').split('\t'))
+
+    def parse_word_content(self, word: Word, form: str, content: str, following_link: bool = False) -> LookupData:
+        return self.lookup_data_type(word, form, content, {
+            Fieldname.DEFINITIONS: SingleValue(content)
+        })
+
+
+def definition(data_source: FileDictionary, form: str) -> str:
+    return data_source.lookup_word(Word(form, ENGLISH), form)[Fieldname.DEFINITIONS].get_data()
+
+
+class TestExternalDataDataSource:
+
+    def test_ingestion_manifest(self, monkeypatch):
+        Database.delete(FileDictionary.database_name)
+        with open(FileDictionary.input_path, 'w', encoding='utf-8') as f:
+            f.write('dog\ta cute pupper\n')
+
+        assert definition(FileDictionary(), 'dog') == 'a cute pupper'
+        FileDictionary()
+        assert FileDictionary.reads == 1
+
+        # touching the input doesn't change its content, so it isn't ingested again
+        os.utime(FileDictionary.input_path, (0, 0))
+        FileDictionary()
+        assert FileDictionary.reads == 1
+
+        with open(FileDictionary.input_path, 'w', encoding='utf-8') as f:
+            f.write('dog\ta good boy\n')
+        assert definition(FileDictionary(), 'dog') == 'a good boy'
+        assert FileDictionary.reads == 2
+
+        monkeypatch.setattr(FileDictionary, '_parser_version', staticmethod(lambda: 1))
+        FileDictionary()
+        assert FileDictionary.reads == 3
+
+        # an ingestion that never finished is redone
+        data_source = FileDictionary()
+        Database.attach(FileDictionary.database_name)
+        data_source.conn.execute('UPDATE file_dictionary_test.ingestion_manifest SET complete=0')
+        data_source.conn.commit()
+        FileDictionary()
+        assert FileDictionary.reads == 4
+
+        monkeypatch.setattr(FileDictionary, '_schema_version', staticmethod(lambda: 1))
+        assert definition(FileDictionary(), 'dog') == 'a good boy'
+        assert FileDictionary.reads == 5
+        assert data_source.get_table_rowcount() == 1
@@ -0,0 +1,98 @@
+import pytest
+
+from cardbuilder.common.fieldnames import Fieldname
+from cardbuilder.common.languages import ENGLISH
+from cardbuilder.exceptions import WordLookupException
+from cardbuilder.input.word import Word
+from cardbuilder.lookup.data_source import DataSource
+from cardbuilder.lookup.lookup_data import outputs, LookupData
+from cardbuilder.lookup.value import SingleValue
+
+
+@outputs({
+    Fieldname.DEFINITIONS: SingleValue
+})
+class CountingDataSource(DataSource):
+    definitions = {
+        'dog': 'a cute pupper',
+        'run': 'to move quickly'
+    }
+
+    def __init__(self):
+        self.lookups = []
+
+    def lookup_word(self, word: Word, form: str, following_link: bool = False) -> LookupData:
+        self.lookups.append(form)
+        if form not in self.definitions:
+            raise WordLookupException('No definition for {}'.format(form))
+
+        return self.parse_word_content(word, form, self.definitions[form])
+
+    def parse_word_content(self, word: Word, form: str, content: str, following_link: bool = False) -> LookupData:
+        return self.lookup_data_type(word, form, content, {
+            Fieldname.DEFINITIONS: SingleValue(content)
+        })
+
+
+class SuperCallingDataSource(CountingDataSource):
+    def lookup_word(self, word: Word, form: str, following_link: bool = False) -> LookupData:
+        return super().lookup_word(word, form, following_link)
+
+
+class TestLookupCache:
+
+    def test_hits_and_misses(self):
+        data_source = CountingDataSource()
+        dog = Word('dog', ENGLISH)
+        other_dog = Word('dog', ENGLISH)
+        cat = Word('cat', ENGLISH)
+
+        assert data_source.lookup_word(dog, 'dog')[Fieldname.DEFINITIONS].get_data() == 'a cute pupper'
+        cached_result = data_source.lookup_word(other_dog, 'dog')
+        assert cached_result.word is other_dog
+        for _ in range(2):
+            with pytest.raises(WordLookupException):
+                data_source.lookup_word(cat, 'cat')
+
+        batch_results = data_source.lookup_words([(dog, 'dog'), (cat, 'cat'), (dog, 'run')])
+        assert isinstance(batch_results[(cat, 'cat')], WordLookupException)
+        assert batch_results[(dog, 'run')][Fieldname.DEFINITIONS].get_data() == 'to move quickly'
+
+        assert data_source.lookups == ['dog', 'cat', 'run']
+        stats = data_source.get_lookup_cache().stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (4, 3, 3)
+
+    def test_results_changed_by_callers(self):
+        data_source = CountingDataSource()
+        dog = Word('dog', ENGLISH)
+
+        # callers such as data sources filling in links change the results they're given, which mustn't reach the cache
+        data_source.lookup_word(dog, 'dog')[Fieldname.DEFINITIONS] = SingleValue('changed')
+        data_source.lookup_words([(dog, 'run')])[(dog, 'run')][Fieldname.DEFINITIONS] = SingleValue('changed')
+        assert data_source.lookup_word(dog, 'dog')[Fieldname.DEFINITIONS].get_data() == 'a cute pupper'
+        assert data_source.lookup_word(dog, 'run')[Fieldname.DEFINITIONS].get_data() == 'to move quickly'
+        assert data_source.lookups == ['dog', 'run']
+
+    def test_eviction(self):
+        data_source = CountingDataSource()
+        data_source.set_lookup_cache(max_entries=1)
+        dog = Word('dog', ENGLISH)
+
+        data_source.lookup_word(dog, 'dog')
+        data_source.lookup_word(dog, 'run')
+        data_source.lookup_word(dog, 'dog')
+        assert data_source.lookups == ['dog', 'run', 'dog']
+        assert data_source.get_lookup_cache().evictions == 2
+
+        data_source.set_lookup_cache(max_bytes=1)
+        data_source.lookup_word(dog, 'dog')
+        assert len(data_source.get_lookup_cache()) == 0
+
+    def test_overrides_calling_super(self):
+        data_source = SuperCallingDataSource()
+        dog = Word('dog', ENGLISH)
+
+        data_source.lookup_word(dog, 'dog')
+        data_source.lookup_word(dog, 'dog')
+        assert data_source.lookups == ['dog']
+        assert data_source.get_lookup_cache().stats()['misses'] == 1
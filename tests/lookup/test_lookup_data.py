@@ -4,7 +4,7 @@ from cardbuilder.common.fieldnames import Fieldname
 from cardbuilder.common.languages import ENGLISH
 from cardbuilder.exceptions import CardBuilderUsageException
 from cardbuilder.input.word import Word
-from cardbuilder.lookup.lookup_data import outputs
+from cardbuilder.lookup.lookup_data import outputs, RawContentRetention
 from cardbuilder.lookup.value import ListValue, SingleValue
 
 
@@ -55,4 +55,21 @@ class TestLookupData:
                 Fieldname.DEFINITIONS: SingleValue('A great tool for acquiring and retaining new vocabulary')
             })
 
-
+    def test_raw_content_retention(self):
+        test_class = DummyDataSource.lookup_data_type
+        word = Word('flaschard', ENGLISH)
+        raw_content = '<html>{}</html>'.format('flashcard ' * 1000)
+
+        try:
+            for retention, retained_size in ((RawContentRetention.KEEP, len(raw_content)),
+                                             (RawContentRetention.COMPRESS, 100),
+                                             (RawContentRetention.DROP, 0)):
+                test_class.raw_content_retention = retention
+                test_data = test_class(word, word.input_form, raw_content, {
+                    Fieldname.PART_OF_SPEECH: SingleValue('noun')
+                })
+                assert len(test_data.get_retained_raw_content() or '') <= retained_size
+                assert test_data.get_raw_content() == (raw_content if retention != RawContentRetention.DROP else None)
+                assert test_data[Fieldname.PART_OF_SPEECH].get_data() == 'noun'
+        finally:
+            del test_class.raw_content_retention
@@ -1,7 +1,9 @@
 import pytest
 
+from cardbuilder.common.database import Database
 from cardbuilder.common.fieldnames import Fieldname
 from cardbuilder.common.languages import JAPANESE, ENGLISH, HEBREW
+from cardbuilder.common.util import InDataDir
 from cardbuilder.exceptions import WordLookupException
 from cardbuilder.input.word import Word
 from cardbuilder.lookup.data_source import DataSource
@@ -29,3 +31,122 @@ class TestTatoeba(DataSourceTest):
 
         with pytest.raises(WordLookupException):
             data_source.lookup_word(Word('עברית', HEBREW), 'עברית')
+
+
+class LocalTatoeba(TatoebaExampleSentences):
+    """Reads a handful of sentences from local files into its own database, so ingestion can be tested offline."""
+    database_name = 'tatoeba_test'
+    links_table_name_formatstring = 'tatoeba_test.tatoeba_links_{}_{}'
+    sentences_table_name_formatstring = 'tatoeba_test.tatoeba_{}_sentences'
+    postings_table_name_formatstring = 'tatoeba_test.tatoeba_{}_{}_postings'
+    links_file = 'tatoeba_test_links.csv'
+    sentences_filename_template = 'tatoeba_test_{}_sentences.tsv'
+
+    sentences = {
+        ENGLISH: {1: 'The dog runs.', 2: 'It is hot today.', 3: 'My dog is hot.', 4: 'Nobody translated this.'},
+        JAPANESE: {11: '犬が走る。', 12: '今日は暑い。', 13: '私の犬は暑い。'}
+    }
+    links = [(1, 11), (2, 12), (3, 13), (4, 99)]  # 99 is a sentence in some other language
+
+    @classmethod
+    def write_files(cls):
+        with InDataDir():
+            for lang, sentences in cls.sentences.items():
+                with open(cls.sentences_filename_template.format(lang), 'w', encoding='utf-8') as f:
+                    f.writelines('{}\t{}\t{}\n'.format(ident, lang, sentence) for ident, sentence in sentences.items())
+            with open(cls.links_file, 'w', encoding='utf-8') as f:
+                f.writelines('{}\t{}\n{}\t{}\n'.format(src, target, target, src) for src, target in cls.links)
+
+
+class TestTatoebaIngestion:
+
+    def test_local_lookup(self):
+        Database.delete(LocalTatoeba.database_name)
+        LocalTatoeba.write_files()
+        for source_lang, target_lang, form in ((ENGLISH, JAPANESE, 'dog'), (JAPANESE, ENGLISH, '犬')):
+            data_source = LocalTatoeba(source_lang, target_lang)
+            sentence_pairs = data_source.lookup_word(Word(form, source_lang), form)[
+                Fieldname.EXAMPLE_SENTENCES].get_data()
+            assert sorted(pair[0].get_data() for pair in sentence_pairs) == \
+                   sorted(sentence for sentence in LocalTatoeba.sentences[source_lang].values() if form in sentence)
+
+        with pytest.raises(WordLookupException):
+            data_source.lookup_word(Word('猫', JAPANESE), '猫')
+
+        # only links within the language pair are kept, and both directions share them
+        assert data_source.links_table_name == LocalTatoeba(ENGLISH, JAPANESE).links_table_name
+        assert data_source.get_table_rowcount(data_source.links_table_name) == 6
+
+    def test_lazy_index(self, monkeypatch):
+        LocalTatoeba.write_files()
+        LocalTatoeba(ENGLISH, JAPANESE)
+
+        def fail():
+            raise AssertionError('sentences were read although the index was already built')
+        monkeypatch.setattr(LocalTatoeba, '_read_source_sents', lambda self: fail())
+        assert LocalTatoeba(ENGLISH, JAPANESE).lookup_word(Word('hot', ENGLISH), 'hot')
+
+    def test_ranked_sentences(self):
+        LocalTatoeba.write_files()
+        data_source = LocalTatoeba(ENGLISH, JAPANESE)
+        dog = Word('dog', ENGLISH)
+
+        sentence_pairs = data_source.lookup_word(dog, 'dog')[Fieldname.EXAMPLE_SENTENCES].get_data()
+        assert [pair[0].get_data() for pair in sentence_pairs] == ['The dog runs.', 'My dog is hot.']
+        sentence_pairs = data_source.lookup_word(dog, 'dog', max_sentences=1)[Fieldname.EXAMPLE_SENTENCES].get_data()
+        assert [(source.get_data(), target.get_data()) for source, target in sentence_pairs] == \
+               [('The dog runs.', '犬が走る。')]
+
+    def test_untranslated_sentences_unranked(self, monkeypatch):
+        # the shortest sentences with dog in them have no Japanese translation, so they mustn't take up its postings
+        monkeypatch.setattr(LocalTatoeba, 'sentences', {
+            ENGLISH: {**LocalTatoeba.sentences[ENGLISH], 5: 'A dog.', 6: 'Dog!'},
+            JAPANESE: LocalTatoeba.sentences[JAPANESE]
+        })
+        monkeypatch.setattr(LocalTatoeba, 'indexed_sentences_per_word', 2)
+        LocalTatoeba.write_files()
+        data_source = LocalTatoeba(ENGLISH, JAPANESE)
+
+        sentence_pairs = data_source.lookup_word(Word('dog', ENGLISH), 'dog')[Fieldname.EXAMPLE_SENTENCES].get_data()
+        assert [pair[0].get_data() for pair in sentence_pairs] == ['The dog runs.', 'My dog is hot.']
+
+    def test_parallel_tokenization(self):
+        LocalTatoeba.write_files()
+        data_source = LocalTatoeba(JAPANESE, ENGLISH)
+        sentences = list(LocalTatoeba.sentences[JAPANESE].items())
+
+        data_source.tokenizer_processes = 1
+        expected = list(data_source._compute_and_yield_index_data(sentences))
+        data_source.tokenizer_processes, data_source.tokenizer_chunk_size = 2, 1
+        assert list(data_source._compute_and_yield_index_data(sentences)) == expected
+        assert ('犬', 0, 11) in expected
+
+    def test_spilled_index(self):
+        LocalTatoeba.write_files()
+        data_source = LocalTatoeba(ENGLISH, JAPANESE)
+        sentences = list(LocalTatoeba.sentences[ENGLISH].items())
+
+        expected = list(data_source._compute_and_yield_index_data(sentences))
+        data_source.max_postings_in_memory, data_source.indexed_sentences_per_word = 1, 1
+        assert list(data_source._compute_and_yield_index_data(sentences)) == [
+            posting for posting in expected if posting[1] == 0]
+        data_source.indexed_sentences_per_word = LocalTatoeba.indexed_sentences_per_word
+        assert list(data_source._compute_and_yield_index_data(sentences)) == expected
+        assert ('dog', 1, 3) in expected
+
+    def test_links_follow_sentences(self, monkeypatch):
+        monkeypatch.setattr(LocalTatoeba, 'links', LocalTatoeba.links + [(5, 14)])
+        LocalTatoeba.write_files()
+        data_source = LocalTatoeba(ENGLISH, JAPANESE)
+        assert data_source.get_table_rowcount(data_source.links_table_name) == 6
+
+        # only the sentences change, but the links between the new sentences have to be kept now
+        monkeypatch.setattr(LocalTatoeba, 'sentences', {
+            ENGLISH: {**LocalTatoeba.sentences[ENGLISH], 5: 'The cat runs.'},
+            JAPANESE: {**LocalTatoeba.sentences[JAPANESE], 14: '猫が走る。'}
+        })
+        LocalTatoeba.write_files()
+        sentence_pairs = LocalTatoeba(ENGLISH, JAPANESE).lookup_word(Word('cat', ENGLISH), 'cat')[
+            Fieldname.EXAMPLE_SENTENCES].get_data()
+        assert [(source.get_data(), target.get_data()) for source, target in sentence_pairs] == \
+               [('The cat runs.', '猫が走る。')]
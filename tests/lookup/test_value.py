@@ -1,7 +1,7 @@
 import pytest
 
 from cardbuilder.exceptions import CardBuilderUsageException
-from cardbuilder.lookup.value import SingleValue, ListValue, MultiListValue
+from cardbuilder.lookup.value import SingleValue, ListValue, MultiListValue, LinksValue
 
 
 class TestValue:
@@ -42,4 +42,19 @@ class TestValue:
         # shouldn't throw an exception
         v3 = MultiListValue([
             (['dog', 'cat'], None)
-        ])
\ No newline at end of file
+        ])
+
+    def test_lazy_links_value(self):
+        resolutions = []
+
+        def resolve():
+            resolutions.append(1)
+            return ['linked data']
+
+        v4 = LinksValue(resolve)
+        assert not v4.resolved and not v4.is_empty()
+        assert v4.get_data() == ['linked data']
+        assert v4.get_data() == ['linked data']
+        assert v4.resolved and len(resolutions) == 1
+
+        assert LinksValue([]).is_empty()
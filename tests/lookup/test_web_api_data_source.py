@@ -0,0 +1,326 @@
+import asyncio
+import gc
+import sqlite3
+import sys
+import zlib
+from json import dumps, loads
+from threading import Lock
+from time import sleep, monotonic
+
+import pytest
+
+from cardbuilder.common.database import Database
+from cardbuilder.common.fieldnames import Fieldname
+from cardbuilder.common.languages import ENGLISH
+from cardbuilder.exceptions import WordLookupException
+from cardbuilder.input.word import Word, WordForm
+from cardbuilder.lookup.cache import WriteBehindBuffer
+from cardbuilder.lookup.data_source import WebApiDataSource, DataSource, AggregatingDataSource
+from cardbuilder.lookup.instantiable import instantiable_data_sources
+from cardbuilder.lookup.lookup_data import outputs, LookupData
+from cardbuilder.lookup.value import SingleValue, LinksValue
+from cardbuilder.scripts import prefetch
+from cardbuilder.scripts.prefetch import prefetch_words
+from tests.lookup.data_source_test import DataSourceTest
+
+
+@outputs({
+    Fieldname.DEFINITIONS: SingleValue
+})
+class DummyWebApi(WebApiDataSource):
+    lookup_cache_entries = 0  # these tests are about the database cache, so skip the in-process one
+    definitions = {
+        'dog': 'a cute pupper',
+        'run': 'to move quickly'
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.parses = 0
+        self.lock = Lock()
+
+    def _query_api(self, form: str) -> str:
+        if form == 'offline':
+            raise ConnectionError('Failed to query for {}'.format(form))
+
+        with self.lock:
+            self.queries.append(form)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+
+        return dumps(self.definitions.get(form))
+
+    def parse_word_content(self, word: Word, form: str, content: str, following_link: bool = False) -> LookupData:
+        self.parses += 1
+        definition = loads(content)
+        if definition is None:
+            raise WordLookupException('No definition for {}'.format(form))
+
+        return self.lookup_data_type(word, form, content, {
+            Fieldname.DEFINITIONS: SingleValue(definition)
+        })
+
+
+class DummyThesaurusWebApi(DummyWebApi):
+    pass
+
+
+@outputs({
+    Fieldname.DEFINITIONS: SingleValue,
+    Fieldname.LINKS: LinksValue
+})
+class DummyLinkingWebApi(DummyWebApi):
+    links = {'dog': ['run']}
+
+    def parse_word_content(self, word: Word, form: str, content: str, following_link: bool = False) -> LookupData:
+        output = super().parse_word_content(word, form, content, following_link)
+        if form in self.links and not following_link:
+            output[Fieldname.LINKS] = LinksValue([self.lookup_word(word, target, following_link=True)
+                                                  for target in self.links[form]])
+        return output
+
+
+class DummyAggregatingDataSource(AggregatingDataSource):
+    def __init__(self):
+        self.dictionary = DummyWebApi()
+        self.thesaurus = DummyThesaurusWebApi()
+
+    def lookup_word(self, word: Word, form: str, following_link: bool = False) -> LookupData:
+        raise NotImplementedError()
+
+
+def empty_dummy_web_api() -> DummyWebApi:
+    gc.collect()  # make sure earlier instances are gone, so their buffered cache writes can't land after emptying
+    data_source = DummyWebApi()
+    data_source.conn.execute('DELETE FROM {}'.format(data_source.default_table))
+    data_source.conn.commit()
+    return data_source
+
+
+class TestWebApiDataSource(DataSourceTest):
+
+    def get_data_source(self) -> DataSource:
+        return empty_dummy_web_api()
+
+    def test_cache(self):
+        data_source = empty_dummy_web_api()
+        dog = Word('dog', ENGLISH)
+
+        first_result = data_source.lookup_word(dog, 'dog')
+        second_result = data_source.lookup_word(dog, 'dog')
+        assert first_result[Fieldname.DEFINITIONS] == second_result[Fieldname.DEFINITIONS]
+        assert data_source.queries == ['dog']
+
+        data_source.set_cache_retrieval(False)
+        data_source.lookup_word(dog, 'dog')
+        assert data_source.queries == ['dog', 'dog']
+
+    def test_async_lookup(self):
+        data_source = empty_dummy_web_api()
+        data_source.set_max_concurrency(4)
+        words = [Word(form, ENGLISH) for form in ['dog', 'run'] + ['missing{}'.format(i) for i in range(20)]]
+        word_forms = [(word, word.input_form) for word in words]
+
+        results = asyncio.run(data_source.alookup_words(word_forms))
+        assert results[word_forms[0]][Fieldname.DEFINITIONS].get_data() == 'a cute pupper'
+        assert results[word_forms[1]][Fieldname.DEFINITIONS].get_data() == 'to move quickly'
+        assert all(isinstance(results[word_form], WordLookupException) for word_form in word_forms[2:])
+        assert 1 < data_source.max_in_flight <= 4
+
+        # found forms are cached
+        asyncio.run(data_source.alookup_word(words[0], 'dog'))
+        assert data_source.queries.count('dog') == 1
+
+        with pytest.raises(WordLookupException):
+            asyncio.run(data_source.alookup_word(words[2], words[2].input_form))
+
+    def test_write_behind_cache(self):
+        data_source = empty_dummy_web_api()
+        data_source._cache_buffer.max_rows = 3
+        dog = Word('dog', ENGLISH)
+
+        data_source.lookup_word(dog, 'dog')
+        assert data_source.get_table_rowcount() == 0
+        # buffered entries are visible before they're written
+        assert data_source.lookup_words([(dog, 'dog')])[(dog, 'dog')][Fieldname.DEFINITIONS].get_data() == \
+               'a cute pupper'
+        assert data_source.queries == ['dog']
+
+        data_source.flush_cache()
+        assert data_source.get_table_rowcount() == 1
+
+        for form in ['run', 'cat', 'fish']:
+            data_source._cache_api_results({form: dumps(form)})
+        assert data_source.get_table_rowcount() == 4  # reaching max_rows flushes the buffer
+        assert len(data_source._cache_buffer) == 0
+
+        data_source._cache_buffer.max_delay = 0.05
+        data_source._cache_api_results({'bird': dumps('bird')})
+        sleep(0.5)
+        assert data_source.get_table_rowcount() == 5
+
+    def test_timed_flush_connections(self, monkeypatch):
+        data_source = empty_dummy_web_api()
+        flush_connections = []
+        write_rows = data_source._cache_buffer._write_rows
+
+        def recording_write_rows(rows):
+            write_rows(rows)
+            flush_connections.append(Database.connect())
+
+        monkeypatch.setattr(data_source._cache_buffer, '_write_rows', recording_write_rows)
+        data_source._cache_buffer.max_delay = 0.05
+        data_source._cache_api_results({'bird': dumps('bird')})
+        sleep(0.5)
+        assert data_source.get_table_rowcount() == 1
+        # the timer's thread is done with its connection once it has flushed
+        with pytest.raises(sqlite3.ProgrammingError):
+            flush_connections[0].execute('SELECT 1')
+
+        # clearing the buffer leaves nothing for the timer to do, so it's cancelled
+        data_source._cache_buffer.max_delay = 60
+        data_source._cache_api_results({'fish': dumps('fish')})
+        data_source._cache_buffer.clear()
+        assert data_source._cache_buffer._timer is None
+
+        # a buffer that's garbage collected doesn't write from whichever thread happens to collect it
+        written_rows = []
+        buffer = WriteBehindBuffer(written_rows.extend, max_delay=60)
+        buffer.add('fish', ('fish',))
+        del buffer
+        gc.collect()
+        assert written_rows == []
+
+    def test_negative_cache(self):
+        data_source = empty_dummy_web_api()
+        cat = Word('cat', ENGLISH)
+
+        for _ in range(2):
+            with pytest.raises(WordLookupException, match='No definition for cat'):
+                data_source.lookup_word(cat, 'cat')
+        assert isinstance(data_source.lookup_words([(cat, 'cat')])[(cat, 'cat')], WordLookupException)
+        assert data_source.queries == ['cat']
+
+        data_source.set_negative_cache_ttl(0.01)
+        sleep(0.02)
+        with pytest.raises(WordLookupException):
+            data_source.lookup_word(cat, 'cat')
+        assert data_source.queries == ['cat', 'cat']
+
+        data_source.set_negative_cache_ttl(None)
+        data_source.lookup_word(Word('dog', ENGLISH), 'dog')
+        assert data_source.purge_negative_cache() == 1
+        assert data_source.get_table_rowcount() == 1
+        with pytest.raises(WordLookupException):
+            data_source.lookup_word(cat, 'cat')
+        assert data_source.queries == ['cat', 'cat', 'dog', 'cat']
+
+    def test_parsed_cache(self):
+        data_source = empty_dummy_web_api()
+        dog = Word('dog', ENGLISH)
+
+        first_result = data_source.lookup_word(dog, 'dog')
+        second_result = data_source.lookup_word(dog, 'dog')
+        third_result = data_source.lookup_words([(dog, 'dog')])[(dog, 'dog')]
+        assert data_source.parses == 1
+        assert second_result[Fieldname.DEFINITIONS] == first_result[Fieldname.DEFINITIONS]
+        assert third_result[Fieldname.DEFINITIONS] == first_result[Fieldname.DEFINITIONS]
+        assert third_result.get_raw_content() == first_result.get_raw_content()
+
+        # a new parser version invalidates parsed data, which is parsed again from the raw response
+        data_source.flush_cache()
+        data_source._parser_version = lambda: 1
+        data_source.lookup_word(dog, 'dog')
+        data_source.lookup_word(dog, 'dog')
+        assert data_source.parses == 2
+        assert data_source.queries == ['dog']
+
+    def test_parsed_cache_links(self):
+        data_source = DummyLinkingWebApi()
+        data_source.conn.execute('DELETE FROM {}'.format(data_source.parsed_table))
+        data_source.conn.commit()
+        dog = Word('dog', ENGLISH)
+
+        # links can't be stored parsed, so data with them is parsed again every time, while data without them isn't
+        for _ in range(2):
+            assert [link.found_form for link in data_source.lookup_word(dog, 'dog')[Fieldname.LINKS].get_data()] == \
+                   ['run']
+            data_source.lookup_word(dog, 'run')
+        data_source.flush_cache()
+        assert data_source.conn.execute('SELECT word FROM {}'.format(data_source.parsed_table)).fetchall() == \
+               [(data_source.lookup_cache_key(dog, 'run'),)]
+
+    def test_compression_dictionary(self):
+        data_source = empty_dummy_web_api()
+        entries = {'word{}'.format(i): dumps({'meta': {'id': 'word{}'.format(i), 'offensive': False},
+                                             'hwi': {'hw': 'word{}'.format(i), 'prs': [{'mw': 'ˈwərd'}]},
+                                             'fl': 'noun', 'def': [{'sseq': [[['sense', {'sn': str(i)}]]]}]})
+                   for i in range(50)}
+        data_source._cache_api_results(entries)
+        data_source.flush_cache()
+
+        _, size_after = DummyWebApi.recompress_cache()
+        assert size_after < sum(len(zlib.compress(content.encode('utf-8'))) for content in entries.values())
+        assert data_source._query_cached_api_results('word7') == (entries['word7'], None)
+
+        # new instances compress with the trained dictionary
+        new_data_source = DummyWebApi()
+        assert new_data_source._compression_dictionary() is not None
+        new_data_source._cache_api_results({'word50': entries['word49']})
+        new_data_source.flush_cache()
+        assert data_source._query_cached_api_results_batch(['word50'])['word50'] == (entries['word49'], None)
+
+    def test_prefetch_command(self, monkeypatch, tmp_path):
+        for data_source_class in (DummyWebApi, DummyThesaurusWebApi):
+            Database.delete(data_source_class.get_database_name())
+        input_file = tmp_path / 'words.txt'
+        input_file.write_text('dog\nrun\ncat\n', encoding='utf-8')
+        monkeypatch.setitem(instantiable_data_sources, 'dummy-aggregating', DummyAggregatingDataSource)
+        monkeypatch.setattr(sys, 'argv', ['prefetch', '--input', str(input_file), '--language', ENGLISH,
+                                          'dummy-aggregating'])
+
+        # aggregating data sources are prefetched through the web API data sources they own
+        prefetch.main()
+        for data_source_class in (DummyWebApi, DummyThesaurusWebApi):
+            data_source = data_source_class()
+            assert data_source.get_table_rowcount() == 3
+            data_source.lookup_words([(Word(form, ENGLISH), form) for form in ('dog', 'run', 'cat')])
+            assert data_source.queries == []
+
+    def test_legacy_migration(self):
+        gc.collect()
+        Database.delete(DummyWebApi.get_database_name())
+        # responses as they were cached in the main database, before each data source had a database of its own
+        conn = Database.connect()
+        conn.execute('CREATE TABLE dummywebapi(word TEXT PRIMARY KEY, content BLOB)')
+        conn.execute('INSERT INTO dummywebapi VALUES (?, ?)', ('dog', zlib.compress(dumps('a cute pupper').encode())))
+        conn.commit()
+
+        data_source = DummyWebApi()
+        assert 'dummywebapi' not in Database.tables()
+        assert data_source.lookup_word(Word('dog', ENGLISH), 'dog')[Fieldname.DEFINITIONS].get_data() == \
+               'a cute pupper'
+        assert data_source.queries == []
+
+    def test_prefetch(self):
+        data_source = empty_dummy_web_api()
+        data_source.set_rate_limit(200)
+        words = [Word(form, ENGLISH, [WordForm.PHONETICALLY_EQUIVALENT]) for form in ['Dog', 'run', 'cat', 'offline']]
+
+        start = monotonic()
+        found, missing, failures = asyncio.run(prefetch_words(data_source, words))
+        assert (found, missing) == (2, 1)
+        assert [(word.input_form, type(ex)) for word, ex in failures] == [('offline', ConnectionError)]
+        assert monotonic() - start >= 4 / 200  # Dog, dog, run and cat each needed a query
+        assert data_source.get_table_rowcount() == 4
+
+        # everything that was found or missing is cached now
+        asyncio.run(prefetch_words(data_source, words[:3]))
+        assert sorted(data_source.queries) == ['Dog', 'cat', 'dog', 'run']
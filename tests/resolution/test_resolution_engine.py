@@ -0,0 +1,82 @@
+import asyncio
+from typing import Iterable, Tuple
+
+from cardbuilder.common.fieldnames import Fieldname
+from cardbuilder.common.languages import ENGLISH
+from cardbuilder.exceptions import WordLookupException
+from cardbuilder.input.word import Word, WordForm
+from cardbuilder.lookup.data_source import ExternalDataDataSource
+from cardbuilder.lookup.lookup_data import outputs, LookupData
+from cardbuilder.lookup.value import SingleValue
+from cardbuilder.resolution.field import Field
+from cardbuilder.resolution.resolution_engine import ResolutionEngine
+
+
+@outputs({
+    Fieldname.DEFINITIONS: SingleValue
+})
+class DummyDictionary(ExternalDataDataSource):
+    entries = {
+        'dog': 'a cute pupper',
+        'Run': 'to move quickly',
+        'run': 'an act of running'
+    }
+
+    def _fetch_remote_files_if_necessary(self):
+        pass
+
+    def _read_and_convert_data(self) -> Iterable[Tuple[str, str]]:
+        return self.entries.items()
+
+    def parse_word_content(self, word: Word, form: str, content: str, following_link: bool = False) -> LookupData:
+        return self.lookup_data_type(word, form, content, {
+            Fieldname.DEFINITIONS: SingleValue(content)
+        })
+
+
+class TestResolutionEngine:
+
+    def test_batch_lookup(self):
+        data_source = DummyDictionary()
+        dog = Word('dog', ENGLISH)
+        cat = Word('cat', ENGLISH)
+
+        results = data_source.lookup_words([(dog, 'dog'), (cat, 'cat')])
+        assert results[(dog, 'dog')][Fieldname.DEFINITIONS] == \
+               data_source.lookup_word(dog, 'dog')[Fieldname.DEFINITIONS]
+        assert isinstance(results[(cat, 'cat')], WordLookupException)
+
+    def test_cards(self):
+        data_source = DummyDictionary()
+        engine = ResolutionEngine([
+            Field(data_source, Fieldname.WORD, 'word'),
+            Field(data_source, Fieldname.DEFINITIONS, 'definition', required=True)
+        ])
+
+        words = [Word(input_form, ENGLISH, [WordForm.PHONETICALLY_EQUIVALENT]) for input_form in
+                 ['Dog', 'Run', 'cat']]
+        cards = list(engine.cards(words))
+
+        assert len(cards) == 2
+        # Dog is only found by its lowercase form, while Run is found as is before its lowercase form is tried
+        assert [field.value for field in cards[0].fields] == ['Dog', 'a cute pupper']
+        assert [field.value for field in cards[1].fields] == ['Run', 'to move quickly']
+
+        assert len(engine.failed_resolutions) == 1
+        assert engine.failed_resolutions[0][0] is words[2]
+
+    def test_async_cards(self):
+        data_source = DummyDictionary()
+        engine = ResolutionEngine([
+            Field(data_source, Fieldname.WORD, 'word'),
+            Field(data_source, Fieldname.DEFINITIONS, 'definition', required=True)
+        ])
+        words = [Word(input_form, ENGLISH, [WordForm.PHONETICALLY_EQUIVALENT]) for input_form in ['Dog', 'cat']]
+
+        async def collect_cards():
+            return [card async for card in engine.acards(words)]
+
+        cards = asyncio.run(collect_cards())
+        assert len(cards) == 1
+        assert [field.value for field in cards[0].fields] == ['Dog', 'a cute pupper']
+        assert len(engine.failed_resolutions) == 1